@@ -0,0 +1,147 @@
+import numpy as np
+
+# Rolling windows, in days
+WINDOWS = (7, 30, 90)
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def day_series(day_totals, end=None):
+    """Dense daily totals from {YYYY-MM-DD: total}: (first day, totals up to end)
+
+    Days without expenses are zeros. end defaults to the last day with
+    expenses; a first day of None means there is nothing up to end.
+    """
+    if not day_totals:
+        return None, np.zeros(0)
+    days = np.array(list(day_totals), dtype='datetime64[D]')
+    totals = np.fromiter(day_totals.values(), dtype=np.float64, count=len(days))
+    first = days.min()
+    last = days.max() if end is None else np.datetime64(end, 'D')
+    if last < first:
+        return None, np.zeros(0)
+    keep = days <= last
+    dense = np.zeros(int((last - first).astype(np.int64)) + 1)
+    dense[(days[keep] - first).astype(np.int64)] = totals[keep]
+    return first, dense
+
+
+def rolling_sums(dense, windows=WINDOWS):
+    """{window: array} of trailing sums, window days ending on each day"""
+    running = np.concatenate(([0.0], np.cumsum(dense)))
+    ends = np.arange(1, len(dense) + 1)
+    return {window: running[ends] - running[np.maximum(ends - window, 0)] for window in windows}
+
+
+def weekday_profile(first, dense):
+    """Total, day count, average and seasonality index per weekday, Monday first
+
+    The index is a weekday's average spend over the average day's, so 1.2
+    means that weekday runs 20% above a typical day.
+    """
+    if first is None:
+        weekdays = np.zeros(0, dtype=np.int64)
+    else:
+        # 1970-01-01, day 0 of datetime64, was a Thursday (weekday 3)
+        weekdays = (np.arange(len(dense)) + first.astype(np.int64) + 3) % 7
+    totals = np.bincount(weekdays, weights=dense, minlength=7)
+    days = np.bincount(weekdays, minlength=7)
+    average = np.divide(totals, days, out=np.zeros(7), where=days > 0)
+    overall = dense.mean() if len(dense) else 0.0
+    index = average / overall if overall else np.zeros(7)
+    return {
+        'weekday': list(WEEKDAYS),
+        'total': totals.tolist(),
+        'days': days.tolist(),
+        'average': average.tolist(),
+        'index': index.tolist(),
+    }
+
+
+def month_matrix(month_categories, end_month, months):
+    """Totals per category (rows) for `months` months up to end_month plus the year before
+
+    Returns (month labels, categories, matrix); the extra 12 leading
+    columns give every shown month a previous month and a previous year.
+    """
+    labels = np.arange(np.datetime64(end_month, 'M') - (months + 12) + 1,
+                       np.datetime64(end_month, 'M') + 1).astype(str)
+    categories = sorted({category for month in labels for category in month_categories.get(month, ())})
+    rows = {category: row for row, category in enumerate(categories)}
+    matrix = np.zeros((len(categories), len(labels)))
+    for column, month in enumerate(labels):
+        for category, total in month_categories.get(month, {}).items():
+            matrix[rows[category], column] = total
+    return labels, categories, matrix
+
+
+def _deltas(values, lag):
+    """Change against `lag` columns earlier and its ratio (NaN where the base is 0)"""
+    current, previous = values[..., 12:], values[..., 12 - lag:values.shape[-1] - lag]
+    delta = current - previous
+    ratio = np.divide(delta, previous, out=np.full(delta.shape, np.nan), where=previous > 0)
+    return delta, ratio
+
+
+def _plain(values):
+    """Array to list, with NaN as None so it encodes as JSON null"""
+    return [None if value != value else value for value in values.tolist()]
+
+
+def trends(day_totals, month_categories, months=12, end=None, days=365, category=None):
+    """Rolling sums, month-over-month and year-over-year deltas, weekday seasonality
+
+    day_totals maps YYYY-MM-DD to that day's total and month_categories
+    maps YYYY-MM to {category: total} (both straight from the rollups), so
+    the work is a few array operations over days and months, never over
+    individual expenses. With a category, month_categories is narrowed to
+    it; day_totals should already be. Everything comes back as plain lists
+    keyed by column, ready for JSON or a DataFrame.
+    """
+    first, dense = day_series(day_totals, end)
+    if end is None:
+        end = str(first + len(dense) - 1) if first is not None else np.datetime64('today', 'D').astype(str)
+    if category is not None:
+        month_categories = {month: {category: totals[category]}
+                            for month, totals in month_categories.items() if category in totals}
+
+    sums = rolling_sums(dense)
+    shown = slice(max(0, len(dense) - days), len(dense))
+    dates = (first + np.arange(shown.start, shown.stop)).astype(str).tolist() if first is not None else []
+    rolling = {'date': dates, 'total': dense[shown].tolist()}
+    rolling.update((f"sum_{window}d", sums[window][shown].tolist()) for window in WINDOWS)
+    latest = {f"sum_{window}d": float(sums[window][-1]) if len(dense) else 0.0 for window in WINDOWS}
+
+    labels, categories, matrix = month_matrix(month_categories, end[:7], months)
+    monthly = matrix.sum(axis=0)
+    mom_delta, mom_pct = _deltas(monthly, 1)
+    yoy_delta, yoy_pct = _deltas(monthly, 12)
+    by_month = {
+        'month': labels[12:].tolist(),
+        'total': monthly[12:].tolist(),
+        'mom_delta': mom_delta.tolist(),
+        'mom_pct': _plain(mom_pct),
+        'yoy_delta': yoy_delta.tolist(),
+        'yoy_pct': _plain(yoy_pct),
+    }
+    cat_mom_delta, cat_mom_pct = _deltas(matrix, 1)
+    cat_yoy_delta, cat_yoy_pct = _deltas(matrix, 12)
+    by_category = {
+        name: {
+            'total': matrix[row, 12:].tolist(),
+            'mom_delta': cat_mom_delta[row].tolist(),
+            'mom_pct': _plain(cat_mom_pct[row]),
+            'yoy_delta': cat_yoy_delta[row].tolist(),
+            'yoy_pct': _plain(cat_yoy_pct[row]),
+        }
+        for row, name in enumerate(categories)
+    }
+    return {
+        'start': str(first) if first is not None else None,
+        'end': end,
+        'category': category,
+        'latest': latest,
+        'rolling': rolling,
+        'months': by_month,
+        'categories': by_category,
+        'weekdays': weekday_profile(first, dense),
+    }
@@ -1,9 +1,14 @@
 import streamlit as st
-import json
+import atexit
 import pandas as pd
-from datetime import datetime, timedelta
-import csv
+from datetime import datetime
 import os
+import tempfile
+from expense_metrics import metrics
+from expense_storage import open_storage, storage_config
+from expense_budgets import alert_message
+from expense_tracker import ExpenseTracker
+from expense_writer import BackgroundWriter
 
 # Page configuration
 st.set_page_config(
@@ -13,34 +18,159 @@ st.set_page_config(
 )
 
 # Initialize session state
-if 'expenses' not in st.session_state:
-    st.session_state.expenses = []
 if 'categories' not in st.session_state:
     st.session_state.categories = [
         'Food', 'Transportation', 'Entertainment', 'Utilities',
         'Healthcare', 'Shopping', 'Education', 'Other'
     ]
 
+@st.cache_resource
+def get_tracker(data_file, backend):
+    """Open one tracker per data file, shared by every session and rerun"""
+    return ExpenseTracker(storage=open_storage(data_file, backend))
+
+@st.cache_resource
+def get_writer(data_file, backend):
+    """One background writer per tracker; whatever is still queued is written on shutdown"""
+    writer = BackgroundWriter(get_tracker(data_file, backend).record_expenses)
+    atexit.register(writer.close)
+    return writer
+
 def load_data():
-    """Load expenses from JSON file"""
+    """Return the shared tracker, reloading it only if the data changed on disk"""
     try:
-        if os.path.exists('expenses.json'):
-            with open('expenses.json', 'r') as file:
-                st.session_state.expenses = json.load(file)
+        tracker = get_tracker(*storage_config())
+        tracker.refresh()
+        return tracker
     except Exception as e:
         st.error(f"Error loading data: {e}")
-        st.session_state.expenses = []
+        st.stop()
+
+def data_key():
+    """Cache key for derived data: which dataset, and which version of it"""
+    return (*storage_config(), tracker.version)
+
+@st.cache_data(max_entries=64)
+def cached_summary(_tracker, key, **filters):
+    metrics.count('app.cache_miss.summary')
+    return _tracker.summarize(**filters)
+
+@st.cache_data(max_entries=8)
+def cached_statistics(_tracker, key):
+    return _tracker.statistics()
+
+@st.cache_data(max_entries=16)
+def cached_trends(_tracker, key, months, category):
+    return _tracker.trends(months, category)
+
+@st.cache_data(max_entries=64)
+def cached_query_summary(_query, key):
+    metrics.count('app.cache_miss.query')
+    return _query.summary()
+
+PAGE_SIZES = [25, 50, 100]
+SORT_ORDERS = {
+    "Default": None,
+    "Newest first": '-date',
+    "Oldest first": 'date',
+    "Highest amount": '-amount',
+    "Lowest amount": 'amount',
+}
+
+def show_page(view, fetch_page, total_count, reset_on=None, columns=('date', 'amount', 'category', 'description')):
+    """Render one page of expenses as a table with Previous/Next buttons
+    
+    fetch_page(cursor, page_size) returns (expenses, next_cursor). Only the
+    current page is fetched and sent to the browser. The cursor history is
+    kept in session state and cleared whenever reset_on changes.
+    """
+    state = st.session_state.setdefault(f"page_{view}", {'reset_on': None, 'cursors': [None]})
+    if state['reset_on'] != reset_on:
+        state['reset_on'] = reset_on
+        state['cursors'] = [None]
+    cursors = state['cursors']
+    
+    page_size = st.selectbox("Rows per page", PAGE_SIZES, key=f"page_size_{view}")
+    expenses, next_cursor = fetch_page(cursors[-1], page_size)
+    
+    if expenses:
+        page_df = pd.DataFrame(expenses)
+        page_df['amount'] = page_df['amount'].map(lambda x: f"₹{x:.2f}")
+        st.dataframe(page_df[list(columns)], use_container_width=True, hide_index=True)
+    
+    pages = max(1, -(-total_count // page_size))
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        st.button("⬅️ Previous", key=f"prev_{view}", disabled=len(cursors) == 1,
+                  on_click=cursors.pop)
+    with col2:
+        st.caption(f"Page {len(cursors)} of {pages} · {total_count} expenses")
+    with col3:
+        st.button("Next ➡️", key=f"next_{view}", disabled=next_cursor is None,
+                  on_click=cursors.append, args=(next_cursor,))
+
+def query_summary(query):
+    """Summary of a query's results, cached per query and data version"""
+    return cached_query_summary(query, (data_key(), query.key()))
+
+def show_query_page(view, query):
+    """Paginate a query's expenses"""
+    show_page(view, query.page, query_summary(query)['count'], reset_on=(query.key(), data_key()))
 
-def save_data():
-    """Save expenses to JSON file"""
+def save_data(expense):
+    """Queue a new expense for the background writer; returns False if it could not be queued"""
     try:
-        with open('expenses.json', 'w') as file:
-            json.dump(st.session_state.expenses, file, indent=2)
+        ticket = get_writer(*storage_config()).submit(expense)
     except Exception as e:
         st.error(f"Error saving data: {e}")
+        return False
+    st.session_state.setdefault('save_tickets', []).append(ticket)
+    return True
+
+def save_status():
+    """Move this session's finished saves into the notice shown next; returns how many are pending"""
+    writer = get_writer(*storage_config())
+    tickets = st.session_state.get('save_tickets', [])
+    statuses = [writer.status(ticket) for ticket in tickets]
+    notice = st.session_state.setdefault('save_notice', {'saved': 0, 'errors': [], 'alerts': []})
+    for ticket, status in zip(tickets, statuses):
+        if status == 'saved':
+            notice['saved'] += 1
+            notice['alerts'].extend(writer.notices(ticket))
+        elif status != 'pending':
+            notice['errors'].append(str(status))
+    st.session_state.save_tickets = [ticket for ticket, status in zip(tickets, statuses) if status == 'pending']
+    return len(st.session_state.save_tickets)
+
+@st.fragment(run_every=1)
+def show_pending_saves():
+    """Pending indicator, refreshed every second until this session's saves are written"""
+    pending = save_status()
+    if pending:
+        st.info(f"⏳ Saving {pending} expense(s)...")
+    else:
+        # Rerun the whole page so it includes the saved expenses
+        st.rerun()
+
+EXPORT_FORMATS = {
+    "CSV": ('csv', "text/csv"),
+    "JSON lines": ('jsonl', "application/x-ndjson"),
+    "Parquet": ('parquet', "application/vnd.apache.parquet"),
+}
+
+def export_file(export_format, filters):
+    """Stream matching expenses into a temporary file and return its contents"""
+    fd, path = tempfile.mkstemp(suffix=f".{export_format}")
+    os.close(fd)
+    try:
+        tracker.export_expenses(path, format=export_format, **filters)
+        with open(path, 'rb') as file:
+            return file.read()
+    finally:
+        os.remove(path)
 
 # Load data when app starts
-load_data()
+tracker = load_data()
 
 # Main app
 st.title("💰 Daily Expense Tracker")
@@ -49,31 +179,29 @@ st.markdown("---")
 # Sidebar for navigation
 menu = st.sidebar.selectbox(
     "Navigation",
-    ["🏠 Dashboard", "➕ Add Expense", "📊 View Expenses", "📈 Monthly Reports", "🔍 Search", "⚙️ Statistics"]
+    ["🏠 Dashboard", "➕ Add Expense", "📊 View Expenses", "📈 Monthly Reports", "📉 Trends", "🔍 Search", "⚙️ Statistics"]
 )
+render_started = metrics.clock()
 
 # Dashboard
 if menu == "🏠 Dashboard":
     col1, col2, col3 = st.columns(3)
     
+    summary = cached_summary(tracker, data_key())
+    
     with col1:
-        total_expenses = sum(exp['amount'] for exp in st.session_state.expenses)
-        st.metric("Total Expenses", f"₹{total_expenses:,.2f}")
+        st.metric("Total Expenses", f"₹{summary['total']:,.2f}")
     
     with col2:
-        st.metric("Total Records", len(st.session_state.expenses))
+        st.metric("Total Records", summary['count'])
     
     with col3:
-        if st.session_state.expenses:
-            avg_expense = total_expenses / len(st.session_state.expenses)
-            st.metric("Average Expense", f"₹{avg_expense:.2f}")
-        else:
-            st.metric("Average Expense", "₹0.00")
+        st.metric("Average Expense", f"₹{summary['average']:.2f}")
     
     # Recent expenses
     st.subheader("Recent Expenses")
-    if st.session_state.expenses:
-        recent_expenses = st.session_state.expenses[-5:][::-1]  # Last 5 expenses
+    if summary['count']:
+        recent_expenses = tracker.expenses[-5:][::-1]  # Last 5 expenses
         for exp in recent_expenses:
             with st.container():
                 col1, col2, col3 = st.columns([2,1,1])
@@ -87,6 +215,43 @@ if menu == "🏠 Dashboard":
                 st.divider()
     else:
         st.info("No expenses recorded yet. Add your first expense!")
+    
+    # Budgets: month-to-date totals straight from the rollups
+    this_month = datetime.now().strftime("%Y-%m")
+    st.subheader(f"Budgets for {datetime.now():%B %Y}")
+    budgets = tracker.budget_status(this_month)
+    if budgets:
+        for status in budgets:
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                icon = {'warning': "⚠️ ", 'exceeded': "❌ "}.get(status['level'], "")
+                st.progress(min(status['ratio'], 1.0),
+                            text=f"{icon}**{status['category']}**: ₹{status['spent']:,.2f} of ₹{status['limit']:,.2f}")
+            with col2:
+                if status['remaining'] >= 0:
+                    st.write(f"₹{status['remaining']:,.2f} left")
+                else:
+                    st.write(f"₹{-status['remaining']:,.2f} over")
+    else:
+        st.info("No budgets set yet")
+    
+    with st.expander("Set a budget"):
+        with st.form("budget_form"):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                budget_category = st.selectbox("Category", st.session_state.categories)
+            with col2:
+                budget_amount = st.number_input("Monthly limit (₹, 0 removes it)", min_value=0.0, step=100.0)
+            with col3:
+                budget_scope = st.radio("Applies to", ["Every month", "This month only"])
+            if st.form_submit_button("Save Budget"):
+                try:
+                    tracker.set_budget(budget_category, budget_amount or None,
+                                       this_month if budget_scope == "This month only" else None)
+                except Exception as e:
+                    st.error(f"Error saving budget: {e}")
+                else:
+                    st.rerun()
 
 # Add Expense
 elif menu == "➕ Add Expense":
@@ -108,15 +273,15 @@ elif menu == "➕ Add Expense":
         if submitted:
             if amount > 0 and description.strip():
                 expense = {
-                    'id': len(st.session_state.expenses) + 1,
+                    'id': None,
                     'date': date.strftime("%Y-%m-%d"),
                     'amount': amount,
                     'category': category,
                     'description': description
                 }
-                st.session_state.expenses.append(expense)
-                save_data()
-                st.success("✅ Expense added successfully!")
+                # Budget alerts are raised as the writer commits it and shown with the save notice
+                if save_data(expense):
+                    st.success("✅ Expense added! Saving in the background...")
             else:
                 st.error("Please enter valid amount and description")
 
@@ -124,25 +289,37 @@ elif menu == "➕ Add Expense":
 elif menu == "📊 View Expenses":
     st.subheader("View Expenses")
     
-    if st.session_state.expenses:
-        # Convert to DataFrame for better display
-        df = pd.DataFrame(st.session_state.expenses)
-        df['amount'] = df['amount'].apply(lambda x: f"₹{x:.2f}")
-        
-        st.dataframe(
-            df[['date', 'amount', 'category', 'description']],
-            use_container_width=True,
-            hide_index=True
-        )
+    if tracker.expenses:
+        # Only the current page is converted and sent to the browser
+        show_query_page("view", tracker.query())
         
         # Export option
-        if st.button("📥 Export to CSV"):
-            csv_data = df.to_csv(index=False)
+        with st.expander("📥 Export"):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                format_name = st.selectbox("Format", list(EXPORT_FORMATS))
+                export_category = st.selectbox("Category", ["All"] + st.session_state.categories)
+            with col2:
+                export_start = st.date_input("From", value=None)
+                export_end = st.date_input("To", value=None)
+            with col3:
+                export_min = st.number_input("Minimum Amount", min_value=0.0, value=None)
+                export_max = st.number_input("Maximum Amount", min_value=0.0, value=None)
+            
+            filters = {
+                'category': None if export_category == "All" else export_category,
+                'start_date': export_start.strftime("%Y-%m-%d") if export_start else None,
+                'end_date': export_end.strftime("%Y-%m-%d") if export_end else None,
+                'min_amount': export_min,
+                'max_amount': export_max,
+            }
+            export_format, mime = EXPORT_FORMATS[format_name]
+            # The file is only generated when the button is clicked
             st.download_button(
-                label="Download CSV",
-                data=csv_data,
-                file_name="all_expenses.csv",
-                mime="text/csv"
+                label=f"Download {format_name}",
+                data=lambda: export_file(export_format, filters),
+                file_name=f"all_expenses.{export_format}",
+                mime=mime
             )
     else:
         st.info("No expenses to display")
@@ -151,11 +328,11 @@ elif menu == "📊 View Expenses":
 elif menu == "📈 Monthly Reports":
     st.subheader("Monthly Expense Report")
     
-    if st.session_state.expenses:
+    if tracker.expenses:
         # Year-month selection
         col1, col2 = st.columns(2)
         with col1:
-            years = sorted(set(exp['date'][:4] for exp in st.session_state.expenses), reverse=True)
+            years = tracker.expense_years()
             selected_year = st.selectbox("Select Year", years)
         
         with col2:
@@ -164,30 +341,26 @@ elif menu == "📈 Monthly Reports":
                           "July", "August", "September", "October", "November", "December"]
             selected_month = st.selectbox("Select Month", months, format_func=lambda x: month_names[x-1])
         
-        # Filter expenses for selected month
-        monthly_expenses = [
-            exp for exp in st.session_state.expenses 
-            if exp['date'].startswith(f"{selected_year}-{selected_month:02d}")
-        ]
+        # Summarize expenses for selected month
+        summary = cached_summary(tracker, data_key(), month=f"{selected_year}-{selected_month:02d}")
         
-        if monthly_expenses:
-            total_amount = sum(exp['amount'] for exp in monthly_expenses)
+        if summary['count']:
+            total_amount = summary['total']
+            daily_data = summary['daily_totals']
             
             # Display metrics
             col1, col2, col3 = st.columns(3)
             with col1:
                 st.metric("Total Spent", f"₹{total_amount:,.2f}")
             with col2:
-                st.metric("Transactions", len(monthly_expenses))
+                st.metric("Transactions", summary['count'])
             with col3:
-                avg_daily = total_amount / len(set(exp['date'] for exp in monthly_expenses))
+                avg_daily = total_amount / len(daily_data)
                 st.metric("Avg Daily", f"₹{avg_daily:.2f}")
             
             # Category breakdown
             st.subheader("Category Breakdown")
-            category_totals = {}
-            for exp in monthly_expenses:
-                category_totals[exp['category']] = category_totals.get(exp['category'], 0) + exp['amount']
+            category_totals = summary['category_totals']
             
             # Display as columns
             cols = st.columns(len(category_totals))
@@ -198,10 +371,6 @@ elif menu == "📈 Monthly Reports":
             
             # Daily trend chart
             st.subheader("Daily Spending Trend")
-            daily_data = {}
-            for exp in monthly_expenses:
-                daily_data[exp['date']] = daily_data.get(exp['date'], 0) + exp['amount']
-            
             chart_df = pd.DataFrame(list(daily_data.items()), columns=['Date', 'Amount'])
             chart_df = chart_df.sort_values('Date')
             st.line_chart(chart_df.set_index('Date'))
@@ -211,64 +380,97 @@ elif menu == "📈 Monthly Reports":
     else:
         st.info("No expenses recorded yet")
 
+# Trends across months, from the rollups in one pass
+elif menu == "📉 Trends":
+    st.subheader("Spending Trends")
+    
+    if tracker.expenses:
+        col1, col2 = st.columns(2)
+        with col1:
+            months = st.slider("Months", 3, 36, 12)
+        with col2:
+            category = st.selectbox("Category", ["All"] + st.session_state.categories)
+        trends = cached_trends(tracker, data_key(), months, None if category == "All" else category)
+        
+        # Trailing sums, with the change against the window before
+        rolling = trends['rolling']
+        cols = st.columns(3)
+        for col, window in zip(cols, (7, 30, 90)):
+            sums = rolling[f"sum_{window}d"]
+            previous = sums[-1 - window] if len(sums) > window else None
+            col.metric(f"Last {window} days", f"₹{sums[-1]:,.2f}" if sums else "₹0.00",
+                       f"₹{sums[-1] - previous:,.2f}" if previous is not None else None,
+                       delta_color="inverse")
+        st.caption(f"Up to {trends['end']}")
+        
+        st.subheader("Rolling Sums")
+        st.line_chart(pd.DataFrame({
+            '7 days': rolling['sum_7d'],
+            '30 days': rolling['sum_30d'],
+            '90 days': rolling['sum_90d'],
+        }, index=pd.to_datetime(rolling['date'])))
+        
+        st.subheader("Month over Month")
+        by_month = trends['months']
+        st.bar_chart(pd.DataFrame({'Total': by_month['total']}, index=by_month['month']))
+        percent = lambda ratio: f"{ratio * 100:+.1f}%" if ratio is not None else "-"
+        st.dataframe(pd.DataFrame({
+            'Month': by_month['month'],
+            'Total': [f"₹{total:,.2f}" for total in by_month['total']],
+            'vs prev month': [percent(ratio) for ratio in by_month['mom_pct']],
+            'vs prev year': [percent(ratio) for ratio in by_month['yoy_pct']],
+        })[::-1], use_container_width=True, hide_index=True)
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.subheader(f"Categories in {by_month['month'][-1]}")
+            categories = trends['categories']
+            st.dataframe(pd.DataFrame({
+                'Category': list(categories),
+                'Total': [values['total'][-1] for values in categories.values()],
+                'vs prev month': [percent(values['mom_pct'][-1]) for values in categories.values()],
+                'vs prev year': [percent(values['yoy_pct'][-1]) for values in categories.values()],
+            }).sort_values('Total', ascending=False), use_container_width=True, hide_index=True)
+        with col2:
+            st.subheader("Weekday Seasonality")
+            weekdays = trends['weekdays']
+            st.bar_chart(pd.DataFrame({'Index': weekdays['index']}, index=weekdays['weekday']))
+            st.caption("1.00 is an average day")
+    else:
+        st.info("No expenses recorded yet")
+
 # Search Expenses
 elif menu == "🔍 Search":
     st.subheader("Search Expenses")
     
-    if st.session_state.expenses:
-        search_type = st.radio("Search by:", ["Description", "Category", "Date Range", "Amount Range"])
-        
-        if search_type == "Description":
-            search_term = st.text_input("Enter search term")
-            if search_term:
-                results = [exp for exp in st.session_state.expenses 
-                          if search_term.lower() in exp['description'].lower()]
-                if results:
-                    st.write(f"Found {len(results)} matching expenses:")
-                    for exp in results:
-                        st.write(f"**{exp['date']}** - ₹{exp['amount']:.2f} - {exp['category']} - {exp['description']}")
-                else:
-                    st.info("No matching expenses found")
-        
-        elif search_type == "Category":
-            selected_category = st.selectbox("Select Category", st.session_state.categories)
-            results = [exp for exp in st.session_state.expenses if exp['category'] == selected_category]
-            if results:
-                total = sum(exp['amount'] for exp in results)
-                st.write(f"**{selected_category}**: {len(results)} expenses, Total: ₹{total:.2f}")
-                for exp in results:
-                    st.write(f"**{exp['date']}** - ₹{exp['amount']:.2f} - {exp['description']}")
+    if tracker.expenses:
+        # Every filter is optional and they all combine
+        search_term = st.text_input("Description contains")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            selected_category = st.selectbox("Category", ["All"] + st.session_state.categories)
+            sort_name = st.selectbox("Sort by", list(SORT_ORDERS))
+        with col2:
+            start_date = st.date_input("From", value=None, key="search_start")
+            end_date = st.date_input("To", value=None, key="search_end")
+        with col3:
+            min_amount = st.number_input("Minimum Amount", min_value=0.0, value=None, key="search_min")
+            max_amount = st.number_input("Maximum Amount", min_value=0.0, value=None, key="search_max")
         
-        elif search_type == "Date Range":
-            col1, col2 = st.columns(2)
-            with col1:
-                start_date = st.date_input("Start Date")
-            with col2:
-                end_date = st.date_input("End Date")
-            
-            if start_date and end_date:
-                results = [exp for exp in st.session_state.expenses 
-                          if start_date.strftime("%Y-%m-%d") <= exp['date'] <= end_date.strftime("%Y-%m-%d")]
-                if results:
-                    total = sum(exp['amount'] for exp in results)
-                    st.write(f"Found {len(results)} expenses, Total: ₹{total:.2f}")
-                    for exp in results:
-                        st.write(f"**{exp['date']}** - ₹{exp['amount']:.2f} - {exp['category']} - {exp['description']}")
+        query = (tracker.query()
+                 .text(search_term)
+                 .category(None if selected_category == "All" else selected_category)
+                 .between(start_date, end_date)
+                 .amount(min=min_amount, max=max_amount))
+        if SORT_ORDERS[sort_name]:
+            query = query.order_by(SORT_ORDERS[sort_name])
         
-        elif search_type == "Amount Range":
-            col1, col2 = st.columns(2)
-            with col1:
-                min_amount = st.number_input("Minimum Amount", min_value=0.0, value=0.0)
-            with col2:
-                max_amount = st.number_input("Maximum Amount", min_value=0.0, value=1000.0)
-            
-            results = [exp for exp in st.session_state.expenses 
-                      if min_amount <= exp['amount'] <= max_amount]
-            if results:
-                total = sum(exp['amount'] for exp in results)
-                st.write(f"Found {len(results)} expenses, Total: ₹{total:.2f}")
-                for exp in results:
-                    st.write(f"**{exp['date']}** - ₹{exp['amount']:.2f} - {exp['category']} - {exp['description']}")
+        summary = query_summary(query)
+        if summary['count']:
+            st.write(f"Found {summary['count']} expenses, Total: ₹{summary['total']:.2f}")
+            show_query_page("search", query)
+        else:
+            st.info("No matching expenses found")
     else:
         st.info("No expenses to search")
 
@@ -276,17 +478,16 @@ elif menu == "🔍 Search":
 elif menu == "⚙️ Statistics":
     st.subheader("Expense Statistics")
     
-    if st.session_state.expenses:
-        total_amount = sum(exp['amount'] for exp in st.session_state.expenses)
-        avg_amount = total_amount / len(st.session_state.expenses)
+    summary = cached_summary(tracker, data_key())
+    if summary['count']:
+        total_amount = summary['total']
+        avg_amount = summary['average']
         
         # Most expensive
-        most_expensive = max(st.session_state.expenses, key=lambda x: x['amount'])
+        most_expensive = summary['max_expense']
         
         # Category statistics
-        category_stats = {}
-        for exp in st.session_state.expenses:
-            category_stats[exp['category']] = category_stats.get(exp['category'], 0) + exp['amount']
+        category_stats = summary['category_totals']
         
         # Display stats
         col1, col2 = st.columns(2)
@@ -294,7 +495,7 @@ elif menu == "⚙️ Statistics":
         with col1:
             st.metric("Total Spending", f"₹{total_amount:,.2f}")
             st.metric("Average per Expense", f"₹{avg_amount:.2f}")
-            st.metric("Total Records", len(st.session_state.expenses))
+            st.metric("Total Records", summary['count'])
         
         with col2:
             st.metric("Most Expensive", f"₹{most_expensive['amount']:.2f}")
@@ -306,10 +507,53 @@ elif menu == "⚙️ Statistics":
         if category_stats:
             chart_data = pd.DataFrame(list(category_stats.items()), columns=['Category', 'Amount'])
             st.bar_chart(chart_data.set_index('Category'))
+        
+        # Streaming sketches: constant time at any data size
+        stats = cached_statistics(tracker, data_key())
+        st.subheader("Amount Percentiles")
+        cols = st.columns(len(stats['percentiles']))
+        for col, (q, value) in zip(cols, stats['percentiles'].items()):
+            col.metric(f"p{q * 100:g}", f"₹{value:,.2f}")
+        st.caption(f"Approximate: each percentile's rank is within ±{stats['rank_error'] * 100:.1f}%")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.subheader("Most Frequent Descriptions")
+            st.dataframe(pd.DataFrame(stats['top_descriptions'], columns=['description', 'count']),
+                         use_container_width=True, hide_index=True)
+            st.caption(f"Counts are at most {stats['description_count_error']:.0f} too high")
+        with col2:
+            st.subheader("Per Category")
+            st.dataframe(pd.DataFrame({
+                'Category': list(stats['distinct_descriptions']),
+                'Distinct descriptions': list(stats['distinct_descriptions'].values()),
+                'Median amount': [f"₹{stats['category_medians'][category]:.2f}"
+                                  for category in stats['distinct_descriptions']],
+            }), use_container_width=True, hide_index=True)
+            st.caption(f"Distinct counts within about ±{stats['distinct_error'] * 100:.1f}%")
+        
+        st.subheader("Top Spending Days")
+        st.dataframe(pd.DataFrame(stats['top_days'], columns=['Date', 'Amount']),
+                     use_container_width=True, hide_index=True)
     
     else:
         st.info("No expenses recorded yet")
 
+# Save status, after any expense this run has queued
+with st.sidebar:
+    if save_status():
+        show_pending_saves()
+    notice = st.session_state.pop('save_notice', None)
+    if notice and notice['saved']:
+        st.success(f"✅ {notice['saved']} expense(s) saved")
+    for error in notice['errors'] if notice else ():
+        st.error(f"Error saving data: {error}")
+    for alert in notice['alerts'] if notice else ():
+        show_alert = st.error if alert['level'] == 'exceeded' else st.warning
+        show_alert(f"⚠️ {alert_message(alert)}")
+
 # Footer
 st.sidebar.markdown("---")
-st.sidebar.info("💡 **Tip**: Your data is automatically saved to 'expenses.json' file")
\ No newline at end of file
+st.sidebar.info("💡 **Tip**: Your data is automatically saved to 'expenses.json' file")
+
+metrics.stop("app.page." + menu.split(" ", 1)[1].lower().replace(" ", "_"), render_started)
\ No newline at end of file
@@ -0,0 +1,905 @@
+"""Benchmarks for the expense tracker
+
+Generates deterministic synthetic datasets (10^3 to 10^7 records), times
+the tracker operations and the computations behind each Streamlit page,
+records peak memory and writes the results as JSON:
+
+    python expense_bench.py --sizes 1e3,1e5,1e6 --backends journal,sqlite
+    python expense_bench.py --sizes 1e5 --baseline bench_results.json
+    python expense_bench.py --writers 1,2,4,8 --writes 500
+    python expense_bench.py --group-commit 1,10,100,1000 --durability fsync
+
+With --baseline, cases that got slower than --threshold times the
+baseline are listed and the exit status is 1. With --writers, several
+processes add expenses to one shared dataset at once; afterwards every
+record is checked for, and any lost or duplicated record fails the run.
+With --group-commit, expenses are added through tracker.buffered() with
+each group size to measure commit throughput, and a buffered writer is
+killed mid-stream to measure how many acknowledged expenses a crash loses.
+Component cases time the building blocks against their alternatives on
+the same records (e.g. --only store for full scans against the date
+index); --no-components skips them.
+"""
+import builtins
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import date as Date, datetime
+
+import numpy as np
+
+import expense_codec
+from expense_storage import JournalStorage, SqliteStorage, open_storage
+from expense_tracker import ExpenseTracker
+
+# Share of expenses, typical amount (median, in rupees) and descriptions per category
+CATEGORY_PROFILES = {
+    'Food': (0.34, 250, ["Swiggy order", "Zomato dinner", "Groceries at BigBasket", "Coffee",
+                         "Lunch with colleagues", "Milk and bread", "Fruit market", "Bakery"]),
+    'Transportation': (0.16, 150, ["Uber ride", "Ola auto", "Metro card recharge", "Petrol",
+                                   "Parking fee", "Train ticket", "Bus pass"]),
+    'Shopping': (0.12, 1200, ["Amazon order", "Flipkart order", "Clothes at Zara",
+                              "Shoes", "Household items", "Electronics accessory"]),
+    'Entertainment': (0.10, 600, ["Movie tickets", "Netflix subscription", "Concert",
+                                  "Spotify premium", "Bowling with friends"]),
+    'Utilities': (0.08, 1500, ["Electricity bill", "Water bill", "Mobile recharge",
+                               "Broadband bill", "Gas cylinder"]),
+    'Healthcare': (0.06, 800, ["Pharmacy", "Doctor consultation", "Lab tests",
+                               "Dental checkup", "Gym membership"]),
+    'Education': (0.04, 2000, ["Online course", "Books", "Exam fee", "Stationery"]),
+    'Other': (0.10, 400, ["Gift", "Donation", "Haircut", "Laundry", "Miscellaneous"]),
+}
+
+GENERATOR_CHUNK = 100000
+
+
+def synthetic_expenses(n, seed=42, start='2020-01-01', days=5 * 365):
+    """Yield n realistic expense records, identical for the same arguments
+
+    Records arrive in roughly chronological order with increasing ids,
+    like a real history; about 5% are back-dated by up to a month.
+    Amounts are log-normal around a per-category median.
+    """
+    categories = list(CATEGORY_PROFILES)
+    weights = np.array([CATEGORY_PROFILES[c][0] for c in categories])
+    medians = np.array([CATEGORY_PROFILES[c][1] for c in categories], dtype=np.float64)
+    first_day = Date.fromisoformat(start).toordinal()
+    date_strings = {}
+    for chunk_start in range(0, n, GENERATOR_CHUNK):
+        size = min(GENERATOR_CHUNK, n - chunk_start)
+        rng = np.random.default_rng([seed, chunk_start])
+        index = np.arange(chunk_start, chunk_start + size)
+        day = first_day + index * days // max(n, 1)
+        backdated = rng.random(size) < 0.05
+        day = np.maximum(day - backdated * rng.integers(1, 31, size), first_day)
+        codes = rng.choice(len(categories), size=size, p=weights / weights.sum())
+        amounts = np.round(medians[codes] * rng.lognormal(0, 0.6, size), 2)
+        picks = rng.random(size)
+        suffixes = rng.integers(1, 1000, size)
+        for i in range(size):
+            category = categories[codes[i]]
+            names = CATEGORY_PROFILES[category][2]
+            ordinal = int(day[i])
+            date_str = date_strings.get(ordinal)
+            if date_str is None:
+                date_str = date_strings[ordinal] = Date.fromordinal(ordinal).isoformat()
+            description = names[int(picks[i] * len(names))]
+            if suffixes[i] % 4 == 0:
+                description = f"{description} #{suffixes[i]}"
+            yield {
+                'id': chunk_start + i + 1,
+                'date': date_str,
+                'amount': float(amounts[i]),
+                'category': category,
+                'description': description,
+            }
+
+
+def write_dataset(path, n, seed=42, backend='journal'):
+    """Write a synthetic dataset as a JSON snapshot or a SQLite database"""
+    tmp_path = path + '.tmp'
+    if backend == 'sqlite':
+        storage = SqliteStorage(tmp_path)
+        batch = []
+        for expense in synthetic_expenses(n, seed):
+            batch.append(expense)
+            if len(batch) == GENERATOR_CHUNK:
+                storage.append_many(batch)
+                batch = []
+        storage.append_many(batch)
+        storage.close()
+    else:
+        with open(tmp_path, 'wb') as file:
+            file.write(b'[')
+            for expense in synthetic_expenses(n, seed):
+                if expense['id'] > 1:
+                    file.write(b',')
+                file.write(expense_codec.dumps(expense, pretty=False))
+            file.write(b']')
+    os.replace(tmp_path, path)
+
+
+def dataset_path(workdir, n, seed, backend):
+    """Path of the cached master copy of a dataset, generating it if needed"""
+    suffix = 'db' if backend == 'sqlite' else 'json'
+    path = os.path.join(workdir, f"expenses-{n}-s{seed}.{suffix}")
+    if not os.path.exists(path):
+        write_dataset(path, n, seed, backend)
+    return path
+
+
+@contextlib.contextmanager
+def quiet():
+    """Discard anything printed inside the block"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+@contextlib.contextmanager
+def scripted_input(*answers):
+    """Answer input() prompts from a fixed list inside the block"""
+    replies = iter(answers)
+    real_input = builtins.input
+    builtins.input = lambda prompt='': next(replies)
+    try:
+        yield
+    finally:
+        builtins.input = real_input
+
+
+class Workspace:
+    """A scratch copy of a dataset that cases can open and modify freely
+
+    Component cases use `records` and `store`, the same synthetic dataset
+    as a list of dicts and as an ExpenseStore, built once on first use.
+    Anything else they build once goes through derived().
+    """
+
+    def __init__(self, master, backend, n=None, seed=42):
+        self.master = master
+        self.backend = backend
+        self.n = n
+        self.seed = seed
+        self.dir = tempfile.mkdtemp(prefix='expense-bench-')
+        self.data_file = os.path.join(self.dir, 'expenses.db' if backend == 'sqlite' else 'expenses.json')
+        self.tracker = None
+        # Kept outside the dataset directory so reset() does not delete them
+        self.import_path = self.dir + '-import.jsonl'
+        self.scratch_dir = self.dir + '-scratch'
+        self._derived = {}
+        write_import_file(self.import_path)
+
+    @property
+    def records(self):
+        return self.derived('records', lambda: list(synthetic_expenses(self.n, self.seed)))
+
+    @property
+    def store(self):
+        from expense_store import ExpenseStore
+        return self.derived('store', lambda: ExpenseStore(self.records))
+
+    def derived(self, key, build):
+        """build() once per workspace, the same value afterwards"""
+        if key not in self._derived:
+            self._derived[key] = build()
+        return self._derived[key]
+
+    def scratch(self, name):
+        """Path of a scratch file that survives reset()"""
+        os.makedirs(self.scratch_dir, exist_ok=True)
+        return os.path.join(self.scratch_dir, name)
+
+    def reset(self):
+        """Start over from the pristine dataset, without any sidecars"""
+        self.close()
+        for name in os.listdir(self.dir):
+            path = os.path.join(self.dir, name)
+            if os.path.isdir(path):
+                # e.g. the segments of partitioned storage
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        shutil.copyfile(self.master, self.data_file)
+
+    def prepare(self, state):
+        """Get into the state a case starts from: 'cold', 'warm' or 'loaded'"""
+        self.reset()
+        if state in ('warm', 'loaded'):
+            self.open()
+        if state == 'warm':
+            # Leaves the rollup and search sidecars behind
+            self.close()
+
+    def open(self):
+        with quiet():
+            self.tracker = ExpenseTracker(storage=open_storage(self.data_file, self.backend))
+        return self.tracker
+
+    def close(self):
+        if self.tracker is not None:
+            with quiet():
+                self.tracker.close()
+            self.tracker = None
+
+    def remove(self):
+        self.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+        os.remove(self.import_path)
+
+
+def _busiest_month(tracker):
+    return max(tracker.rollups.monthly, key=lambda month: tracker.rollups.monthly[month][0])
+
+
+def _add_expenses(tracker, count=100):
+    for i in range(count):
+        tracker.record_expense({'id': None, 'date': '2024-06-15',
+                                'amount': 99.5, 'category': 'Food', 'description': f"bench lunch {i}"})
+    return count
+
+
+def write_import_file(path, count=10000):
+    """Write count synthetic rows as JSON lines, the way a bank export would arrive"""
+    with open(path, 'w') as file:
+        for expense in synthetic_expenses(count, seed=7):
+            del expense['id']
+            file.write(json.dumps(expense) + '\n')
+
+
+def _page_frame(expenses):
+    """The table the app builds for one page of expenses"""
+    import pandas as pd
+    frame = pd.DataFrame(expenses)
+    if len(frame):
+        frame['amount'] = frame['amount'].map(lambda x: f"₹{x:.2f}")
+    return frame
+
+
+def app_dashboard(tracker):
+    summary = tracker.summarize()
+    return summary['count'], tracker.expenses[-5:]
+
+
+def app_view(tracker):
+    query = tracker.query()
+    return query.summary()['count'], _page_frame(query.page(None, 25)[0])
+
+
+def app_monthly_report(tracker):
+    import pandas as pd
+    years = tracker.expense_years()
+    summary = tracker.summarize(month=_busiest_month(tracker))
+    chart = pd.DataFrame(list(summary['daily_totals'].items()), columns=['Date', 'Amount'])
+    return years, chart.sort_values('Date').set_index('Date')
+
+
+def app_search(tracker, text=None, **filters):
+    query = tracker.query().text(text).where(**filters)
+    return query.summary()['count'], _page_frame(query.page(None, 25)[0])
+
+
+def app_statistics(tracker):
+    import pandas as pd
+    summary = tracker.summarize()
+    chart = pd.DataFrame(list(summary['category_totals'].items()), columns=['Category', 'Amount'])
+    return summary['max_expense'], chart.set_index('Category')
+
+
+def tracker_cases():
+    """Benchmark cases as (name, state, run)
+
+    Cases with state 'cold' (no sidecars yet), 'warm' (sidecars saved) or
+    'loaded' (a tracker already open) start from a pristine copy of the
+    dataset before every run and are passed the workspace; 'shared' cases
+    reuse one loaded tracker and must not modify it. run returns the
+    number of records it produced or wrote (None counts as one).
+    """
+
+    def report(tracker):
+        with quiet(), scripted_input(_busiest_month(tracker), 'n'):
+            tracker.generate_monthly_report()
+
+    def statistics_(tracker):
+        with quiet():
+            tracker.show_statistics()
+
+    def search_menu(tracker):
+        with quiet(), scripted_input('1', 'lunch', 'q'):
+            tracker.search_expenses()
+
+    def view_all(tracker):
+        with quiet(), scripted_input('q'):
+            tracker.view_all_expenses()
+
+    def export_csv(tracker):
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        try:
+            return tracker.export_expenses(path, category='Food')
+        finally:
+            os.remove(path)
+
+    def monthly_reports(tracker, executor, workers=None):
+        # Every month's report and CSV file; x4 shows the scaling with workers
+        output_dir = tempfile.mkdtemp(prefix='expense-reports-')
+        try:
+            reports = tracker.generate_reports(output_dir=output_dir, workers=workers, executor=executor)
+            return sum(report['count'] for report in reports)
+        finally:
+            shutil.rmtree(output_dir)
+
+    return [
+        ('load_data (cold)', 'cold', lambda ws: ws.open() and None),
+        ('load_data (warm)', 'warm', lambda ws: ws.open() and None),
+        ('save_data', 'loaded', lambda ws: ws.tracker.save_data()),
+        ('record_expense x100', 'loaded', lambda ws: _add_expenses(ws.tracker)),
+        ('record_expense x1000 buffered', 'loaded', lambda ws: _add_buffered(ws.tracker, 1000, 100, 50, 'fsync') or 1000),
+        ('import_file 10k rows', 'loaded', lambda ws: ws.tracker.import_file(ws.import_path).imported),
+        ('find date', 'shared', lambda t: len(t.find_expenses(date='2022-03-15'))),
+        ('find month', 'shared', lambda t: len(t.find_expenses(month=_busiest_month(t)))),
+        ('find date range', 'shared', lambda t: len(t.find_expenses(start_date='2021-01-01', end_date='2021-01-31'))),
+        ('find category', 'shared', lambda t: len(t.find_expenses(category='Education'))),
+        ('find amount range', 'shared', lambda t: len(t.find_expenses(min_amount=5000, max_amount=6000))),
+        ('find keyword', 'shared', lambda t: len(t.find_expenses(keyword='netflix'))),
+        ('search substring', 'shared', lambda t: len(t.search('uber'))),
+        ('search prefix', 'shared', lambda t: len(t.search('groc', mode='prefix'))),
+        ('search_page', 'shared', lambda t: len(t.search_page('lunch', None, 25)[0])),
+        ('iter_page', 'shared', lambda t: len(t.iter_page({'category': 'Food'}, None, 25)[0])),
+        ('summarize all', 'shared', lambda t: t.summarize() and None),
+        ('summarize month', 'shared', lambda t: t.summarize(month=_busiest_month(t)) and None),
+        ('summarize category', 'shared', lambda t: t.summarize(category='Shopping') and None),
+        ('query text+filters by month', 'shared',
+         lambda t: t.query().between('2021-01-01', '2021-12-31').category('Food').amount(min=100)
+                    .text('lunch').group_by('month').sum() and None),
+        ('generate_monthly_report', 'shared', report),
+        ('show_statistics', 'shared', statistics_),
+        ('search_expenses', 'shared', search_menu),
+        ('view_all_expenses', 'shared', view_all),
+        ('export csv (Food)', 'shared', export_csv),
+        ('reports serial', 'shared', lambda t: monthly_reports(t, 'serial')),
+        ('reports thread x4', 'shared', lambda t: monthly_reports(t, 'thread', 4)),
+        ('reports process x4', 'shared', lambda t: monthly_reports(t, 'process', 4)),
+    ]
+
+
+def app_cases():
+    """The computations each Streamlit page performs, without Streamlit"""
+    return [
+        ('app dashboard', 'shared', app_dashboard),
+        ('app view page', 'shared', app_view),
+        ('app monthly report', 'shared', app_monthly_report),
+        ('app search description', 'shared', lambda t: app_search(t, 'lunch')),
+        ('app search category', 'shared', lambda t: app_search(t, category='Food')),
+        ('app search date range', 'shared', lambda t: app_search(t, start_date='2021-01-01', end_date='2021-03-31')),
+        ('app search amount range', 'shared', lambda t: app_search(t, min_amount=0.0, max_amount=1000.0)),
+        ('app search combined', 'shared', lambda t: app_search(t, 'lunch', category='Food', start_date='2021-01-01',
+                                                               end_date='2021-12-31', min_amount=100.0)),
+        ('app statistics', 'shared', app_statistics),
+    ]
+
+
+# Date windows for the full scan against the date index
+DATE_QUERIES = [
+    ('day', {'date': '2022-03-15'}),
+    ('month', {'month': '2023-07'}),
+    ('week', {'start_date': '2021-01-01', 'end_date': '2021-01-07'}),
+    ('year Food', {'start_date': '2020-01-01', 'end_date': '2020-12-31', 'category': 'Food'}),
+]
+
+
+def component_cases():
+    """Cases for the building blocks on their own, as (name, 'data', run)
+
+    run is passed the workspace and works on its records and store, so
+    alternatives (e.g. a full scan and the date index) see the same input.
+    They only depend on the synthetic data, so they run for the first
+    backend only.
+    """
+    import expense_analytics
+    import expense_sketches
+    import expense_snapshot
+    from expense_query import filter_expenses
+    from expense_rollups import Rollups
+    from expense_store import ExpenseStore
+
+    cases = [
+        # Peak memory is the figure to compare for these two
+        ('store list of dicts', 'data', lambda ws: len([dict(expense) for expense in ws.records])),
+        ('store build ExpenseStore', 'data', lambda ws: len(ExpenseStore(ws.records))),
+    ]
+    for label, filters in DATE_QUERIES:
+        cases.append((f"store scan {label}", 'data',
+                      lambda ws, filters=filters: len(filter_expenses(ws.records, **filters))))
+        cases.append((f"store date index {label}", 'data',
+                      lambda ws, filters=filters: len(ws.store.positions(**filters))))
+
+    # Snapshot encodings: the old indented (indent=2) stdlib JSON against the codec
+    def old_dumps(ws):
+        json.dumps(ws.records, indent=2)
+        return len(ws.records)
+
+    def old_loads(ws):
+        data = ws.derived('old json', lambda: json.dumps(ws.records, indent=2).encode('utf-8'))
+        return len(json.loads(data))
+
+    def codec_dumps(ws, pretty):
+        expense_codec.dumps(ws.records, pretty=pretty)
+        return len(ws.records)
+
+    def codec_loads(ws):
+        data = ws.derived('compact json', lambda: expense_codec.dumps(ws.records, pretty=False))
+        return len(expense_codec.load_expenses(data))
+
+    cases += [
+        ('codec old json dumps', 'data', old_dumps),
+        ('codec old json loads', 'data', old_loads),
+        ('codec dumps compact', 'data', lambda ws: codec_dumps(ws, False)),
+        ('codec dumps pretty', 'data', lambda ws: codec_dumps(ws, True)),
+        ('codec load_expenses', 'data', codec_loads),
+    ]
+
+    # Cold start from the binary snapshot instead of parsing JSON
+    def snapshot_path(ws):
+        def write():
+            path = ws.scratch('expenses.json.snap')
+            expense_snapshot.write_snapshot(path, ws.store)
+            return path
+        return ws.derived('snapshot', write)
+
+    def mapped(ws):
+        return ws.derived('mapped', lambda: expense_snapshot.open_snapshot(snapshot_path(ws)))
+
+    def snapshot_write(ws):
+        expense_snapshot.write_snapshot(ws.scratch('written.snap'), ws.store)
+        return len(ws.records)
+
+    def snapshot_summarize(ws, month=None):
+        store = mapped(ws)
+        positions = store.positions(month=month) if month else None
+        store.summarize(positions)
+        return len(positions) if month else len(store)
+
+    def snapshot_decode(ws):
+        store = mapped(ws)
+        return len(store.select(range(0, len(store), max(1, len(store) // 1000))))
+
+    cases += [
+        ('snapshot write', 'data', snapshot_write),
+        ('snapshot open', 'data', lambda ws: len(expense_snapshot.open_snapshot(snapshot_path(ws)))),
+        ('snapshot summarize all', 'data', snapshot_summarize),
+        ('snapshot summarize month', 'data', lambda ws: snapshot_summarize(ws, '2022-03')),
+        ('snapshot decode 1000', 'data', snapshot_decode),
+    ]
+
+    # Streaming sketches against the exact sort and count they replace
+    def exact_statistics(store):
+        amounts = np.sort(store.amounts)
+        last = len(amounts) - 1
+        percentiles = {q: float(amounts[min(int(q * len(amounts)), last)]) for q in expense_sketches.PERCENTILES}
+        return percentiles, Counter(store.descriptions).most_common(10)
+
+    def sketches_rebuild(ws):
+        expense_sketches.Sketches().rebuild(ws.store)
+        return len(ws.records)
+
+    def sketches_add(ws):
+        sketches = expense_sketches.Sketches()
+        for expense in ws.records[:10000]:
+            sketches.add(expense)
+        return min(len(ws.records), 10000)
+
+    def built_sketches(ws):
+        def build():
+            sketches = expense_sketches.Sketches()
+            sketches.rebuild(ws.store)
+            return sketches
+        return ws.derived('sketches', build)
+
+    cases += [
+        ('sketches exact (sort)', 'data', lambda ws: exact_statistics(ws.store) and len(ws.records)),
+        ('sketches rebuild', 'data', sketches_rebuild),
+        ('sketches add x10k', 'data', sketches_add),
+        ('sketches statistics', 'data', lambda ws: built_sketches(ws).statistics() and None),
+    ]
+
+    # Trends from the rollups against one filtered scan per month shown
+    def rollup_totals(ws):
+        def build():
+            rollups = Rollups()
+            rollups.rebuild(ws.store)
+            day_totals = {day: bucket[1] for day, bucket in rollups.daily.items()}
+            month_categories = {month: {category: bucket[1] for category, bucket in totals.items()}
+                                for month, totals in rollups.categories.items()}
+            return day_totals, month_categories
+        return ws.derived('rollup totals', build)
+
+    def trends(ws):
+        return expense_analytics.trends(*rollup_totals(ws), months=24)
+
+    def monthly_scans(ws):
+        months = ws.derived('trend months', lambda: trends(ws)['months']['month'])
+        return sum(ws.store.summarize(ws.store.positions(month=month))['count'] for month in months)
+
+    cases += [
+        ('trends 24 months', 'data', lambda ws: trends(ws) and None),
+        ('trends 24 monthly scans', 'data', monthly_scans),
+    ]
+    return cases
+
+
+def _concurrent_writer(data_file, backend, writer, writes, compact_every, barrier, results):
+    """One process adding expenses to a shared dataset, refreshing now and then like the app"""
+    with quiet():
+        if backend == 'journal':
+            storage = JournalStorage(data_file, compact_every=compact_every)
+        else:
+            storage = open_storage(data_file, backend)
+        tracker = ExpenseTracker(storage=storage)
+        barrier.wait()
+        started = time.time()
+        for i in range(writes):
+            tracker.record_expense({'id': None, 'date': '2024-06-15', 'amount': 10.0 + writer,
+                                    'category': 'Food', 'description': f"writer {writer} expense {i}"})
+            if i % 25 == 0:
+                tracker.refresh()
+        finished = time.time()
+        tracker.close()
+    results.put((started, finished))
+
+
+def run_concurrency(backends, writer_counts, writes=200, initial=1000, compact_every=100, log=print):
+    """Time N processes writing to one dataset, then check that no record was lost
+
+    Journal writers compact every `compact_every` records, so snapshots
+    are rewritten while other processes keep appending.
+    """
+    context = multiprocessing.get_context()
+    results = []
+    for backend in backends:
+        for writers in writer_counts:
+            workdir = tempfile.mkdtemp(prefix='expense-bench-')
+            data_file = os.path.join(workdir, 'expenses.db' if backend == 'sqlite' else 'expenses.json')
+            write_dataset(data_file, initial, backend=backend)
+            barrier = context.Barrier(writers)
+            queue = context.Queue()
+            processes = [
+                context.Process(target=_concurrent_writer,
+                                args=(data_file, backend, writer, writes, compact_every, barrier, queue))
+                for writer in range(writers)
+            ]
+            for process in processes:
+                process.start()
+            spans = [queue.get() for _ in processes]
+            for process in processes:
+                process.join()
+            seconds = max(end for _, end in spans) - min(start for start, _ in spans)
+
+            with quiet():
+                tracker = ExpenseTracker(storage=open_storage(data_file, backend))
+                stored = list(tracker.iter_expenses())
+                tracker.close()
+            ids = [expense['id'] for expense in stored]
+            descriptions = {expense['description'] for expense in stored}
+            expected = {f"writer {w} expense {i}" for w in range(writers) for i in range(writes)}
+            # Both the concurrent adds and the records that were there before must survive
+            lost = max(len(expected - descriptions), initial + len(expected) - len(set(ids)))
+            row = {
+                'case': f"concurrent writers x{writers}",
+                'backend': backend,
+                'size': initial,
+                'writers': writers,
+                'writes': writers * writes,
+                'seconds': seconds,
+                'items_per_s': writers * writes / seconds if seconds else None,
+                'lost': lost,
+                'duplicate_ids': len(ids) - len(set(ids)),
+                'records': len(stored),
+            }
+            results.append(row)
+            log(f"  {backend} {writers} writers: {row['writes']} adds in {seconds:.2f}s "
+                f"({row['items_per_s']:,.0f}/s), {row['records']} records stored, "
+                f"{row['lost']} lost, {row['duplicate_ids']} duplicate ids")
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def _add_buffered(tracker, writes, max_records, max_delay_ms, durability):
+    with tracker.buffered(max_records, max_delay_ms, durability):
+        for i in range(writes):
+            tracker.record_expense({'id': None, 'date': '2024-06-15', 'amount': 25.0,
+                                    'category': 'Food', 'description': f"group commit {i}"})
+
+
+def _killed_writer(data_file, backend, max_records, max_delay_ms, durability, acknowledged, ready):
+    """Add expenses through the write buffer until killed, counting each acknowledged add"""
+    with quiet():
+        tracker = ExpenseTracker(storage=open_storage(data_file, backend))
+        ready.set()
+        with tracker.buffered(max_records, max_delay_ms, durability):
+            while True:
+                tracker.record_expense({'id': None, 'date': '2024-06-15', 'amount': 25.0,
+                                        'category': 'Food', 'description': "acknowledged"})
+                acknowledged.value += 1
+
+
+def run_group_commit(backends, group_sizes, writes=2000, max_delay_ms=50, durability='fsync',
+                     kill_trials=5, seed=42, log=print):
+    """Measure buffered add throughput per group size and the expenses lost when killed"""
+    context = multiprocessing.get_context()
+    rng = random.Random(seed)
+    results = []
+    for backend in backends:
+        for max_records in group_sizes:
+            workdir = tempfile.mkdtemp(prefix='expense-bench-')
+            data_file = os.path.join(workdir, 'expenses.db' if backend == 'sqlite' else 'expenses.json')
+            with quiet():
+                tracker = ExpenseTracker(storage=open_storage(data_file, backend))
+                started = time.perf_counter()
+                _add_buffered(tracker, writes, max_records, max_delay_ms, durability)
+                seconds = time.perf_counter() - started
+                tracker.close()
+
+            losses = []
+            loss_ms = []
+            for trial in range(kill_trials):
+                with quiet():
+                    tracker = ExpenseTracker(storage=open_storage(data_file, backend))
+                    before = tracker.count_expenses()
+                    tracker.close()
+                acknowledged = context.Value('q', 0, lock=False)
+                ready = context.Event()
+                process = context.Process(target=_killed_writer, args=(
+                    data_file, backend, max_records, max_delay_ms, durability, acknowledged, ready))
+                process.start()
+                ready.wait()
+                started = time.perf_counter()
+                time.sleep(rng.uniform(0.2, 0.6))
+                process.kill()
+                process.join()
+                elapsed = time.perf_counter() - started
+                with quiet():
+                    tracker = ExpenseTracker(storage=open_storage(data_file, backend))
+                    stored = tracker.count_expenses() - before
+                    tracker.close()
+                # A group committed just before the kill can include an add that
+                # was not acknowledged yet; that is not a loss
+                lost = max(0, acknowledged.value - stored)
+                losses.append(lost)
+                rate = acknowledged.value / elapsed
+                loss_ms.append(lost / rate * 1000 if rate else 0.0)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+            row = {
+                'case': f"group commit x{max_records}",
+                'backend': backend,
+                'size': writes,
+                'durability': durability,
+                'max_delay_ms': max_delay_ms,
+                'seconds': seconds,
+                'items_per_s': writes / seconds,
+                'kill_trials': kill_trials,
+                'max_lost': max(losses, default=0),
+                'mean_lost': statistics.mean(losses) if losses else 0,
+                'max_loss_window_ms': max(loss_ms, default=0.0),
+            }
+            results.append(row)
+            log(f"  {backend} groups of {max_records:>5}: {row['items_per_s']:9,.0f} adds/s, "
+                f"crash lost at most {row['max_lost']} expenses (~{row['max_loss_window_ms']:.0f} ms of adds)")
+    return results
+
+
+def measure(run, setup=None, repeat=3, memory=True):
+    """Time run() repeat times and return the timings, item count and peak traced memory"""
+    timings = []
+    items = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        items = run()
+        timings.append(time.perf_counter() - started)
+    peak = None
+    if memory:
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    items = items if isinstance(items, int) and items > 0 else 1
+    return {
+        'best_s': min(timings),
+        'median_s': statistics.median(timings),
+        'items': items,
+        'items_per_s': items / min(timings) if min(timings) else None,
+        'peak_bytes': peak,
+    }
+
+
+def run_benchmarks(sizes, backends, workdir='bench_data', seed=42, repeat=3,
+                   memory=True, app=True, components=True, only=None, log=print):
+    """Run every case for every size and backend; returns the result rows"""
+    os.makedirs(workdir, exist_ok=True)
+    cases = tracker_cases() + (app_cases() if app else []) + (component_cases() if components else [])
+    if only:
+        cases = [case for case in cases if any(word in case[0] for word in only)]
+    results = []
+    for backend in backends:
+        for n in sizes:
+            started = time.perf_counter()
+            master = dataset_path(workdir, n, seed, backend)
+            log(f"{backend} {n:,} records (dataset ready in {time.perf_counter() - started:.1f}s)")
+            ws = Workspace(master, backend, n, seed)
+            try:
+                for name, state, run in cases:
+                    if state == 'data':
+                        if backend != backends[0]:
+                            continue
+                        row = measure(lambda: run(ws), None, repeat, memory)
+                    elif state != 'shared':
+                        row = measure(lambda: run(ws), lambda: ws.prepare(state), repeat, memory)
+                        ws.close()
+                    else:
+                        if ws.tracker is None:
+                            ws.reset()
+                            ws.open()
+                        row = measure(lambda: run(ws.tracker), None, repeat, memory)
+                    row = {'case': name, 'backend': backend, 'size': n, **row}
+                    results.append(row)
+                    log(format_row(row))
+            finally:
+                ws.remove()
+    return results
+
+
+def format_row(row):
+    peak = f"{row['peak_bytes'] / 1e6:9.1f} MB" if row['peak_bytes'] is not None else ''
+    rate = f"{row['items_per_s']:12,.0f} items/s" if row['items'] > 1 and row['items_per_s'] else ' ' * 20
+    return f"  {row['case']:<26} {row['best_s'] * 1000:10.2f} ms {rate} {peak}"
+
+
+def environment():
+    """Describe the machine and code version the results came from"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'json_codec': expense_codec.CODEC,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def max_rss_bytes():
+    """Peak resident memory of this process, where the platform reports it"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def compare(results, baseline, threshold=1.25, min_seconds=0.001):
+    """Return (row, baseline_row, ratio) for cases slower than threshold x baseline"""
+    previous = {(row['case'], row['backend'], row['size']): row for row in baseline['results']}
+    regressions = []
+    for row in results:
+        old = previous.get((row['case'], row['backend'], row['size']))
+        if old is None or max(row['best_s'], old['best_s']) < min_seconds:
+            continue
+        ratio = row['best_s'] / old['best_s'] if old['best_s'] else float('inf')
+        if ratio > threshold:
+            regressions.append((row, old, ratio))
+    return regressions
+
+
+def _parse_sizes(text):
+    return [int(float(size)) for size in text.split(',')]
+
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="expense_bench.py",
+                                     description="Benchmark tracker operations on synthetic data")
+    parser.add_argument('--sizes', type=_parse_sizes, default=[1000, 10000, 100000],
+                        help="comma-separated record counts, e.g. 1e3,1e5,1e7")
+    parser.add_argument('--backends', default='journal,sqlite', help="comma-separated storage backends")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per case (best and median are kept)")
+    parser.add_argument('--seed', type=int, default=42, help="synthetic data seed")
+    parser.add_argument('--workdir', default='bench_data', help="where generated datasets are cached")
+    parser.add_argument('--only', help="comma-separated words; run only cases whose name contains one")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc peak-memory run")
+    parser.add_argument('--no-app', action='store_true', help="skip the Streamlit page computations")
+    parser.add_argument('--no-components', action='store_true',
+                        help="skip the cases for the store, codec, snapshot, sketches and analytics")
+    parser.add_argument('--output', default='bench_results.json', help="JSON results file")
+    parser.add_argument('--baseline', help="earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=1.25, help="slowdown ratio reported as a regression")
+    parser.add_argument('--writers', type=_parse_sizes,
+                        help="comma-separated process counts; run the concurrent-writer stress test instead")
+    parser.add_argument('--writes', type=int, default=200, help="expenses added by each concurrent writer")
+    parser.add_argument('--group-commit', type=_parse_sizes, metavar='SIZES',
+                        help="comma-separated group sizes; measure buffered add throughput and crash loss instead")
+    parser.add_argument('--delay-ms', type=int, default=50, help="longest wait before a buffered group is committed")
+    parser.add_argument('--durability', choices=['fsync', 'os'], default='fsync', help="durability of each group commit")
+    parser.add_argument('--kill-trials', type=int, default=5, help="times a buffered writer is killed mid-stream")
+    parser.add_argument('--generate', metavar='FILE',
+                        help="only write a synthetic dataset of the first size to FILE (.json or .db)")
+    options = parser.parse_args(args)
+
+    if options.generate:
+        backend = 'sqlite' if options.generate.endswith('.db') else 'journal'
+        write_dataset(options.generate, options.sizes[0], options.seed, backend)
+        print(f"✓ Wrote {options.sizes[0]:,} synthetic expenses to {options.generate}")
+        return 0
+
+    if options.group_commit:
+        results = run_group_commit(options.backends.split(','), options.group_commit,
+                                   writes=options.writes * 10, max_delay_ms=options.delay_ms,
+                                   durability=options.durability, kill_trials=options.kill_trials,
+                                   seed=options.seed)
+        with open(options.output, 'w') as file:
+            json.dump({'environment': environment(), 'results': results}, file, indent=2)
+        print(f"✓ Results written to {options.output}")
+        return 0
+
+    if options.writers:
+        results = run_concurrency(options.backends.split(','), options.writers, options.writes)
+        with open(options.output, 'w') as file:
+            json.dump({'environment': environment(), 'results': results}, file, indent=2)
+        print(f"✓ Results written to {options.output}")
+        failed = [row for row in results if row['lost'] or row['duplicate_ids']]
+        return 1 if failed else 0
+
+    results = run_benchmarks(
+        options.sizes, options.backends.split(','), workdir=options.workdir, seed=options.seed,
+        repeat=options.repeat, memory=not options.no_memory, app=not options.no_app,
+        components=not options.no_components,
+        only=options.only.split(',') if options.only else None,
+    )
+    report = {
+        'environment': environment(),
+        'settings': {'seed': options.seed, 'repeat': options.repeat},
+        'max_rss_bytes': max_rss_bytes(),
+        'results': results,
+    }
+    with open(options.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"✓ Results written to {options.output}")
+
+    if options.baseline:
+        with open(options.baseline, 'r') as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, options.threshold)
+        for row, old, ratio in regressions:
+            print(f"  slower: {row['case']} ({row['backend']}, {row['size']:,}) "
+                  f"{old['best_s'] * 1000:.2f} ms -> {row['best_s'] * 1000:.2f} ms ({ratio:.2f}x)")
+        print(f"{len(regressions)} regressions against {options.baseline}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
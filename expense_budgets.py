@@ -0,0 +1,140 @@
+import os
+
+import expense_codec
+
+# Shares of a limit that raise an alert when spending crosses them
+THRESHOLDS = (0.8, 1.0)
+LEVELS = {0.8: 'warning', 1.0: 'exceeded'}
+
+
+class Budgets:
+    """Monthly spending limits per category
+
+    `limits` maps a category to its limit for every month and `overrides`
+    maps YYYY-MM to {category: limit} for months that differ. Spending is
+    not kept here: callers pass the month-to-date total from the rollups,
+    so checking an expense is a few dict lookups at any data size. The
+    limits are user settings rather than derived data, so they are saved
+    as soon as they change.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.limits = {}
+        self.overrides = {}
+        self._stamp = None
+        self.load()
+
+    def load(self):
+        """Read the limits file; returns False if there is none or it is unreadable"""
+        self.limits = {}
+        self.overrides = {}
+        self._stamp = self._file_stamp()
+        if self._stamp is None:
+            return False
+        try:
+            with open(self.path, 'rb') as file:
+                data = expense_codec.loads(file.read())
+            self.limits = {category: float(limit) for category, limit in data['limits'].items()}
+            self.overrides = {month: {category: float(limit) for category, limit in limits.items()}
+                              for month, limits in data['overrides'].items()}
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self.limits = {}
+            self.overrides = {}
+            return False
+        return True
+
+    def sync(self):
+        """Reload if another process changed the limits file; returns True if it did"""
+        if self._file_stamp() == self._stamp:
+            return False
+        self.load()
+        return True
+
+    def save(self):
+        if not self.path:
+            return
+        data = {'limits': self.limits, 'overrides': self.overrides}
+        # Unique per process, so concurrent savers never share a temp file
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(expense_codec.dumps(data, pretty=True))
+        os.replace(tmp_path, self.path)
+        self._stamp = self._file_stamp()
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except (OSError, TypeError):
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def limit(self, month, category):
+        """The limit for a category in YYYY-MM, or None if it has none"""
+        month_limits = self.overrides.get(month)
+        if month_limits is not None and category in month_limits:
+            return month_limits[category]
+        return self.limits.get(category)
+
+    def month_limits(self, month):
+        """{category: limit} for every category with a limit in YYYY-MM"""
+        limits = dict(self.limits)
+        limits.update(self.overrides.get(month, {}))
+        return limits
+
+    def set_limit(self, category, amount, month=None):
+        """Set a category's limit for every month, or only for YYYY-MM; None removes it"""
+        limits = self.limits if month is None else self.overrides.setdefault(month, {})
+        if amount is None:
+            limits.pop(category, None)
+        else:
+            if amount <= 0:
+                raise ValueError("A budget limit must be positive")
+            limits[category] = float(amount)
+        if month is not None and not limits:
+            del self.overrides[month]
+
+    def status(self, month, category, spent):
+        """How much of its limit a category has used, or None if it has none"""
+        limit = self.limit(month, category)
+        if limit is None:
+            return None
+        ratio = spent / limit
+        level = 'ok'
+        for threshold in THRESHOLDS:
+            if ratio >= threshold:
+                level = LEVELS[threshold]
+        return {
+            'month': month,
+            'category': category,
+            'limit': limit,
+            'spent': spent,
+            'remaining': limit - spent,
+            'ratio': ratio,
+            'level': level,
+        }
+
+    def check(self, month, category, before, after):
+        """The alert for spending going from `before` to `after`, if it crossed a threshold
+
+        Only the highest threshold crossed is reported, and only once:
+        further expenses above it are not alerted again.
+        """
+        limit = self.limit(month, category)
+        if limit is None:
+            return None
+        crossed = [threshold for threshold in THRESHOLDS if before < threshold * limit <= after]
+        if not crossed:
+            return None
+        alert = self.status(month, category, after)
+        alert['level'] = LEVELS[crossed[-1]]
+        return alert
+
+
+def alert_message(alert):
+    """One line describing a budget alert"""
+    if alert['level'] == 'exceeded':
+        return (f"Budget exceeded: {alert['category']} in {alert['month']} is at {alert['spent']:.2f} "
+                f"of {alert['limit']:.2f} ({alert['ratio'] * 100:.0f}%)")
+    return (f"Budget warning: {alert['category']} in {alert['month']} has used {alert['ratio'] * 100:.0f}% "
+            f"of {alert['limit']:.2f} ({alert['remaining']:.2f} left)")
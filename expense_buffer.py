@@ -0,0 +1,87 @@
+import threading
+import time
+
+from expense_metrics import metrics
+
+
+class WriteBuffer:
+    """Write-behind buffer that groups new expenses into one commit
+
+    Expenses are held until `max_records` are pending or the oldest has
+    waited `max_delay_ms`, then committed together: one journal write and
+    one fsync for the whole group instead of one per expense. Buffered
+    expenses are neither stored nor visible to queries until flushed, so
+    a crash loses at most the pending group: fewer than max_records
+    expenses, added within the last max_delay_ms (plus the commit time).
+
+    commit(expenses) does the actual write. A background flush that fails
+    keeps its expenses pending and re-raises the error from the next
+    add() or flush().
+    """
+
+    def __init__(self, commit, max_records=100, max_delay_ms=50):
+        self.commit = commit
+        self.max_records = max_records
+        self.max_delay_ms = max_delay_ms
+        self.pending = []
+        self.oldest = None
+        self.error = None
+        self.flushes = 0
+        self._lock = threading.RLock()
+        self._timer = None
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, expenses):
+        """Queue expenses, committing right away if the group is full"""
+        with self._lock:
+            self._raise_error()
+            if not self.pending:
+                self.oldest = time.monotonic()
+            self.pending.extend(expenses)
+            if len(self.pending) >= self.max_records or not self.max_delay_ms:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.max_delay_ms / 1000, self._flush_in_background)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Commit every pending expense now; returns how many were written"""
+        with self._lock:
+            self._raise_error()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self.pending:
+                return 0
+            expenses, self.pending = self.pending, []
+            try:
+                with metrics.timer('buffer.flush'):
+                    self.commit(expenses)
+            except BaseException:
+                # Keep the group so nothing acknowledged is dropped
+                self.pending = expenses + self.pending
+                raise
+            self.flushes += 1
+            metrics.count('buffer.flushed_records', len(expenses))
+            self.oldest = None
+            return len(expenses)
+
+    def _flush_in_background(self):
+        with self._lock:
+            self._timer = None
+            try:
+                self.flush()
+            except Exception as e:
+                self.error = e
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def close(self):
+        """Flush and stop the timer"""
+        self.flush()
@@ -0,0 +1,124 @@
+import json
+import os
+from typing import List
+
+# Optional fast codecs, best first; the standard library is the fallback
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+if msgspec is not None:
+    try:
+        from typing import Annotated
+    except ImportError:
+        # Python 3.8; without typing_extensions the schema falls back to orjson or json
+        try:
+            from typing_extensions import Annotated
+        except ImportError:
+            msgspec = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if msgspec is not None:
+    CODEC = 'msgspec'
+elif orjson is not None:
+    CODEC = 'orjson'
+else:
+    CODEC = 'json'
+
+# EXPENSE_JSON_PRETTY=1 writes indented snapshots that are easier to read and diff
+PRETTY = os.environ.get('EXPENSE_JSON_PRETTY', '') not in ('', '0')
+
+FIELD_TYPES = {
+    'id': (int,),
+    'date': (str,),
+    'amount': (float, int),
+    'category': (str,),
+    'description': (str,),
+}
+
+
+class SchemaError(ValueError):
+    """Stored data that does not look like a list of expense records"""
+
+
+if msgspec is not None:
+    class _Expense(msgspec.Struct):
+        id: int
+        date: Annotated[str, msgspec.Meta(min_length=10, max_length=10)]
+        amount: float
+        category: str
+        description: str
+
+    _encoder = msgspec.json.Encoder()
+
+
+def dumps(data, pretty=None):
+    """Encode data as UTF-8 JSON bytes, compact unless pretty"""
+    pretty = PRETTY if pretty is None else pretty
+    if CODEC == 'orjson':
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else 0)
+    if CODEC == 'msgspec':
+        encoded = _encoder.encode(data)
+        return msgspec.json.format(encoded, indent=2) if pretty else encoded
+    if pretty:
+        return json.dumps(data, indent=2).encode('utf-8')
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data):
+    """Decode JSON text or bytes without any schema check"""
+    if CODEC == 'orjson':
+        return orjson.loads(data)
+    if CODEC == 'msgspec':
+        return msgspec.json.decode(data)
+    return json.loads(data)
+
+
+def dump_line(record):
+    """Encode one record as a compact JSON line, newline included"""
+    return dumps(record, pretty=False) + b'\n'
+
+
+def load_expenses(data, validate=True):
+    """Decode a JSON array of expense records, checking every record's fields"""
+    if CODEC == 'msgspec' and validate:
+        try:
+            structs = msgspec.json.decode(data, type=List[_Expense])
+        except msgspec.ValidationError as e:
+            raise SchemaError(f"Invalid expense data: {e}") from None
+        return [msgspec.structs.asdict(struct) for struct in structs]
+    records = loads(data)
+    if validate:
+        validate_expenses(records)
+    return records
+
+
+def validate_expenses(records):
+    """Raise SchemaError unless records is a list of well-formed expense dicts"""
+    if not isinstance(records, (list, tuple)):
+        raise SchemaError(f"Expected a list of expenses, got {type(records).__name__}")
+    for index, record in enumerate(records):
+        try:
+            if not (type(record['id']) is int
+                    and type(record['date']) is str and len(record['date']) == 10
+                    and type(record['amount']) in (float, int)
+                    and type(record['category']) is str
+                    and type(record['description']) is str):
+                raise SchemaError(_describe_problem(index, record))
+        except (KeyError, TypeError):
+            raise SchemaError(_describe_problem(index, record)) from None
+
+
+def _describe_problem(index, record):
+    if not isinstance(record, dict):
+        return f"Expense {index} is not a record: {record!r}"
+    for field, types in FIELD_TYPES.items():
+        if field not in record:
+            return f"Expense {index} has no {field}"
+        value = record[field]
+        if type(value) not in types:
+            return f"Expense {index} has a {type(value).__name__} {field}: {value!r}"
+    return f"Expense {index} has a malformed date: {record['date']!r}"
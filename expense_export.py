@@ -0,0 +1,103 @@
+import csv
+import io
+from itertools import islice
+
+import expense_codec
+
+FIELDS = ['id', 'date', 'amount', 'category', 'description']
+
+
+def iter_chunks(records, chunk_size=10000):
+    """Group a stream of records into lists of at most chunk_size"""
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def csv_chunks(records, chunk_size=10000, header=True):
+    """Yield CSV text one chunk of records at a time"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDS, extrasaction='ignore')
+    if header:
+        writer.writeheader()
+    for chunk in iter_chunks(records, chunk_size):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def jsonl_chunks(records, chunk_size=10000):
+    """Yield JSON-lines text one chunk of records at a time"""
+    for chunk in iter_chunks(records, chunk_size):
+        yield b''.join(expense_codec.dump_line(record) for record in chunk).decode('utf-8')
+
+
+def write_parquet(records, path, chunk_size=10000):
+    """Write records to a Parquet file, one row group per chunk"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export needs pyarrow (pip install pyarrow)") from None
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('date', pa.string()),
+        ('amount', pa.float64()),
+        ('category', pa.string()),
+        ('description', pa.string()),
+    ])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in iter_chunks(records, chunk_size):
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            count += len(chunk)
+    return count
+
+
+def write_records(records, path, format='csv', chunk_size=10000):
+    """Stream records to a CSV, JSON-lines or Parquet file; returns the row count"""
+    counted = _Counter(records)
+    if format == 'parquet':
+        return write_parquet(counted, path, chunk_size)
+    if format == 'csv':
+        chunks = csv_chunks(counted, chunk_size)
+    elif format == 'jsonl':
+        chunks = jsonl_chunks(counted, chunk_size)
+    else:
+        raise ValueError(f"Unknown export format: {format}")
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        for text in chunks:
+            file.write(text)
+    return counted.count
+
+
+def detect_format(path):
+    """Guess the export format from a file name"""
+    lower = path.lower()
+    if lower.endswith('.parquet'):
+        return 'parquet'
+    if lower.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return 'csv'
+
+
+class _Counter:
+    """Iterator wrapper that counts the records passing through it"""
+
+    def __init__(self, records):
+        self.records = iter(records)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        record = next(self.records)
+        self.count += 1
+        return record
@@ -0,0 +1,136 @@
+import csv
+import math
+import time
+from datetime import date as Date
+from itertools import islice
+
+import expense_codec
+
+
+class ImportResult:
+    """Counters collected while importing a file"""
+
+    def __init__(self):
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+        self.seconds = 0.0
+
+    @property
+    def rows_per_sec(self):
+        rows = self.imported + self.rejected
+        return rows / self.seconds if self.seconds else 0.0
+
+    def reject(self, line_number, reason, max_errors=20):
+        self.rejected += 1
+        if len(self.errors) < max_errors:
+            self.errors.append(f"line {line_number}: {reason}")
+
+    def __str__(self):
+        return (f"Imported {self.imported} expenses, rejected {self.rejected} rows "
+                f"in {self.seconds:.2f}s ({self.rows_per_sec:,.0f} rows/sec)")
+
+
+def detect_format(path):
+    """Guess the import format from a file name"""
+    lower = path.lower()
+    if lower.endswith('.csv'):
+        return 'csv'
+    if lower.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    raise ValueError(f"Cannot tell the format of {path}; use csv or jsonl")
+
+
+def read_rows(file, format):
+    """Yield (line_number, raw_row) pairs from an open CSV or JSON-lines file"""
+    if format == 'csv':
+        reader = csv.DictReader(file)
+        if reader.fieldnames:
+            reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+        for row in reader:
+            yield reader.line_num, row
+    elif format == 'jsonl':
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield line_number, expense_codec.loads(line)
+            except ValueError as e:
+                yield line_number, e
+    else:
+        raise ValueError(f"Unknown import format: {format}")
+
+
+def _parse_amount(value):
+    if isinstance(value, str):
+        value = value.strip().lstrip('$₹').replace(',', '')
+    amount = float(value)
+    if not math.isfinite(amount):
+        raise ValueError(f"amount is not a number: {value}")
+    return amount
+
+
+def validate_batch(rows, categories, result):
+    """Check a batch of raw rows; returns the valid ones as partial expenses"""
+    known_categories = {category.lower(): category for category in categories}
+    valid_dates = {}
+    valid = []
+    for line_number, row in rows:
+        if not isinstance(row, dict):
+            result.reject(line_number, f"not a record ({row})")
+            continue
+        try:
+            date_str = str(row.get('date') or '').strip()
+            if date_str not in valid_dates:
+                valid_dates[date_str] = Date.fromisoformat(date_str).isoformat() == date_str
+            if not valid_dates[date_str]:
+                raise ValueError(f"invalid date '{date_str}'")
+            amount = _parse_amount(row.get('amount'))
+        except (TypeError, ValueError) as e:
+            result.reject(line_number, e)
+            continue
+        category = str(row.get('category') or '').strip()
+        valid.append({
+            'id': None,
+            'date': date_str,
+            'amount': amount,
+            'category': known_categories.get(category.lower(), 'Other'),
+            'description': str(row.get('description') or '').strip(),
+        })
+    return valid
+
+
+def import_file(tracker, path, format=None, batch_size=10000):
+    """Stream a CSV or JSON-lines file into the tracker batch by batch
+
+    Only one batch of rows is held at a time. Each batch is validated,
+    given a contiguous block of ids and written with a single commit.
+    """
+    format = format or detect_format(path)
+    with open(path, 'r', newline='', encoding='utf-8-sig') as file:
+        return import_stream(tracker, file, format, batch_size)
+
+
+def import_stream(tracker, file, format, batch_size=10000, on_batch=None):
+    """Import from an open text file (e.g. stdin); see import_file
+
+    on_batch(expenses) is called with each committed batch, ids filled in.
+    """
+    result = ImportResult()
+    started = time.perf_counter()
+    rows = read_rows(file, format)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        expenses = validate_batch(batch, tracker.categories, result)
+        # Ids are allocated by the storage backend as the batch is written
+        tracker.record_expenses(expenses, compact=False)
+        result.imported += len(expenses)
+        if on_batch is not None:
+            on_batch(expenses)
+    if result.imported:
+        tracker.save_data()
+    result.seconds = time.perf_counter() - started
+    return result
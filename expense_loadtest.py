@@ -0,0 +1,312 @@
+"""Load test for the expense HTTP API (see expense_server)
+
+Opens a number of keep-alive connections, sends a weighted mix of
+queries, summaries, reports, statistics and batch adds for a fixed time,
+and reports requests/sec with p50/p90/p99 latency overall and per
+endpoint:
+
+    python expense_loadtest.py --url http://127.0.0.1:8080 --connections 32
+    python expense_loadtest.py --size 1e5 --backend sqlite --duration 20
+    python expense_loadtest.py --mix find=5,add=1 --batch 100
+
+Without --url a server is started in a child process on a synthetic
+dataset of --size records (generated into --workdir like the benchmarks)
+and stopped afterwards. Any non-2xx answer counts as an error.
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import date as Date
+from urllib.parse import urlencode, urlsplit
+
+import expense_codec
+
+# Relative weight of each kind of request in the default mix
+DEFAULT_MIX = {'find': 40, 'search': 10, 'summary': 15, 'report': 15, 'statistics': 5, 'get': 10, 'add': 5}
+CATEGORIES = ['Food', 'Transportation', 'Entertainment', 'Utilities',
+              'Healthcare', 'Shopping', 'Education', 'Other']
+WORDS = ['coffee', 'uber', 'bill', 'order', 'groceries', 'movie', 'petrol', 'books']
+
+
+class Client:
+    """One keep-alive HTTP/1.1 connection"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, target, body=None):
+        """Send a request and return (status, body bytes)"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = f"{method} {target} HTTP/1.1\r\nHost: {self.host}\r\n"
+        if body is not None:
+            head += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+        self.writer.write(head.encode('latin-1') + b'\r\n' + (body or b''))
+        await self.writer.drain()
+        try:
+            return await self._read_response()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self.close()
+            raise
+
+    async def _read_response(self):
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding') == 'chunked':
+            parts = []
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                data = await self.reader.readexactly(size + 2)
+                if not size:
+                    break
+                parts.append(data[:-2])
+            body = b''.join(parts)
+        else:
+            body = await self.reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection') == 'close':
+            self.close()
+        return status, body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = self.reader = None
+
+
+class RequestMix:
+    """Builds random requests in proportion to the mix weights"""
+
+    def __init__(self, mix, first_date, last_date, last_id, batch=10, seed=42):
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.random = random.Random(seed)
+        first, last = Date.fromisoformat(first_date), Date.fromisoformat(last_date)
+        self.months = sorted({Date.fromordinal(day).strftime('%Y-%m')
+                              for day in range(first.toordinal(), last.toordinal() + 1, 28)}
+                             | {last.strftime('%Y-%m')})
+        self.first = first
+        self.days = (last - first).days + 1
+        self.last_id = max(last_id, 1)
+        self.batch = batch
+
+    def next(self):
+        """Return (kind, method, target, body)"""
+        kind = self.random.choices(self.kinds, self.weights)[0]
+        rnd = self.random
+        if kind == 'find':
+            params = rnd.choice([
+                {'month': rnd.choice(self.months)},
+                {'category': rnd.choice(CATEGORIES), 'order': '-amount'},
+                {'min_amount': rnd.choice([500, 1000, 5000]), 'order': '-date'},
+                {'month': rnd.choice(self.months), 'category': rnd.choice(CATEGORIES)},
+            ])
+            params['page_size'] = 20
+            return kind, 'GET', '/expenses?' + urlencode(params), None
+        if kind == 'search':
+            return kind, 'GET', '/expenses?' + urlencode({'q': rnd.choice(WORDS), 'page_size': 20}), None
+        if kind == 'summary':
+            params = rnd.choice([{'category': rnd.choice(CATEGORIES)}, {'month': rnd.choice(self.months)}, {}])
+            return kind, 'GET', '/expenses/summary?' + urlencode(params), None
+        if kind == 'report':
+            return kind, 'GET', f"/reports/{rnd.choice(self.months)}", None
+        if kind == 'statistics':
+            return kind, 'GET', '/statistics', None
+        if kind == 'get':
+            return kind, 'GET', f"/expenses/{rnd.randint(1, self.last_id)}", None
+        if kind == 'add':
+            expenses = [{
+                'date': Date.fromordinal(self.first.toordinal() + rnd.randrange(self.days)).isoformat(),
+                'amount': round(rnd.uniform(10, 2000), 2),
+                'category': rnd.choice(CATEGORIES),
+                'description': f"Load test {rnd.choice(WORDS)}",
+            } for _ in range(self.batch)]
+            return kind, 'POST', '/expenses', expense_codec.dumps(expenses, pretty=False)
+        raise ValueError(f"Unknown request kind: {kind}")
+
+
+async def _worker(host, port, mix, deadline, samples, errors):
+    client = Client(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            kind, method, target, body = mix.next()
+            started = time.perf_counter()
+            try:
+                status, _ = await client.request(method, target, body)
+            except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+                status = None
+            elapsed = time.perf_counter() - started
+            samples.setdefault(kind, []).append(elapsed)
+            if status is None or not 200 <= status < 300:
+                errors[kind] = errors.get(kind, 0) + 1
+    finally:
+        client.close()
+
+
+async def _data_range(client):
+    """First and last date and highest id of the data behind the server"""
+    dates = []
+    for order in ('date', '-date'):
+        status, body = await client.request('GET', f"/expenses?order={order}&page_size=1")
+        expenses = expense_codec.loads(body)['expenses'] if status == 200 else []
+        dates.append(expenses[0]['date'] if expenses else Date.today().isoformat())
+    status, body = await client.request('GET', "/expenses?order=-id&page_size=1")
+    expenses = expense_codec.loads(body)['expenses'] if status == 200 else []
+    return dates[0], dates[1], expenses[0]['id'] if expenses else 1
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def _latency_row(values, errors, seconds):
+    values = sorted(values)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'requests_per_s': len(values) / seconds,
+        'p50_ms': percentile(values, 0.50) * 1000,
+        'p90_ms': percentile(values, 0.90) * 1000,
+        'p99_ms': percentile(values, 0.99) * 1000,
+        'max_ms': (values[-1] if values else 0.0) * 1000,
+    }
+
+
+async def run_load(host, port, mix_weights, connections=32, duration=10.0, warmup=1.0, batch=10, seed=42):
+    """Drive the server for `duration` seconds; returns overall and per-endpoint results"""
+    probe = Client(host, port)
+    try:
+        first_date, last_date, last_id = await _data_range(probe)
+    finally:
+        probe.close()
+    mixes = [RequestMix(mix_weights, first_date, last_date, last_id, batch, seed + n) for n in range(connections)]
+    if warmup:
+        deadline = time.perf_counter() + warmup
+        await asyncio.gather(*(_worker(host, port, mix, deadline, {}, {}) for mix in mixes))
+    samples, errors = {}, {}
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(_worker(host, port, mix, deadline, samples, errors) for mix in mixes))
+    seconds = time.perf_counter() - started
+    every = [value for values in samples.values() for value in values]
+    return {
+        'connections': connections,
+        'seconds': seconds,
+        'overall': _latency_row(every, sum(errors.values()), seconds),
+        'endpoints': {kind: _latency_row(values, errors.get(kind, 0), seconds)
+                      for kind, values in sorted(samples.items())},
+    }
+
+
+def _serve_process(data_file, backend, workers, ready):
+    import expense_server
+    from expense_storage import open_storage
+    from expense_tracker import ExpenseTracker
+
+    async def run():
+        tracker = ExpenseTracker(storage=open_storage(data_file, backend, pool_reads=True))
+        server = await expense_server.ExpenseServer(tracker, port=0, workers=workers).start()
+        ready.put(server.port)
+        await server.serve_forever()
+
+    asyncio.run(run())
+
+
+def start_local_server(size, backend='journal', workers=8, workdir='bench_data', seed=42):
+    """Serve a copy of a synthetic dataset from a child process; returns (process, port, tmpdir)"""
+    from expense_bench import dataset_path
+    master = dataset_path(workdir, size, seed, backend)
+    tmpdir = tempfile.mkdtemp(prefix='expense-load-')
+    data_file = os.path.join(tmpdir, os.path.basename(master))
+    shutil.copyfile(master, data_file)
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve_process, args=(data_file, backend, workers, ready),
+                                      daemon=True)
+    process.start()
+    return process, ready.get(timeout=600), tmpdir
+
+
+def _parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        kind, _, weight = item.partition('=')
+        mix[kind.strip()] = float(weight or 1)
+    unknown = set(mix) - set(DEFAULT_MIX)
+    if unknown:
+        raise ValueError(f"Unknown request kinds: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def format_row(name, row):
+    return (f"  {name:<12} {row['requests']:>8} {row['errors']:>6} {row['requests_per_s']:>10,.0f} "
+            f"{row['p50_ms']:>9.2f} {row['p90_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['max_ms']:>9.2f}")
+
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="expense_loadtest.py",
+                                     description="Measure requests/sec and latency of the expense API")
+    parser.add_argument('--url', help="server to test (default: start one on synthetic data)")
+    parser.add_argument('--size', type=lambda text: int(float(text)), default=100000,
+                        help="records in the synthetic dataset of a local server")
+    parser.add_argument('--backend', default='journal', help="storage backend of a local server")
+    parser.add_argument('--workers', type=int, default=8, help="worker threads of a local server")
+    parser.add_argument('--workdir', default='bench_data', help="where generated datasets are cached")
+    parser.add_argument('--connections', type=int, default=32, help="concurrent keep-alive connections")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds of measured load")
+    parser.add_argument('--warmup', type=float, default=1.0, help="seconds of unmeasured load first")
+    parser.add_argument('--mix', type=_parse_mix, default=DEFAULT_MIX,
+                        help="request weights, e.g. find=40,summary=15,add=5")
+    parser.add_argument('--batch', type=int, default=10, help="expenses per add request")
+    parser.add_argument('--seed', type=int, default=42, help="request mix seed")
+    parser.add_argument('--output', help="also write the results to this JSON file")
+    options = parser.parse_args(args)
+
+    process = tmpdir = None
+    if options.url:
+        url = urlsplit(options.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        print(f"Starting a {options.backend} server on {options.size:,} synthetic expenses...")
+        process, port, tmpdir = start_local_server(options.size, options.backend, options.workers,
+                                                   options.workdir)
+        host = '127.0.0.1'
+    try:
+        results = asyncio.run(run_load(host, port, options.mix, options.connections, options.duration,
+                                       options.warmup, options.batch, options.seed))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.join()
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print(f"{options.connections} connections for {results['seconds']:.1f}s against {host}:{port}")
+    print(f"  {'endpoint':<12} {'requests':>8} {'errors':>6} {'req/s':>10} "
+          f"{'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for kind, row in results['endpoints'].items():
+        print(format_row(kind, row))
+    print(format_row('all', results['overall']))
+    if options.output:
+        with open(options.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f"✓ Results written to {options.output}")
+    return 1 if results['overall']['errors'] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,269 @@
+import atexit
+import json
+import os
+import threading
+import time
+from functools import wraps
+
+
+class Metrics:
+    """Timers and counters for the tracker's hot paths
+
+    Disabled by default, in which case timed() and timer() cost a single
+    attribute check. Each timer keeps [count, total seconds, max seconds,
+    errors]; counters are plain totals. When enabled, the numbers are
+    written to a JSON or Prometheus text file every `interval` seconds and
+    at exit, and can be served over HTTP for Prometheus to scrape.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.interval = 10.0
+        self.profile_target = None
+        self.profile_dir = '.'
+        self.timers = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._last_write = time.monotonic()
+        self._server = None
+
+    def enable(self, path=None, port=None, interval=10.0):
+        """Start collecting; optionally write to path and serve on port"""
+        self.enabled = True
+        self.path = path
+        self.interval = interval
+        if port is not None and self._server is None:
+            self._server = serve(self, port)
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.timers = {}
+            self.counters = {}
+
+    def observe(self, name, seconds, error=False):
+        """Record one timed call"""
+        with self._lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = self.timers[name] = [0, 0.0, 0.0, 0]
+            timer[0] += 1
+            timer[1] += seconds
+            if seconds > timer[2]:
+                timer[2] = seconds
+            if error:
+                timer[3] += 1
+        self._maybe_write()
+
+    def count(self, name, value=1):
+        """Add to a counter"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def clock(self):
+        """Start time for a later stop(), or None when disabled"""
+        return time.perf_counter() if self.enabled else None
+
+    def stop(self, name, started):
+        """Record the time since a clock() reading"""
+        if started is not None:
+            self.observe(name, time.perf_counter() - started)
+
+    def timer(self, name):
+        """Context manager timing the block under name"""
+        if not self.enabled:
+            return _NULL_TIMER
+        if name == self.profile_target:
+            return _ProfiledTimer(self, name)
+        return _Timer(self, name)
+
+    def snapshot(self):
+        """Return the current timers and counters as plain data"""
+        with self._lock:
+            return {
+                'timers': {
+                    name: {'count': t[0], 'seconds': t[1], 'max_seconds': t[2], 'errors': t[3]}
+                    for name, t in sorted(self.timers.items())
+                },
+                'counters': dict(sorted(self.counters.items())),
+            }
+
+    def prometheus_text(self):
+        """Render the metrics in the Prometheus text exposition format"""
+        data = self.snapshot()
+        lines = [
+            '# TYPE expense_op_seconds summary',
+            '# TYPE expense_op_max_seconds gauge',
+            '# TYPE expense_op_errors_total counter',
+        ]
+        for name, timer in data['timers'].items():
+            label = f'{{op="{name}"}}'
+            lines.append(f'expense_op_seconds_count{label} {timer["count"]}')
+            lines.append(f'expense_op_seconds_sum{label} {timer["seconds"]:.6f}')
+            lines.append(f'expense_op_max_seconds{label} {timer["max_seconds"]:.6f}')
+            lines.append(f'expense_op_errors_total{label} {timer["errors"]}')
+        lines.append('# TYPE expense_events_total counter')
+        for name, value in data['counters'].items():
+            lines.append(f'expense_events_total{{event="{name}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path=None):
+        """Write the metrics to a .json file, or Prometheus text for any other name"""
+        path = path or self.path
+        if not path:
+            return
+        if path.endswith('.json'):
+            text = json.dumps({'written': time.time(), **self.snapshot()}, indent=2)
+        else:
+            text = self.prometheus_text()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            file.write(text)
+        os.replace(tmp_path, path)
+        self._last_write = time.monotonic()
+
+    def _maybe_write(self):
+        if self.path and time.monotonic() - self._last_write >= self.interval:
+            try:
+                self.write()
+            except OSError:
+                # Metrics must never break the operation being measured
+                pass
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.started, exc_type is not None)
+        return False
+
+
+class _ProfiledTimer(_Timer):
+    """Timer that also captures a cProfile and tracemalloc report, once"""
+
+    def __enter__(self):
+        # Only needed when profiling, so plain imports stay quick
+        import cProfile
+        import tracemalloc
+        self.metrics.profile_target = None
+        self.profiler = cProfile.Profile()
+        self.tracing = not tracemalloc.is_tracing()
+        if self.tracing:
+            tracemalloc.start(25)
+        self.profiler.enable()
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        import tracemalloc
+        super().__exit__(exc_type, exc, tb)
+        self.profiler.disable()
+        memory = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        if self.tracing:
+            tracemalloc.stop()
+        try:
+            write_profile(self.name, self.profiler, memory, peak, self.metrics.profile_dir)
+        except OSError as e:
+            print(f"Error writing profile for {self.name}: {e}")
+        return False
+
+
+def write_profile(name, profiler, memory, peak, directory='.'):
+    """Save a .prof file plus a text summary of the hottest functions and allocations"""
+    import pstats
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    base = os.path.join(directory, f"profile-{name}-{stamp}")
+    profiler.dump_stats(base + '.prof')
+    with open(base + '.txt', 'w') as file:
+        file.write(f"Profile of {name}\nPeak traced memory: {peak / 1e6:.1f} MB\n\n")
+        pstats.Stats(profiler, stream=file).sort_stats('cumulative').print_stats(30)
+        file.write("Top allocations by line:\n")
+        for stat in memory.statistics('lineno')[:20]:
+            file.write(f"  {stat}\n")
+    return base
+
+
+def serve(metrics, port):
+    """Serve the metrics as Prometheus text on http://localhost:port/metrics"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    threading.Thread(target=server.serve_forever, name='expense-metrics', daemon=True).start()
+    return server
+
+
+metrics = Metrics()
+
+
+def timed(name):
+    """Decorator recording each call of the function under name"""
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return func(*args, **kwargs)
+            with metrics.timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def configure():
+    """Set up collection from the environment
+
+    EXPENSE_METRICS: file to write (.json, or Prometheus text otherwise)
+    EXPENSE_METRICS_PORT: serve Prometheus text on this port
+    EXPENSE_PROFILE: profile the next call of this operation (e.g. tracker.summarize)
+    EXPENSE_PROFILE_DIR: where profiles are written (default: current directory)
+    """
+    path = os.environ.get('EXPENSE_METRICS') or None
+    port = os.environ.get('EXPENSE_METRICS_PORT')
+    target = os.environ.get('EXPENSE_PROFILE') or None
+    if path or port or target:
+        metrics.enable(path, int(port) if port else None,
+                       float(os.environ.get('EXPENSE_METRICS_INTERVAL', 10)))
+        metrics.profile_target = target
+        metrics.profile_dir = os.environ.get('EXPENSE_PROFILE_DIR', '.')
+        if path:
+            atexit.register(metrics.write)
+
+
+configure()
@@ -0,0 +1,404 @@
+from itertools import islice
+
+import numpy as np
+
+from expense_search import text_score
+
+def month_bounds(year_month):
+    """Return inclusive first/last date strings covering a YYYY-MM month"""
+    # Dates are compared as ISO strings, so day 31 bounds every month
+    return f"{year_month}-01", f"{year_month}-31"
+
+
+FILTER_NAMES = ('date', 'month', 'start_date', 'end_date',
+                'category', 'keyword', 'min_amount', 'max_amount')
+DATE_FILTERS = ('date', 'month', 'start_date', 'end_date')
+# How many leading characters of a YYYY-MM-DD date make each group key
+DATE_KEY_WIDTHS = {'date': 10, 'month': 7, 'year': 4}
+GROUP_KEYS = ('date', 'month', 'year', 'category')
+
+
+def expense_matches(exp, date=None, month=None, start_date=None, end_date=None,
+                    category=None, keyword=None, min_amount=None, max_amount=None):
+    """Check a single expense against the standard filters"""
+    if date is not None and exp['date'] != date:
+        return False
+    if month is not None and not exp['date'].startswith(month + '-'):
+        return False
+    if start_date is not None and exp['date'] < start_date:
+        return False
+    if end_date is not None and exp['date'] > end_date:
+        return False
+    if category is not None and exp['category'] != category:
+        return False
+    if keyword is not None and keyword.lower() not in exp['description'].lower():
+        return False
+    if min_amount is not None and exp['amount'] < min_amount:
+        return False
+    if max_amount is not None and exp['amount'] > max_amount:
+        return False
+    return True
+
+
+def filter_expenses(expenses, **filters):
+    """Return the expenses matching all given filters"""
+    return [exp for exp in expenses if expense_matches(exp, **filters)]
+
+
+def summarize_expenses(expenses):
+    """Compute totals, counts and breakdowns for a list of expenses"""
+    total_amount = 0
+    max_expense = None
+    category_totals = {}
+    category_counts = {}
+    daily_totals = {}
+    count = 0
+    for exp in expenses:
+        count += 1
+        total_amount += exp['amount']
+        if max_expense is None or exp['amount'] > max_expense['amount']:
+            max_expense = exp
+        category = exp['category']
+        category_totals[category] = category_totals.get(category, 0) + exp['amount']
+        category_counts[category] = category_counts.get(category, 0) + 1
+        daily_totals[exp['date']] = daily_totals.get(exp['date'], 0) + exp['amount']
+    return {
+        'total': total_amount,
+        'count': count,
+        'average': total_amount / count if count else 0,
+        'max_expense': max_expense,
+        'category_totals': category_totals,
+        'category_counts': category_counts,
+        'daily_totals': daily_totals,
+    }
+
+
+def group_expenses(expenses, key):
+    """[count, total] per date, month, year or category, sorted by key"""
+    groups = {}
+    width = DATE_KEY_WIDTHS.get(key)
+    for exp in expenses:
+        label = exp['category'] if width is None else exp['date'][:width]
+        group = groups.get(label)
+        if group is None:
+            groups[label] = [1, exp['amount']]
+        else:
+            group[0] += 1
+            group[1] += exp['amount']
+    return dict(sorted(groups.items()))
+
+
+def sql_where(date=None, month=None, start_date=None, end_date=None,
+              category=None, keyword=None, min_amount=None, max_amount=None):
+    """Translate the standard filters into a SQL WHERE clause and parameters"""
+    clauses = []
+    params = []
+    if date is not None:
+        clauses.append("date = ?")
+        params.append(date)
+    if month is not None:
+        clauses.append("date BETWEEN ? AND ?")
+        params.extend(month_bounds(month))
+    if start_date is not None:
+        clauses.append("date >= ?")
+        params.append(start_date)
+    if end_date is not None:
+        clauses.append("date <= ?")
+        params.append(end_date)
+    if category is not None:
+        clauses.append("category = ?")
+        params.append(category)
+    if keyword is not None:
+        clauses.append("instr(lower(description), ?) > 0")
+        params.append(keyword.lower())
+    if min_amount is not None:
+        clauses.append("amount >= ?")
+        params.append(min_amount)
+    if max_amount is not None:
+        clauses.append("amount <= ?")
+        params.append(max_amount)
+    if not clauses:
+        return "", params
+    return " WHERE " + " AND ".join(clauses), params
+
+
+ORDER_KEYS = ('relevance', 'id', 'date', 'amount')
+
+
+class Query:
+    """A lazily evaluated, composable expense query
+
+    Start from tracker.query() and chain filters; every call returns a new
+    Query and nothing runs until the results are iterated or aggregated:
+
+        tracker.query().between('2024-01-01', '2024-03-31').category('Food') \\
+            .amount(min=10).text('coffee').group_by('month').sum()
+
+    Date filters are answered by the date index (or SQLite's) and text by
+    the search index. When a query has both, whichever is estimated to
+    match fewer records drives it and the rest are checked on its
+    candidates only; plan() names the choice. Records stream in insertion
+    (id) order, best matches first for text queries, unless order_by()
+    says otherwise. limit() caps the records listed and aggregated.
+    """
+
+    def __init__(self, tracker, filters=None, text=None, mode='substring', order=None, limit=None):
+        self.tracker = tracker
+        self._filters = filters or {}
+        self._text = text
+        self._mode = mode
+        self._order = order
+        self._limit = limit
+
+    def _with(self, **changes):
+        state = {'filters': self._filters, 'text': self._text, 'mode': self._mode,
+                 'order': self._order, 'limit': self._limit}
+        state.update(changes)
+        return Query(self.tracker, **state)
+
+    def where(self, **filters):
+        """Add standard filters (see expense_matches); None values are ignored"""
+        unknown = set(filters) - set(FILTER_NAMES)
+        if unknown:
+            raise TypeError(f"Unknown filters: {', '.join(sorted(unknown))}")
+        merged = dict(self._filters)
+        merged.update((name, value) for name, value in filters.items() if value is not None)
+        return self._with(filters=merged)
+
+    def on(self, date):
+        return self.where(date=_date_text(date))
+
+    def month(self, year_month):
+        return self.where(month=year_month)
+
+    def between(self, start=None, end=None):
+        """Dates from start to end, both inclusive; either may be None"""
+        return self.where(start_date=_date_text(start), end_date=_date_text(end))
+
+    def category(self, category):
+        return self.where(category=category)
+
+    def amount(self, min=None, max=None):
+        return self.where(min_amount=min, max_amount=max)
+
+    def keyword(self, keyword):
+        """Descriptions containing keyword, checked record by record"""
+        return self.where(keyword=keyword)
+
+    def text(self, query, mode='substring'):
+        """Full-text match through the search index (see ExpenseTracker.search)"""
+        return self._with(text=query or None, mode=mode)
+
+    def order_by(self, key):
+        """'relevance', 'id', 'date' or 'amount'; prefix with '-' for descending"""
+        if key.lstrip('-') not in ORDER_KEYS:
+            raise ValueError(f"Cannot order by {key!r}")
+        return self._with(order=key)
+
+    def limit(self, count):
+        return self._with(limit=count)
+
+    def key(self):
+        """Hashable description of the query, e.g. for caching its results"""
+        return (tuple(sorted(self._filters.items())), self._text, self._mode, self._order, self._limit)
+
+    def group_by(self, key):
+        """Aggregate per 'date', 'month', 'year' or 'category'"""
+        if key not in GROUP_KEYS:
+            raise ValueError(f"Cannot group by {key!r}")
+        return GroupedQuery(self, key)
+
+    # Results
+
+    def __iter__(self):
+        """Stream the matching expenses"""
+        return self._records()
+
+    def all(self):
+        return list(self._records())
+
+    def first(self):
+        return next(self._records(0, 1), None)
+
+    def page(self, cursor=None, page_size=20):
+        """Return one page of results and the cursor for the next page
+
+        Plain filter queries page by id like tracker.iter_page(), so pages
+        stay stable while expenses are added; others page by offset.
+        """
+        if self._text is None and self._order is None and self._limit is None:
+            return self.tracker.iter_page(self._filters, cursor, page_size)
+        offset = cursor or 0
+        expenses = list(self._records(offset, offset + page_size + 1))
+        next_cursor = offset + page_size if len(expenses) > page_size else None
+        return expenses[:page_size], next_cursor
+
+    def count(self):
+        if self._plain():
+            return self.tracker.count_expenses(**self._filters)
+        positions = self._positions()
+        if positions is not None:
+            return len(positions)
+        return sum(1 for _ in self._records())
+
+    def sum(self):
+        return self.summary()['total']
+
+    def summary(self):
+        """Totals and breakdowns, as tracker.summarize()"""
+        if self._plain():
+            return self.tracker.summarize(**self._filters)
+        positions = self._positions()
+        if positions is not None:
+            return self.tracker.expenses.summarize(positions)
+        return summarize_expenses(self._records())
+
+    def plan(self):
+        """Name the index that drives the query"""
+        if self._text is None:
+            if set(self._filters) & set(DATE_FILTERS):
+                return 'date index'
+            return 'scan' if self._filters else 'all'
+        return 'date index' if self._window_first() else 'search index'
+
+    # Execution
+
+    def _plain(self):
+        """True when the tracker's own filtered count/summarize answer the query"""
+        return self._text is None and self._limit is None
+
+    def _window_first(self):
+        """Whether the date window is estimated to hold fewer records than the text matches"""
+        tracker = self.tracker
+        if not set(self._filters) & set(DATE_FILTERS):
+            return False
+        if tracker.storage.queryable:
+            window = tracker.storage.count(**{name: value for name, value in self._filters.items()
+                                              if name in DATE_FILTERS})
+        else:
+            window = tracker.expenses.window_size(**self._filters)
+        return window < tracker.search_estimate(self._text, self._mode)
+
+    def _order_key(self):
+        if self._text is None:
+            # Nothing to rank by
+            return 'id' if self._order in (None, 'relevance', '-relevance') else self._order
+        return self._order or 'relevance'
+
+    def _positions(self):
+        """Ordered store positions of the matches, or None for a queryable backend"""
+        tracker = self.tracker
+        if tracker.storage.queryable:
+            return None
+        store = tracker.expenses
+        order = self._order_key()
+        by = order.lstrip('-')
+        if self._text is None:
+            positions = store.positions(**self._filters)
+        elif self._window_first():
+            positions = store.positions(**self._filters)
+            scores = [text_score(store.descriptions[p], self._text, self._mode) for p in positions]
+            positions = positions[np.array([score is not None for score in scores], dtype=bool)]
+            if by == 'relevance':
+                # Best first, newest first on ties, as the search index ranks
+                scores = np.array([score for score in scores if score is not None], dtype=np.int64)
+                positions = positions[np.lexsort((-positions, -scores))]
+        else:
+            limit = self._limit if not self._filters and order == 'relevance' else None
+            ids = tracker.search_ids(self._text, limit=limit, mode=self._mode)
+            positions = store.refine(store.id_positions(ids), **self._filters)
+
+        if by == 'relevance':
+            if order.startswith('-'):
+                positions = positions[::-1]
+        elif self._order is not None:
+            # Otherwise the results are already in insertion order
+            column = {'id': store.ids, 'date': store.dates, 'amount': store.amounts}[by]
+            if order.startswith('-'):
+                positions = positions[np.lexsort((-store.ids[positions], -column[positions]))]
+            else:
+                positions = positions[np.lexsort((store.ids[positions], column[positions]))]
+        return positions[:self._limit]
+
+    def _records(self, start=0, stop=None):
+        """Generator over the matches between two offsets"""
+        if self._limit is not None:
+            stop = self._limit if stop is None else min(stop, self._limit)
+        positions = self._positions()
+        if positions is not None:
+            yield from self.tracker.expenses.iter_select(positions[start:stop])
+            return
+        storage = self.tracker.storage
+        order = self._order_key()
+        if self._text is None:
+            limit = None if stop is None else max(stop - start, 0)
+            yield from storage.iter_find(order_by=order, limit=limit, offset=start, **self._filters)
+            return
+        if self._window_first():
+            matches = []
+            for exp in storage.iter_find(**self._filters):
+                score = text_score(exp['description'], self._text, self._mode)
+                if score is not None:
+                    matches.append((score, exp))
+            if order.lstrip('-') == 'relevance':
+                matches.sort(key=lambda match: (match[0], match[1]['id']), reverse=True)
+            matches = (exp for score, exp in matches)
+        else:
+            ids = self.tracker.search_ids(self._text, mode=self._mode)
+            matches = _fetch_matching(storage, ids, self._filters)
+        if order.lstrip('-') != 'relevance':
+            column = order.lstrip('-')
+            matches = sorted(matches, key=lambda exp: (exp[column], exp['id']),
+                             reverse=order.startswith('-'))
+        elif order == '-relevance':
+            matches = list(matches)[::-1]
+        yield from islice(matches, start, stop)
+
+
+class GroupedQuery:
+    """A query aggregated per date, month, year or category"""
+
+    def __init__(self, query, key):
+        self.query = query
+        self.key = key
+
+    def totals(self):
+        """[count, total] per group, sorted by group"""
+        query = self.query
+        tracker = query.tracker
+        filters = query._filters
+        if query._plain():
+            if set(filters) <= {'month', 'category'}:
+                groups = tracker.rollups.groups(self.key, **filters)
+                if groups is not None:
+                    return groups
+            if tracker.storage.queryable:
+                return tracker.storage.group_totals(self.key, **filters)
+        positions = query._positions()
+        if positions is not None:
+            return tracker.expenses.group_totals(positions, self.key)
+        return group_expenses(query._records(), self.key)
+
+    def sum(self):
+        return {label: total for label, (count, total) in self.totals().items()}
+
+    def count(self):
+        return {label: count for label, (count, total) in self.totals().items()}
+
+    def average(self):
+        return {label: total / count for label, (count, total) in self.totals().items()}
+
+
+def _fetch_matching(storage, expense_ids, filters, chunk_size=500):
+    """Yield the stored expenses with the given ids that match the filters, in id list order"""
+    for start in range(0, len(expense_ids), chunk_size):
+        for exp in storage.get_many(expense_ids[start:start + chunk_size]):
+            if expense_matches(exp, **filters):
+                yield exp
+
+
+def _date_text(value):
+    """YYYY-MM-DD for a date, datetime or string (None passes through)"""
+    if value is None or isinstance(value, str):
+        return value
+    return value.strftime("%Y-%m-%d")
@@ -0,0 +1,209 @@
+import csv
+import heapq
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date as Date
+from itertools import repeat
+
+import numpy as np
+
+import expense_codec
+import expense_export
+from expense_query import month_bounds
+from expense_storage import PartitionedStorage
+
+EXECUTORS = ('process', 'thread', 'serial')
+TOP_DAYS = 5
+
+
+def report_filename(year_month, output_dir='.'):
+    return os.path.join(output_dir, f"expense_report_{year_month}.csv")
+
+
+def write_report_csv(path, year_month, total_amount, category_totals, transaction_count, expenses,
+                     chunk_size=10000):
+    """Write one monthly report: totals, category breakdown, then every expense"""
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+
+        writer.writerow(['Monthly Expense Report', year_month])
+        writer.writerow(['Total Amount', f"${total_amount:.2f}"])
+        writer.writerow(['Number of Transactions', transaction_count])
+        writer.writerow([])
+
+        writer.writerow(['Category Breakdown'])
+        writer.writerow(['Category', 'Amount', 'Percentage'])
+        for category, amount in category_totals.items():
+            percentage = (amount / total_amount) * 100
+            writer.writerow([category, f"${amount:.2f}", f"{percentage:.1f}%"])
+
+        writer.writerow([])
+
+        writer.writerow(['Detailed Expenses'])
+        writer.writerow(['Date', 'Amount', 'Category', 'Description'])
+        for chunk in expense_export.iter_chunks(expenses, chunk_size):
+            writer.writerows([
+                exp['date'],
+                f"${exp['amount']:.2f}",
+                exp['category'],
+                exp['description']
+            ] for exp in chunk)
+
+
+def report_months(tracker, year=None):
+    """Months that have expenses, oldest first, optionally within one year"""
+    return sorted(month for month in tracker.rollups.monthly if year is None or month.startswith(f"{year}-"))
+
+
+def generate_reports(tracker, months, output_dir='.', workers=None, executor='process', export=True):
+    """Build the monthly report of each month in parallel; returns them in month order
+
+    The data is split by month first: in-memory backends hand each worker
+    its month's columns, SQLite workers read their month through their own
+    connection and partitioned storage workers read their month's segment.
+    Each worker then computes the category breakdown and top spending days
+    and writes the month's CSV. A month is always handled by one worker, so
+    the reports and files are the same for any number of workers or either
+    executor.
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"Unknown executor: {executor}")
+    months = sorted(set(months))
+    workers = workers or os.cpu_count() or 1
+    if export:
+        os.makedirs(output_dir, exist_ok=True)
+    with tracker.lock:
+        tasks = list(_month_tasks(tracker, months))
+    if executor == 'serial' or workers == 1 or len(tasks) <= 1:
+        return [month_report(task, output_dir, export) for task in tasks]
+    pool_class = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+    with pool_class(max_workers=min(workers, len(tasks))) as pool:
+        return list(pool.map(month_report, tasks, repeat(output_dir), repeat(export)))
+
+
+def _month_tasks(tracker, months):
+    """One picklable unit of work per month"""
+    storage = tracker.storage
+    if isinstance(storage, PartitionedStorage):
+        partitions = storage.manifest['partitions']
+        for month in months:
+            # Only the bytes the manifest covers, like the storage itself
+            size = partitions[month]['size'] if month in partitions else 0
+            yield ('segment', month, (storage.segment_path(month), size))
+        return
+    if storage.queryable and storage.data_file not in (None, ':memory:'):
+        for month in months:
+            yield ('sqlite', month, storage.data_file)
+        return
+    if storage.queryable:
+        # An in-memory database cannot be opened by another connection
+        from expense_store import ExpenseStore
+        for month in months:
+            store = ExpenseStore(tracker.query().month(month))
+            yield _store_partition(store, month, np.arange(len(store)))
+        return
+    store = tracker.expenses
+    for month in months:
+        yield _store_partition(store, month, store.positions(month=month))
+
+
+def _store_partition(store, month, positions):
+    return ('columns', month, {
+        'dates': store.dates[positions],
+        'amounts': store.amounts[positions],
+        'codes': store.categories[positions],
+        'category_names': list(store.category_names),
+        'descriptions': [store.descriptions[p] for p in positions],
+    })
+
+
+def _read_sqlite_month(db_file, month):
+    """Read one month's columns through a private connection"""
+    conn = sqlite3.connect(db_file, timeout=30)
+    try:
+        rows = conn.execute(
+            "SELECT date, amount, category, description FROM expenses "
+            "WHERE date BETWEEN ? AND ? ORDER BY id", month_bounds(month)
+        ).fetchall()
+    finally:
+        conn.close()
+    return _columns(rows)
+
+
+def _read_segment_month(path, size):
+    """Read one month's columns from its partition segment"""
+    if not size:
+        return _columns([])
+    with open(path, 'rb') as file:
+        data = file.read(size)
+    expenses = expense_codec.load_expenses(b'[' + data.rstrip(b'\n').replace(b'\n', b',') + b']')
+    return _columns([(exp['date'], exp['amount'], exp['category'], exp['description']) for exp in expenses])
+
+
+def _columns(rows):
+    """Report columns from (date, amount, category, description) rows"""
+    ordinals = {}
+    codes = {}
+    for day, _, category, _ in rows:
+        if day not in ordinals:
+            ordinals[day] = Date.fromisoformat(day).toordinal()
+        codes.setdefault(category, len(codes))
+    return {
+        'dates': np.fromiter((ordinals[row[0]] for row in rows), dtype=np.int32, count=len(rows)),
+        'amounts': np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows)),
+        'codes': np.fromiter((codes[row[2]] for row in rows), dtype=np.int16, count=len(rows)),
+        'category_names': list(codes),
+        'descriptions': [row[3] for row in rows],
+    }
+
+
+def month_report(task, output_dir='.', export=True):
+    """Compute one month's report from its task and optionally write its CSV"""
+    kind, month, payload = task
+    if kind == 'sqlite':
+        columns = _read_sqlite_month(payload, month)
+    elif kind == 'segment':
+        columns = _read_segment_month(*payload)
+    else:
+        columns = payload
+    amounts = columns['amounts']
+    names = columns['category_names']
+    count = len(amounts)
+    total_amount = float(amounts.sum())
+
+    codes = columns['codes']
+    totals = np.bincount(codes, weights=amounts, minlength=len(names))
+    counts = np.bincount(codes, minlength=len(names))
+    # Largest first, ties by name, so the order never depends on the input order
+    categories = sorted(
+        ((names[code], float(totals[code]), int(counts[code])) for code in np.flatnonzero(counts)),
+        key=lambda item: (-item[1], item[0])
+    )
+
+    days, day_index = np.unique(columns['dates'], return_inverse=True)
+    day_totals = np.bincount(day_index, weights=amounts, minlength=len(days))
+    day_labels = [Date.fromordinal(int(day)).isoformat() for day in days]
+    top = heapq.nsmallest(TOP_DAYS, range(len(days)), key=lambda i: (-day_totals[i], day_labels[i]))
+
+    report = {
+        'month': month,
+        'count': count,
+        'total': total_amount,
+        'average': total_amount / count if count else 0,
+        'category_totals': {name: total for name, total, _ in categories},
+        'category_counts': {name: n for name, _, n in categories},
+        'top_days': [(day_labels[i], float(day_totals[i])) for i in top],
+        'file': None,
+    }
+    if export and count:
+        path = report_filename(month, output_dir)
+        descriptions = columns['descriptions']
+        expenses = (
+            {'date': day_labels[day_index[i]], 'amount': float(amounts[i]),
+             'category': names[codes[i]], 'description': descriptions[i]}
+            for i in range(count)
+        )
+        write_report_csv(path, month, total_amount, report['category_totals'], count, expenses)
+        report['file'] = path
+    return report
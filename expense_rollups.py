@@ -0,0 +1,183 @@
+import os
+
+import expense_codec
+
+
+def _bucket_add(bucket, expense):
+    """Fold one expense into a [count, total, min, max, max_id] bucket"""
+    amount = expense['amount']
+    if bucket is None:
+        return [1, amount, amount, amount, expense['id']]
+    bucket[0] += 1
+    bucket[1] += amount
+    if amount < bucket[2]:
+        bucket[2] = amount
+    if amount > bucket[3]:
+        bucket[3] = amount
+        bucket[4] = expense['id']
+    return bucket
+
+
+def _bucket_merge(bucket, other):
+    """Combine two buckets into the first (or a copy of the second)"""
+    if bucket is None:
+        return list(other)
+    bucket[0] += other[0]
+    bucket[1] += other[1]
+    bucket[2] = min(bucket[2], other[2])
+    if other[3] > bucket[3]:
+        bucket[3] = other[3]
+        bucket[4] = other[4]
+    return bucket
+
+
+class Rollups:
+    """Pre-aggregated totals by day, month and (month, category)
+
+    Each bucket is [count, total, min, max, id of the max expense]. Buckets
+    are updated as expenses are added, so month and whole-history summaries
+    read a few buckets instead of scanning every record.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.record_count = 0
+        self.last_id = None
+        self.daily = {}
+        self.monthly = {}
+        self.categories = {}
+
+    def add(self, expense):
+        """Update the buckets for one new expense"""
+        day = expense['date']
+        month = day[:7]
+        self.daily[day] = _bucket_add(self.daily.get(day), expense)
+        self.monthly[month] = _bucket_add(self.monthly.get(month), expense)
+        month_categories = self.categories.setdefault(month, {})
+        category = expense['category']
+        month_categories[category] = _bucket_add(month_categories.get(category), expense)
+        self.record_count += 1
+        self.last_id = expense['id']
+
+    def rebuild(self, expenses):
+        """Recompute every bucket from scratch"""
+        self.record_count = 0
+        self.last_id = None
+        self.daily = {}
+        self.monthly = {}
+        self.categories = {}
+        for expense in expenses:
+            self.add(expense)
+
+    def summary(self, month=None, get_expense=None):
+        """Build a summary dict for one YYYY-MM month or the whole history"""
+        if month is not None:
+            overall = self.monthly.get(month)
+            category_buckets = self.categories.get(month, {})
+            days = (f"{month}-{day:02d}" for day in range(1, 32))
+            daily_totals = {day: self.daily[day][1] for day in days if day in self.daily}
+        else:
+            overall = None
+            for bucket in self.monthly.values():
+                overall = _bucket_merge(overall, bucket)
+            category_buckets = {}
+            for month_categories in self.categories.values():
+                for category, bucket in month_categories.items():
+                    category_buckets[category] = _bucket_merge(category_buckets.get(category), bucket)
+            daily_totals = {day: bucket[1] for day, bucket in sorted(self.daily.items())}
+        count, total_amount = (overall[0], overall[1]) if overall else (0, 0)
+        max_expense = None
+        if overall and get_expense is not None:
+            max_expense = get_expense(overall[4])
+        return {
+            'total': total_amount,
+            'count': count,
+            'average': total_amount / count if count else 0,
+            'max_expense': max_expense,
+            'category_totals': {category: bucket[1] for category, bucket in category_buckets.items()},
+            'category_counts': {category: bucket[0] for category, bucket in category_buckets.items()},
+            'daily_totals': daily_totals,
+        }
+
+    def groups(self, key, month=None, category=None):
+        """[count, total] per date, month, year or category, or None if the buckets cannot tell"""
+        months = [month] if month is not None else sorted(self.monthly)
+        groups = {}
+        if key == 'date':
+            if category is not None:
+                return None
+            prefix = f"{month}-" if month is not None else ""
+            return {day: bucket[:2] for day, bucket in sorted(self.daily.items()) if day.startswith(prefix)}
+        for month_key in months:
+            if category is not None or key == 'category':
+                buckets = self.categories.get(month_key, {})
+                if category is not None:
+                    buckets = {category: buckets[category]} if category in buckets else {}
+            else:
+                buckets = {None: self.monthly[month_key]} if month_key in self.monthly else {}
+            for bucket_category, bucket in buckets.items():
+                label = bucket_category if key == 'category' else month_key[:7 if key == 'month' else 4]
+                group = groups.get(label)
+                if group is None:
+                    groups[label] = bucket[:2]
+                else:
+                    group[0] += bucket[0]
+                    group[1] += bucket[1]
+        return dict(sorted(groups.items()))
+
+    def load(self):
+        """Read persisted rollups; returns False if there are none"""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'rb') as file:
+                data = expense_codec.loads(file.read())
+            self.record_count = data['record_count']
+            self.last_id = data['last_id']
+            self.daily = data['daily']
+            self.monthly = data['monthly']
+            self.categories = data['categories']
+        except (ValueError, KeyError):
+            self.rebuild(())
+            return False
+        return True
+
+    def save(self):
+        if not self.path:
+            return
+        data = {
+            'record_count': self.record_count,
+            'last_id': self.last_id,
+            'daily': self.daily,
+            'monthly': self.monthly,
+            'categories': self.categories,
+        }
+        # Unique per process, so concurrent savers never share a temp file
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(expense_codec.dumps(data, pretty=False))
+        os.replace(tmp_path, self.path)
+
+    def sync(self, expenses):
+        """Bring persisted rollups up to date with the loaded expenses
+
+        Records appended since the rollups were saved are folded in
+        incrementally; anything else (fewer records, a different record at
+        the saved position) means the file is stale and is rebuilt.
+        """
+        saved_count = self.record_count if self.load() else None
+        fresh = (
+            saved_count is not None and saved_count <= len(expenses)
+            and (saved_count == 0 or expenses[saved_count - 1]['id'] == self.last_id)
+        )
+        if fresh:
+            for expense in expenses[saved_count:]:
+                self.add(expense)
+        else:
+            self.rebuild(expenses)
+        if not fresh or self.record_count != saved_count:
+            try:
+                self.save()
+            except OSError:
+                # The rollups are only a cache; they are rebuilt next time
+                pass
@@ -0,0 +1,282 @@
+import os
+import re
+import sys
+from array import array
+
+from bisect import bisect_left
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Split lower-cased text into word tokens"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def trigrams(text):
+    """Return the set of 3-character substrings of text"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def query_terms(query, mode='substring'):
+    """Split a search query into the terms that must all match"""
+    return tokenize(query) if mode == 'prefix' else query.lower().split()
+
+
+def text_score(description, query, mode='substring'):
+    """Score one description the way SearchIndex.search() ranks it, or None if it does not match
+
+    Lets a caller holding a handful of candidates check them directly
+    instead of asking the index.
+    """
+    terms = query_terms(query, mode)
+    if not terms:
+        return None
+    text = description.lower().replace('\x00', ' ')
+    tokens = set(tokenize(text))
+    if mode == 'prefix':
+        if not all(any(token.startswith(term) for token in tokens) for term in terms):
+            return None
+    elif not all(term in text for term in terms):
+        return None
+    return sum(term in tokens for term in terms)
+
+
+class SearchIndex:
+    """Inverted index over expense descriptions
+
+    Every description is stored lower-cased with a document number (its
+    insertion position). Two posting maps point back at those numbers:
+    trigram -> documents, used to narrow substring searches down to a few
+    candidates, and whole word -> documents, used for prefix searches and
+    ranking. Postings are appended in document order, so they stay sorted
+    and can be intersected with NumPy binary searches directly.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.ids = array('q')
+        self.texts = []
+        self.short_docs = array('i')
+        self.trigram_postings = {}
+        self.token_postings = {}
+        self._vocabulary = None
+
+    @property
+    def record_count(self):
+        return len(self.ids)
+
+    @property
+    def last_id(self):
+        return self.ids[-1] if self.ids else None
+
+    def add(self, expense):
+        """Index one new expense"""
+        doc = len(self.ids)
+        text = sys.intern(expense['description'].lower().replace('\x00', ' '))
+        self.ids.append(expense['id'])
+        self.texts.append(text)
+        if len(text) < 3:
+            self.short_docs.append(doc)
+        for gram in trigrams(text):
+            postings = self.trigram_postings.get(gram)
+            if postings is None:
+                postings = self.trigram_postings[gram] = array('i')
+            postings.append(doc)
+        for token in set(tokenize(text)):
+            postings = self.token_postings.get(token)
+            if postings is None:
+                postings = self.token_postings[token] = array('i')
+                self._vocabulary = None
+            postings.append(doc)
+
+    def rebuild(self, expenses):
+        """Re-index every expense from scratch"""
+        self.ids = array('q')
+        self.texts = []
+        self.short_docs = array('i')
+        self.trigram_postings = {}
+        self.token_postings = {}
+        self._vocabulary = None
+        for expense in expenses:
+            self.add(expense)
+
+    def _postings(self, mapping, key):
+        postings = mapping.get(key)
+        if postings is None:
+            return np.empty(0, dtype=np.int32)
+        return np.frombuffer(postings, dtype=np.int32)
+
+    def _prefix_docs(self, prefix):
+        """Documents with a word starting with prefix"""
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.token_postings)
+        start = bisect_left(self._vocabulary, prefix)
+        matches = []
+        for token in self._vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            matches.append(self._postings(self.token_postings, token))
+        if not matches:
+            return np.empty(0, dtype=np.int32)
+        if len(matches) == 1:
+            return matches[0]
+        return np.unique(np.concatenate(matches))
+
+    def _short_term_docs(self, term):
+        """Candidate documents for a term too short to have trigrams"""
+        matches = [self._postings(self.trigram_postings, gram)
+                   for gram in self.trigram_postings if term in gram]
+        matches.append(np.frombuffer(self.short_docs, dtype=np.int32))
+        return np.unique(np.concatenate(matches))
+
+    def _candidate_sets(self, terms, mode):
+        """One sorted array of candidate documents per term (per trigram in substring mode)"""
+        if mode == 'prefix':
+            return [self._prefix_docs(term) for term in terms]
+        candidate_sets = []
+        for term in terms:
+            grams = trigrams(term)
+            if grams:
+                candidate_sets.extend(self._postings(self.trigram_postings, gram) for gram in grams)
+            else:
+                candidate_sets.append(self._short_term_docs(term))
+        return candidate_sets
+
+    def estimate(self, query, mode='substring'):
+        """Cheap upper bound on the number of expenses a search can match"""
+        terms = query_terms(query, mode)
+        if not terms:
+            return 0
+        if mode != 'prefix':
+            # Terms too short for trigrams need a slow scan; the others bound the result
+            terms = [term for term in terms if len(term) >= 3]
+            if not terms:
+                return self.record_count
+        return min(len(candidates) for candidates in self._candidate_sets(terms, mode))
+
+    def search(self, query, limit=None, mode='substring'):
+        """Return ids of the expenses matching every term in query, best first
+
+        mode 'substring' matches terms anywhere in the description, mode
+        'prefix' matches terms against the start of words. Results are
+        ranked by how many terms match a whole word, newest first on ties.
+        """
+        terms = query_terms(query, mode)
+        if not terms:
+            return []
+        candidate_sets = self._candidate_sets(terms, mode)
+        # Intersect starting from the smallest set, by binary search
+        candidate_sets.sort(key=len)
+        docs = candidate_sets[0]
+        for candidates in candidate_sets[1:]:
+            if not len(docs):
+                return []
+            docs = docs[_members(docs, candidates)]
+
+        scores = np.zeros(len(docs), dtype=np.int32)
+        for term in terms:
+            scores += _members(docs, self._postings(self.token_postings, term))
+        ranked = docs[np.lexsort((-docs, -scores))]
+        if mode == 'prefix':
+            # Word postings are exact, nothing left to check
+            return [self.ids[doc] for doc in ranked[:limit]]
+
+        # Trigrams can all be present without the term itself, so confirm
+        # each candidate in rank order and stop once the limit is reached
+        results = []
+        for doc in ranked:
+            text = self.texts[doc]
+            if all(term in text for term in terms):
+                results.append(self.ids[doc])
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
+
+    def load(self):
+        """Read a persisted index; returns False if there is none"""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                self.ids = array('q', data['ids'].tobytes())
+                blob = data['texts'].tobytes().decode('utf-8')
+                self.texts = [sys.intern(text) for text in blob.split('\x00')] if self.ids else []
+                self.short_docs = array('i', data['short_docs'].tobytes())
+                self.trigram_postings = _unpack_postings(data, 'trigram')
+                self.token_postings = _unpack_postings(data, 'token')
+        except (OSError, ValueError, KeyError):
+            self.rebuild(())
+            return False
+        self._vocabulary = None
+        return True
+
+    def save(self):
+        if not self.path:
+            return
+        blob = '\x00'.join(self.texts).encode('utf-8')
+        arrays = {
+            'ids': np.frombuffer(self.ids, dtype=np.int64),
+            'texts': np.frombuffer(blob, dtype=np.uint8),
+            'short_docs': np.frombuffer(self.short_docs, dtype=np.int32),
+        }
+        arrays.update(_pack_postings(self.trigram_postings, 'trigram'))
+        arrays.update(_pack_postings(self.token_postings, 'token'))
+        tmp_path = f"{self.path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, self.path)
+
+    def sync(self, expenses):
+        """Bring a persisted index up to date with the loaded expenses"""
+        saved_count = self.record_count if self.load() else None
+        fresh = (
+            saved_count is not None and saved_count <= len(expenses)
+            and (saved_count == 0 or expenses[saved_count - 1]['id'] == self.last_id)
+        )
+        if fresh:
+            for expense in expenses[saved_count:]:
+                self.add(expense)
+        else:
+            self.rebuild(expenses)
+        if not fresh or self.record_count != saved_count:
+            try:
+                self.save()
+            except OSError:
+                # The index is only a cache; it is rebuilt next time
+                pass
+
+
+def _members(docs, postings):
+    """Mask of the sorted docs that also appear in the sorted postings"""
+    if not len(postings):
+        return np.zeros(len(docs), dtype=bool)
+    positions = np.minimum(np.searchsorted(postings, docs), len(postings) - 1)
+    return postings[positions] == docs
+
+
+def _pack_postings(postings, name):
+    """Flatten a key -> array('i') map into NumPy arrays"""
+    keys = list(postings)
+    lengths = np.fromiter((len(postings[key]) for key in keys), dtype=np.int64, count=len(keys))
+    flat = np.frombuffer(b''.join(postings[key].tobytes() for key in keys), dtype=np.int32)
+    key_blob = '\x00'.join(keys).encode('utf-8')
+    return {
+        f'{name}_keys': np.frombuffer(key_blob, dtype=np.uint8),
+        f'{name}_lengths': lengths,
+        f'{name}_postings': flat,
+    }
+
+
+def _unpack_postings(data, name):
+    keys = data[f'{name}_keys'].tobytes().decode('utf-8').split('\x00')
+    lengths = data[f'{name}_lengths']
+    if not len(lengths):
+        return {}
+    flat = data[f'{name}_postings']
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    return {
+        key: array('i', flat[offsets[i]:offsets[i + 1]].tobytes())
+        for i, key in enumerate(keys)
+    }
@@ -0,0 +1,491 @@
+import asyncio
+import functools
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+from urllib.parse import parse_qsl, urlsplit
+
+import expense_codec
+import expense_export
+import expense_import
+from expense_metrics import metrics
+from expense_query import FILTER_NAMES, ORDER_KEYS
+from expense_tracker import statistics_record, summary_record
+
+# Largest request body accepted, and most expenses in one POST /expenses
+MAX_BODY = 16 * 1024 * 1024
+MAX_BATCH = 10000
+MAX_PAGE_SIZE = 1000
+SEARCH_MODES = ('substring', 'prefix')
+EXPORT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+# Date filters: name, strptime layout, how to describe it in an error
+DATE_FILTERS = (
+    ('date', "%Y-%m-%d", "YYYY-MM-DD"),
+    ('start_date', "%Y-%m-%d", "YYYY-MM-DD"),
+    ('end_date', "%Y-%m-%d", "YYYY-MM-DD"),
+    ('month', "%Y-%m", "YYYY-MM"),
+)
+REASONS = {
+    200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found',
+    405: 'Method Not Allowed', 411: 'Length Required', 413: 'Payload Too Large',
+    500: 'Internal Server Error',
+}
+
+
+class HTTPError(Exception):
+    """Turned into a JSON error response with the given status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    """One parsed HTTP/1.1 request"""
+
+    def __init__(self, method, target, version, headers, body):
+        url = urlsplit(target)
+        self.method = method
+        self.path = url.path
+        self.query = dict(parse_qsl(url.query))
+        self.headers = headers
+        self.body = body
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.0':
+            self.keep_alive = connection == 'keep-alive'
+        else:
+            self.keep_alive = connection != 'close'
+
+
+class ExpenseServer:
+    """Headless HTTP/JSON API over one shared ExpenseTracker
+
+    Requests are parsed on an asyncio event loop; the tracker calls run on
+    a pool of `workers` threads so a slow query or export never stalls the
+    other connections. Connections are kept alive between requests. Every
+    request shares the tracker and its storage backend, and the tracker is
+    refreshed at most every `refresh_interval` seconds to pick up writes
+    from other processes.
+
+        GET  /health
+        POST /expenses              JSON list (or one object) of expenses
+        GET  /expenses              filters, q, mode, order, limit, cursor, page_size
+        GET  /expenses/summary      totals for the same filters
+        GET  /expenses/<id>
+        GET  /reports/<YYYY-MM>
+        GET  /statistics
+        GET  /export                format=csv|jsonl|parquet plus filters, streamed
+    """
+
+    def __init__(self, tracker, host='127.0.0.1', port=8080, workers=8, refresh_interval=1.0,
+                 idle_timeout=60.0):
+        self.tracker = tracker
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.refresh_interval = refresh_interval
+        self.idle_timeout = idle_timeout
+        self.executor = None
+        self.server = None
+        self._connections = {}
+        self._refreshed = 0.0
+        self._refresh_lock = threading.Lock()
+        self._routes = {
+            'health': {'GET': self.health},
+            'expenses': {'GET': self.find, 'POST': self.add},
+            'expenses/summary': {'GET': self.summary},
+            'expenses/*': {'GET': self.get},
+            'reports/*': {'GET': self.report},
+            'statistics': {'GET': self.statistics},
+            'export': {'GET': self.export},
+        }
+
+    async def start(self):
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix='expense-api')
+        self.server = await asyncio.start_server(self._serve_connection, self.host, self.port)
+        # Port 0 picks a free port; report the real one
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        """Stop listening, close the open connections and wait for their handlers"""
+        if self.server is not None:
+            self.server.close()
+        # Idle connections see end-of-file and their handlers return
+        for writer in self._connections.values():
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+    # Connection handling
+
+    async def _serve_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self.idle_timeout)
+                except HTTPError as e:
+                    await self._send_json(writer, e.status, {'error': str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                started = time.perf_counter()
+                try:
+                    await self._dispatch(request, writer)
+                except HTTPError as e:
+                    await self._send_json(writer, e.status, {'error': str(e)}, request.keep_alive)
+                except ConnectionError:
+                    raise
+                except Exception as e:
+                    metrics.count('server.errors')
+                    await self._send_json(writer, 500, {'error': f"{type(e).__name__}: {e}"},
+                                          request.keep_alive)
+                if metrics.enabled:
+                    metrics.observe(f"server.{request.method} {self._route_name(request.path)}",
+                                    time.perf_counter() - started)
+                if not request.keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self._connections[task]
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _read_request(self, reader):
+        try:
+            line = await reader.readline()
+            if not line:
+                return None
+            try:
+                method, target, version = line.decode('latin-1').split()
+            except ValueError:
+                raise HTTPError(400, "Malformed request line") from None
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+        except (ValueError, asyncio.LimitOverrunError):
+            raise HTTPError(400, "Request line or header too long") from None
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            raise HTTPError(411, "Send the body with a Content-Length")
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length") from None
+        if length > MAX_BODY:
+            raise HTTPError(413, f"Request bodies are limited to {MAX_BODY} bytes")
+        body = await reader.readexactly(length) if length else b''
+        return Request(method.upper(), target, version, headers, body)
+
+    def _route_name(self, path):
+        parts = path.strip('/').split('/')
+        name = '/'.join(parts)
+        if name not in self._routes and len(parts) == 2:
+            name = f"{parts[0]}/*"
+        return name
+
+    async def _dispatch(self, request, writer):
+        handlers = self._routes.get(self._route_name(request.path))
+        if handlers is None:
+            raise HTTPError(404, f"No such endpoint: {request.path}")
+        handler = handlers.get(request.method)
+        if handler is None:
+            raise HTTPError(405, f"{request.path} accepts {', '.join(handlers)}")
+        if handler is not self.health:
+            await self._run(self._refresh)
+        result = await handler(request, writer)
+        if result is not None:
+            status, payload = result
+            await self._send_json(writer, status, payload, request.keep_alive)
+
+    async def _run(self, func, *args, **kwargs):
+        """Run a blocking tracker call on the worker pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._refreshed < self.refresh_interval:
+            return
+        with self._refresh_lock:
+            if now - self._refreshed < self.refresh_interval:
+                return
+            self.tracker.refresh()
+            self._refreshed = time.monotonic()
+
+    def _reading(self, from_storage=False):
+        """Lock to hold while reading the tracker's in-memory state
+
+        Reads that a queryable backend answers from storage run side by
+        side (with pool_reads each worker has its own connection). Anything
+        reading the store or rollups, which writes update in place, waits
+        for the tracker lock.
+        """
+        if from_storage and self.tracker.storage.queryable:
+            return nullcontext()
+        return self.tracker.lock
+
+    @staticmethod
+    def _head(status, content_type, keep_alive, length=None):
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", f"Content-Type: {content_type}"]
+        if length is None:
+            lines.append("Transfer-Encoding: chunked")
+        else:
+            lines.append(f"Content-Length: {length}")
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def _send_json(self, writer, status, payload, keep_alive):
+        body = expense_codec.dumps(payload, pretty=False)
+        writer.write(self._head(status, 'application/json', keep_alive, len(body)) + body)
+        await writer.drain()
+
+    # Endpoints
+
+    async def health(self, request, writer):
+        return 200, {'status': 'ok', 'version': self.tracker.version}
+
+    async def add(self, request, writer):
+        try:
+            rows = expense_codec.loads(request.body)
+        except ValueError as e:
+            raise HTTPError(400, f"Body is not valid JSON: {e}") from None
+        if isinstance(rows, dict):
+            rows = rows['expenses'] if isinstance(rows.get('expenses'), list) else [rows]
+        if not isinstance(rows, list):
+            raise HTTPError(400, "Send an expense object or a list of them")
+        if len(rows) > MAX_BATCH:
+            raise HTTPError(413, f"At most {MAX_BATCH} expenses per request")
+        # Error messages name the 1-based position of the rejected expense
+        result = expense_import.ImportResult()
+        expenses = expense_import.validate_batch(enumerate(rows, 1), self.tracker.categories, result)
+        alerts = await self._run(self.tracker.record_expenses, expenses) if expenses else []
+        payload = {
+            'added': len(expenses),
+            'ids': [expense['id'] for expense in expenses],
+            'rejected': result.rejected,
+            'errors': result.errors,
+            'budget_alerts': alerts,
+        }
+        return (201 if expenses or not rows else 400), payload
+
+    async def find(self, request, writer):
+        params = request.query
+        filters = _filters(params)
+        query = self.tracker.query().where(**filters)
+        if params.get('q'):
+            mode = params.get('mode', 'substring')
+            if mode not in SEARCH_MODES:
+                raise HTTPError(400, f"mode must be one of {', '.join(SEARCH_MODES)}")
+            query = query.text(params['q'], mode)
+        if params.get('order'):
+            if params['order'].lstrip('-') not in ORDER_KEYS:
+                raise HTTPError(400, f"order must be one of {', '.join(ORDER_KEYS)}, optionally prefixed with -")
+            query = query.order_by(params['order'])
+        if params.get('limit'):
+            query = query.limit(_int_param(params, 'limit'))
+        cursor = _int_param(params, 'cursor') if params.get('cursor') else None
+        page_size = min(_int_param(params, 'page_size', 50), MAX_PAGE_SIZE)
+
+        def page():
+            with self._reading(from_storage=True):
+                return query.page(cursor, page_size)
+
+        expenses, next_cursor = await self._run(page)
+        return 200, {'expenses': expenses, 'next_cursor': next_cursor}
+
+    async def summary(self, request, writer):
+        filters = _filters(request.query)
+
+        def summarize():
+            # Whole months come from the rollups
+            with self._reading(from_storage=not set(filters) <= {'month'}):
+                return self.tracker.summarize(**filters)
+
+        return 200, summary_record(await self._run(summarize))
+
+    async def get(self, request, writer):
+        try:
+            expense_id = int(request.path.rstrip('/').rsplit('/', 1)[1])
+        except ValueError:
+            raise HTTPError(404, f"No such endpoint: {request.path}") from None
+
+        def get():
+            with self._reading(from_storage=True):
+                return self.tracker.get_expense(expense_id)
+
+        expense = await self._run(get)
+        if expense is None:
+            raise HTTPError(404, f"No expense with id {expense_id}")
+        return 200, expense
+
+    async def report(self, request, writer):
+        month = request.path.rstrip('/').rsplit('/', 1)[1]
+        try:
+            month = datetime.strptime(month, "%Y-%m").strftime("%Y-%m")
+        except ValueError:
+            raise HTTPError(400, "Reports are per month: /reports/YYYY-MM") from None
+        top = _int_param(request.query, 'top', 5)
+
+        def report():
+            with self._reading():
+                return self.tracker.monthly_report(month, top)
+
+        return 200, await self._run(report)
+
+    async def statistics(self, request, writer):
+        stats = await self._run(self.tracker.statistics, _int_param(request.query, 'top', 5))
+        return 200, statistics_record(stats)
+
+    async def export(self, request, writer):
+        format = request.query.get('format', 'csv')
+        if format not in EXPORT_TYPES:
+            raise HTTPError(400, f"format must be one of {', '.join(EXPORT_TYPES)}")
+        filters = _filters(request.query)
+        chunk_size = min(_int_param(request.query, 'chunk_size', 10000), 100000)
+        if format == 'parquet':
+            await self._send_parquet(request, writer, filters, chunk_size)
+        else:
+            await self._stream_text(request, writer, format, filters, chunk_size)
+
+    async def _stream_text(self, request, writer, format, filters, chunk_size):
+        """Send CSV or JSON lines with chunked encoding as a worker produces them"""
+        loop = asyncio.get_running_loop()
+        # A few chunks of read-ahead; the worker waits while the client is slow
+        chunks = asyncio.Queue(maxsize=4)
+        stop = threading.Event()
+
+        def put(item):
+            asyncio.run_coroutine_threadsafe(chunks.put(item), loop).result()
+
+        def produce():
+            try:
+                records = self.tracker.iter_expenses(**filters)
+                if format == 'csv':
+                    texts = expense_export.csv_chunks(records, chunk_size)
+                else:
+                    texts = expense_export.jsonl_chunks(records, chunk_size)
+                for text in texts:
+                    if stop.is_set():
+                        return
+                    put(text.encode('utf-8'))
+            finally:
+                put(None)
+
+        producer = loop.run_in_executor(self.executor, produce)
+        sent_head = False
+        chunk = b''
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                if not sent_head:
+                    writer.write(self._head(200, EXPORT_TYPES[format], request.keep_alive))
+                    sent_head = True
+                writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                await writer.drain()
+        finally:
+            stop.set()
+            while chunk is not None:
+                chunk = await chunks.get()
+        try:
+            await producer
+        except Exception:
+            if sent_head:
+                # Too late for an error status; a cut-off body tells the client
+                raise ConnectionAbortedError("Export failed mid-stream") from None
+            raise
+        if not sent_head:
+            writer.write(self._head(200, EXPORT_TYPES[format], request.keep_alive))
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    async def _send_parquet(self, request, writer, filters, chunk_size):
+        """Parquet needs the whole file for its footer, so write it to disk first"""
+        handle, path = tempfile.mkstemp(suffix='.parquet')
+        os.close(handle)
+        try:
+            try:
+                await self._run(self.tracker.export_expenses, path, 'parquet', chunk_size, **filters)
+            except ImportError as e:
+                raise HTTPError(400, str(e)) from None
+            size = os.path.getsize(path)
+            writer.write(self._head(200, EXPORT_TYPES['parquet'], request.keep_alive, size))
+            with open(path, 'rb') as file:
+                while True:
+                    data = await self._run(file.read, 1024 * 1024)
+                    if not data:
+                        break
+                    writer.write(data)
+                    await writer.drain()
+        finally:
+            os.remove(path)
+
+
+def _int_param(params, name, default=None):
+    try:
+        value = int(params[name]) if name in params else default
+    except ValueError:
+        raise HTTPError(400, f"{name} must be a whole number") from None
+    if value is not None and value < 0:
+        raise HTTPError(400, f"{name} cannot be negative")
+    return value
+
+
+def _filters(params):
+    """The standard expense filters present in the query string"""
+    filters = {name: params[name] for name in FILTER_NAMES if params.get(name)}
+    for name in ('min_amount', 'max_amount'):
+        if name in filters:
+            try:
+                filters[name] = float(filters[name])
+            except ValueError:
+                raise HTTPError(400, f"{name} must be a number") from None
+    for name, layout, shown in DATE_FILTERS:
+        if name in filters:
+            try:
+                filters[name] = datetime.strptime(filters[name], layout).strftime(layout)
+            except ValueError:
+                raise HTTPError(400, f"{name} must be {shown}") from None
+    return filters
+
+
+def serve(tracker, host='127.0.0.1', port=8080, workers=8):
+    """Run an ExpenseServer until interrupted"""
+    async def run():
+        server = await ExpenseServer(tracker, host, port, workers).start()
+        print(f"Serving the expense API on http://{server.host}:{server.port} "
+              f"with {workers} workers (Ctrl+C to stop)")
+        await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
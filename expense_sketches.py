@@ -0,0 +1,432 @@
+import hashlib
+import heapq
+import math
+import os
+import random
+from collections import Counter
+
+import numpy as np
+
+import expense_codec
+from expense_store import ExpenseStore
+
+PERCENTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+def text_hash(text):
+    """Stable 64-bit hash of a string, the same in every process"""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class KLLSketch:
+    """Streaming quantiles in a bounded number of retained values (Karnin, Lang and Liberty)
+
+    Values land in level 0; a full level is sorted and every other value
+    moves up one level, where it stands for twice as many values. Level
+    capacities shrink by 2/3 per level below the top, so about 3k values
+    are kept for any count. A quantile's rank is off by at most
+    `rank_error` times the count, with 99% confidence.
+    """
+
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.levels = [[]]
+        self._random = random.Random(seed)
+        self._size = 0
+        self._max_size = self._capacity(0)
+        self._sorted = None
+
+    @property
+    def rank_error(self):
+        return 2.296 / self.k ** 0.9723
+
+    @classmethod
+    def from_sorted(cls, values, k=200):
+        """Build a sketch from a whole batch of sorted values at once"""
+        sketch = cls(k)
+        n = len(values)
+        if not n:
+            return sketch
+        level = 0
+        while n >> level > k:
+            level += 1
+        step = 1 << level
+        sketch.levels = [[] for _ in range(level)] + [values[step // 2::step].tolist()]
+        sketch.count = n
+        sketch.min, sketch.max = float(values[0]), float(values[-1])
+        sketch._resize()
+        return sketch
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return int(math.ceil(self.k * (2 / 3) ** depth)) + 1
+
+    def _resize(self):
+        self._size = sum(len(items) for items in self.levels)
+        self._max_size = sum(self._capacity(level) for level in range(len(self.levels)))
+        self._sorted = None
+
+    def add(self, value):
+        self.levels[0].append(value)
+        self.count += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self._size += 1
+        self._sorted = None
+        if self._size >= self._max_size:
+            self._compact()
+
+    def _compact(self):
+        for level, items in enumerate(self.levels):
+            if len(items) < self._capacity(level):
+                continue
+            if level + 1 == len(self.levels):
+                self.levels.append([])
+            items.sort()
+            # An odd value out stays behind, so the total weight is unchanged
+            keep = len(items) % 2
+            self.levels[level + 1].extend(items[keep + self._random.getrandbits(1)::2])
+            del items[keep:]
+            break
+        self._resize()
+
+    def _weighted(self):
+        """Retained values in order, with the cumulative weight up to each"""
+        if self._sorted is None:
+            pairs = sorted((value, 1 << level) for level, items in enumerate(self.levels) for value in items)
+            values = np.array([value for value, _ in pairs], dtype=np.float64)
+            weights = np.cumsum([weight for _, weight in pairs], dtype=np.int64)
+            self._sorted = values, weights
+        return self._sorted
+
+    def quantile(self, q):
+        """Approximate value below which a fraction q of the values fall"""
+        if not self.count:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        values, weights = self._weighted()
+        position = np.searchsorted(weights, q * weights[-1], side='left')
+        return float(values[min(position, len(values) - 1)])
+
+    def to_dict(self):
+        return {'k': self.k, 'count': self.count, 'min': self.min, 'max': self.max, 'levels': self.levels}
+
+    @classmethod
+    def from_dict(cls, data):
+        # Seeded by the count so a reloaded sketch compacts like a rebuilt one
+        sketch = cls(data['k'], seed=data['count'])
+        sketch.count, sketch.min, sketch.max = data['count'], data['min'], data['max']
+        sketch.levels = [list(items) for items in data['levels']]
+        sketch._resize()
+        return sketch
+
+
+class SpaceSaving:
+    """Most frequent items in `capacity` counters (Metwally, Agrawal and El Abbadi)
+
+    A new item takes over the smallest counter and inherits its count as
+    its possible overcount, so every count is an upper bound that is at
+    most total / capacity too high, and any item more frequent than that
+    is guaranteed to be tracked.
+    """
+
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self.total = 0
+        # item -> [count, overcount]
+        self.counters = {}
+        # (count, item) for every counter; entries go stale as counts grow
+        self._heap = []
+
+    @property
+    def max_error(self):
+        return self.total / self.capacity
+
+    def add(self, item, count=1):
+        self.total += count
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += count
+        elif len(self.counters) < self.capacity:
+            counter = self.counters[item] = [count, 0]
+        else:
+            floor, victim = self._pop_smallest()
+            del self.counters[victim]
+            counter = self.counters[item] = [floor + count, floor]
+        heapq.heappush(self._heap, (counter[0], item))
+        if len(self._heap) > 4 * self.capacity:
+            self._reheap()
+
+    def _pop_smallest(self):
+        while True:
+            count, item = heapq.heappop(self._heap)
+            counter = self.counters.get(item)
+            if counter is not None and counter[0] == count:
+                return count, item
+
+    def _reheap(self):
+        self._heap = [(counter[0], item) for item, counter in self.counters.items()]
+        heapq.heapify(self._heap)
+
+    def top(self, n=10):
+        """[(item, count, overcount)], most frequent first"""
+        ranked = sorted(self.counters.items(), key=lambda entry: (-entry[1][0], entry[0]))[:n]
+        return [(item, count, error) for item, (count, error) in ranked]
+
+    def to_dict(self):
+        return {'capacity': self.capacity, 'total': self.total,
+                'counters': [[item, count, error] for item, (count, error) in self.counters.items()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['capacity'])
+        sketch.total = data['total']
+        sketch.counters = {item: [count, error] for item, count, error in data['counters']}
+        sketch._reheap()
+        return sketch
+
+
+class CountMinSketch:
+    """Frequency of any item, never under and at most epsilon * total over with probability 1 - delta"""
+
+    def __init__(self, epsilon=0.001, delta=0.01):
+        self.epsilon = epsilon
+        self.delta = delta
+        self.total = 0
+        width = int(math.ceil(math.e / epsilon))
+        depth = int(math.ceil(math.log(1 / delta)))
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self._rows = np.arange(depth)
+
+    @property
+    def max_error(self):
+        return self.epsilon * self.total
+
+    def _cells(self, key_hash):
+        # Double hashing: row i uses h1 + i * h2
+        width = self.table.shape[1]
+        return ((key_hash & 0xFFFFFFFF) + self._rows * ((key_hash >> 32) | 1)) % width
+
+    def add(self, key_hash, count=1):
+        self.total += count
+        self.table[self._rows, self._cells(key_hash)] += count
+
+    def estimate(self, key_hash):
+        return int(self.table[self._rows, self._cells(key_hash)].min())
+
+    def to_dict(self):
+        return {'epsilon': self.epsilon, 'delta': self.delta, 'total': self.total, 'table': self.table.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['epsilon'], data['delta'])
+        sketch.total = data['total']
+        sketch.table = np.array(data['table'], dtype=np.int64).reshape(sketch.table.shape)
+        return sketch
+
+
+class HyperLogLog:
+    """Distinct-count estimate with a relative standard error of 1.04 / sqrt(2 ** precision)"""
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @property
+    def std_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add(self, key_hash):
+        rest_bits = 64 - self.precision
+        index = key_hash >> rest_bits
+        rest = key_hash & ((1 << rest_bits) - 1)
+        rank = rest_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int32))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Small-range correction: linear counting
+            return m * math.log(m / zeros)
+        return raw
+
+    def to_dict(self):
+        return {'precision': self.precision, 'registers': self.registers.tobytes().hex()}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['precision'])
+        sketch.registers = np.frombuffer(bytes.fromhex(data['registers']), dtype=np.uint8).copy()
+        return sketch
+
+
+class Sketches:
+    """Streaming summaries answering rich statistics in constant time
+
+    Amount quantiles overall and per category (KLL), the most frequent
+    descriptions (space-saving, tightened by a count-min sketch) and
+    distinct descriptions per category (HyperLogLog). Like Rollups they
+    are updated as expenses are added and persisted next to the data, so
+    statistics never look at the records themselves.
+    """
+
+    def __init__(self, path=None, k=200, top_capacity=100, precision=12):
+        self.path = path
+        self.k = k
+        self.top_capacity = top_capacity
+        self.precision = precision
+        self.rebuild(())
+
+    def add(self, expense):
+        """Update every sketch for one new expense"""
+        amount = expense['amount']
+        category = expense['category']
+        key_hash = text_hash(expense['description'])
+        self.amounts.add(amount)
+        self._category_amounts(category).add(amount)
+        self.descriptions.add(expense['description'])
+        self.frequencies.add(key_hash)
+        self._category_distinct(category).add(key_hash)
+        self.record_count += 1
+        self.last_id = expense['id']
+
+    def _category_amounts(self, category):
+        sketch = self.category_amounts.get(category)
+        if sketch is None:
+            sketch = self.category_amounts[category] = KLLSketch(self.k)
+        return sketch
+
+    def _category_distinct(self, category):
+        sketch = self.distinct.get(category)
+        if sketch is None:
+            sketch = self.distinct[category] = HyperLogLog(self.precision)
+        return sketch
+
+    def rebuild(self, expenses):
+        """Recompute every sketch from scratch, exactly where a batch allows it"""
+        self.record_count = 0
+        self.last_id = None
+        self.amounts = KLLSketch(self.k)
+        self.category_amounts = {}
+        self.descriptions = SpaceSaving(self.top_capacity)
+        self.frequencies = CountMinSketch()
+        self.distinct = {}
+        store = expenses if isinstance(expenses, ExpenseStore) else ExpenseStore(expenses)
+        if not len(store):
+            return
+        amounts, codes = store.amounts, store.categories
+        descriptions = list(store.descriptions)
+        self.amounts = KLLSketch.from_sorted(np.sort(amounts), self.k)
+        for code, category in enumerate(store.category_names):
+            selected = amounts[codes == code]
+            if len(selected):
+                self.category_amounts[category] = KLLSketch.from_sorted(np.sort(selected), self.k)
+
+        # Every description is hashed once, however often it repeats
+        frequency = Counter(descriptions)
+        hashes = {text: text_hash(text) for text in frequency}
+        for text, count in frequency.most_common(self.top_capacity):
+            self.descriptions.add(text, count)
+        self.descriptions.total = len(descriptions)
+        for text, count in frequency.items():
+            self.frequencies.add(hashes[text], count)
+        for code, text in set(zip(codes.tolist(), descriptions)):
+            self._category_distinct(store.category_names[code]).add(hashes[text])
+        self.record_count = len(store)
+        self.last_id = int(store.ids[-1])
+
+    def statistics(self, top=10, percentiles=PERCENTILES):
+        """Percentiles, top descriptions and distinct counts, each with its error bound"""
+        top_descriptions = []
+        for text, count, overcount in self.descriptions.top(top):
+            # Both sketches only ever overcount, so the smaller is the better bound
+            count = min(count, self.frequencies.estimate(text_hash(text)))
+            top_descriptions.append({'description': text, 'count': count, 'at_least': max(count - overcount, 0)})
+        return {
+            'count': self.record_count,
+            'min': self.amounts.min,
+            'max': self.amounts.max,
+            'percentiles': {q: self.amounts.quantile(q) for q in percentiles},
+            'category_medians': {category: sketch.quantile(0.5)
+                                 for category, sketch in sorted(self.category_amounts.items())},
+            'rank_error': self.amounts.rank_error,
+            'top_descriptions': top_descriptions,
+            'description_count_error': min(self.descriptions.max_error, self.frequencies.max_error),
+            'distinct_descriptions': {category: round(sketch.estimate())
+                                      for category, sketch in sorted(self.distinct.items())},
+            'distinct_error': 1.04 / math.sqrt(1 << self.precision),
+        }
+
+    def description_count(self, description):
+        """Upper bound on how many expenses have exactly this description"""
+        return self.frequencies.estimate(text_hash(description))
+
+    def load(self):
+        """Read persisted sketches; returns False if there are none"""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'rb') as file:
+                data = expense_codec.loads(file.read())
+            self.record_count = data['record_count']
+            self.last_id = data['last_id']
+            self.amounts = KLLSketch.from_dict(data['amounts'])
+            self.category_amounts = {category: KLLSketch.from_dict(sketch)
+                                     for category, sketch in data['category_amounts'].items()}
+            self.descriptions = SpaceSaving.from_dict(data['descriptions'])
+            self.frequencies = CountMinSketch.from_dict(data['frequencies'])
+            self.distinct = {category: HyperLogLog.from_dict(sketch)
+                             for category, sketch in data['distinct'].items()}
+        except (ValueError, KeyError, TypeError):
+            self.rebuild(())
+            return False
+        return True
+
+    def save(self):
+        if not self.path:
+            return
+        data = {
+            'record_count': self.record_count,
+            'last_id': self.last_id,
+            'amounts': self.amounts.to_dict(),
+            'category_amounts': {category: sketch.to_dict() for category, sketch in self.category_amounts.items()},
+            'descriptions': self.descriptions.to_dict(),
+            'frequencies': self.frequencies.to_dict(),
+            'distinct': {category: sketch.to_dict() for category, sketch in self.distinct.items()},
+        }
+        # Unique per process, so concurrent savers never share a temp file
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(expense_codec.dumps(data, pretty=False))
+        os.replace(tmp_path, self.path)
+
+    def sync(self, expenses):
+        """Bring persisted sketches up to date with the loaded expenses (see Rollups.sync)"""
+        saved_count = self.record_count if self.load() else None
+        fresh = (
+            saved_count is not None and saved_count <= len(expenses)
+            and (saved_count == 0 or expenses[saved_count - 1]['id'] == self.last_id)
+        )
+        if fresh:
+            for expense in expenses[saved_count:]:
+                self.add(expense)
+        else:
+            self.rebuild(expenses)
+        if not fresh or self.record_count != saved_count:
+            try:
+                self.save()
+            except OSError:
+                # The sketches are only a cache; they are rebuilt next time
+                pass
@@ -0,0 +1,157 @@
+import mmap
+import os
+import struct
+
+import numpy as np
+
+import expense_codec
+from expense_store import ExpenseStore
+
+MAGIC = b'EXPSNAP1'
+_HEADER_LENGTH = struct.Struct('<Q')
+_ALIGN = 8
+
+# Column name -> dtype, in file order
+COLUMNS = (
+    ('ids', '<i8'),
+    ('dates', '<i4'),
+    ('amounts', '<f8'),
+    ('categories', 'i1'),
+    ('date_order', '<i8'),
+    ('sorted_dates', '<i4'),
+    ('description_offsets', '<i8'),
+)
+
+
+class SnapshotError(ValueError):
+    """A binary snapshot that cannot be read"""
+
+
+class StringHeap:
+    """Descriptions decoded lazily from one UTF-8 buffer
+
+    String i is buffer[start + offsets[i]:start + offsets[i + 1]]. Nothing
+    is decoded until a string is accessed, and strings appended later are
+    kept in a list.
+    """
+
+    def __init__(self, buffer, offsets, start=0):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.start = start
+        self.mapped = len(offsets) - 1
+        self.added = []
+
+    def __len__(self):
+        return self.mapped + len(self.added)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if i >= self.mapped:
+            return self.added[i - self.mapped]
+        start = self.start
+        return self.buffer[start + int(self.offsets[i]):start + int(self.offsets[i + 1])].decode('utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def append(self, text):
+        self.added.append(text)
+
+
+def write_snapshot(path, store, source_stamp=None):
+    """Write an ExpenseStore as a binary snapshot
+
+    The file is a small JSON header followed by one fixed-width column per
+    field, the date index, and a heap holding every description. The
+    header records `source_stamp`, the stamp of the JSON file the snapshot
+    mirrors, so a reader can tell when it has gone stale.
+    """
+    encoded = [text.encode('utf-8') for text in store.descriptions]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(text) for text in encoded], out=offsets[1:])
+    date_order, sorted_dates = store._date_index()
+    arrays = {
+        'ids': store.ids,
+        'dates': store.dates,
+        'amounts': store.amounts,
+        'categories': store.categories,
+        'date_order': date_order,
+        'sorted_dates': sorted_dates,
+        'description_offsets': offsets,
+    }
+    layout = {}
+    position = 0
+    for name, dtype in COLUMNS:
+        size = len(arrays[name]) * np.dtype(dtype).itemsize
+        layout[name] = [position, len(arrays[name])]
+        position += _padded(size)
+    header = expense_codec.dumps({
+        'count': len(store),
+        'source_stamp': list(source_stamp) if source_stamp else None,
+        'categories': store.category_names,
+        'columns': layout,
+        'heap': [position, int(offsets[-1])],
+    }, pretty=False)
+    body_start = _padded(len(MAGIC) + _HEADER_LENGTH.size + len(header))
+
+    # Unique per process, so concurrent writers never share a temp file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(MAGIC + _HEADER_LENGTH.pack(len(header)) + header)
+        file.write(b'\0' * (body_start - file.tell()))
+        for name, dtype in COLUMNS:
+            data = np.ascontiguousarray(arrays[name], dtype=dtype).tobytes()
+            file.write(data + b'\0' * (_padded(len(data)) - len(data)))
+        for text in encoded:
+            file.write(text)
+    os.replace(tmp_path, path)
+
+
+def open_snapshot(path, source_stamp=None):
+    """Map a binary snapshot as an ExpenseStore, or return None if missing or stale
+
+    The columns are NumPy views straight onto the mapped file and
+    descriptions are decoded on access, so opening costs the same for
+    any number of records; pages are read in as queries touch them.
+    """
+    try:
+        file = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    with file:
+        header, body_start = _parse_header(file.read(len(MAGIC) + _HEADER_LENGTH.size), file)
+        if source_stamp is not None and header['source_stamp'] != list(source_stamp):
+            return None
+        # The map stays valid after the file is closed or replaced
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    columns = {}
+    try:
+        for name, dtype in COLUMNS:
+            offset, count = header['columns'][name]
+            columns[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=body_start + offset)
+        heap_start = body_start + header['heap'][0]
+    except (KeyError, ValueError, TypeError) as e:
+        raise SnapshotError(f"Corrupt snapshot {path}: {e}") from None
+    return ExpenseStore.from_columns(
+        columns['ids'], columns['dates'], columns['amounts'], columns['categories'],
+        header['categories'], StringHeap(buffer, columns['description_offsets'], heap_start),
+        columns['date_order'], columns['sorted_dates'],
+    )
+
+
+def _parse_header(prefix, file):
+    if len(prefix) < len(MAGIC) + _HEADER_LENGTH.size or not prefix.startswith(MAGIC):
+        raise SnapshotError(f"Not an expense snapshot: {file.name}")
+    (length,) = _HEADER_LENGTH.unpack_from(prefix, len(MAGIC))
+    try:
+        header = expense_codec.loads(file.read(length))
+    except ValueError as e:
+        raise SnapshotError(f"Corrupt snapshot header in {file.name}: {e}") from None
+    return header, _padded(len(prefix) + length)
+
+
+def _padded(size):
+    return -(-size // _ALIGN) * _ALIGN
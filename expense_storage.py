@@ -0,0 +1,1291 @@
+import heapq
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+from itertools import islice
+
+import numpy as np
+
+import expense_codec
+import expense_snapshot
+from expense_metrics import metrics
+from expense_query import sql_where
+from expense_store import ExpenseStore
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Advisory lock shared by every process using the same lock file
+
+    Uses flock() on POSIX and msvcrt.locking() on Windows. The lock is
+    re-entrant within a process, so a locked operation can call another.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                with metrics.timer('storage.lock_wait'):
+                    self._file = _lock_file(self.path)
+            except BaseException:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._depth -= 1
+        if self._depth == 0:
+            _unlock_file(self._file)
+            self._file = None
+        self._thread_lock.release()
+        return False
+
+
+class Storage:
+    """Base class for expense storage backends"""
+
+    # Queryable backends answer find()/summarize() themselves instead of
+    # having the tracker hold every record in memory
+    queryable = False
+    data_file = None
+    # version() as of the last time this process had every stored record
+    # in memory; when version() moves away from it, someone else wrote
+    synced_version = None
+    # 'fsync': a commit is on disk when append_many() returns.
+    # 'os': a commit is handed to the operating system without waiting
+    # for the disk, so it survives a crash of this process but not a
+    # power failure.
+    durability = 'fsync'
+
+    def sidecar_path(self, suffix):
+        """Path for a derived file stored next to the data, if on disk"""
+        if not self.data_file or self.data_file == ':memory:':
+            return None
+        return self.data_file + suffix
+
+    def lock(self):
+        """Context manager holding off writers in other processes"""
+        return nullcontext()
+
+    def set_durability(self, durability):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"Unknown durability level: {durability}")
+        self.durability = durability
+
+    def load(self):
+        """Return the list of stored expenses"""
+        raise NotImplementedError
+
+    def append(self, expense):
+        """Persist a single new expense"""
+        raise NotImplementedError
+
+    def append_many(self, expenses):
+        """Persist a batch of new expenses in one commit
+
+        Expenses whose id is None are given the next free ids, in place.
+        """
+        for expense in expenses:
+            self.append(expense)
+
+    def save(self, expenses):
+        """Persist the complete list of expenses"""
+        raise NotImplementedError
+
+    def should_compact(self):
+        """Return True when the backend wants a full save"""
+        return False
+
+    def version(self):
+        """Cheap stamp of the stored data that changes whenever it is written"""
+        return None
+
+    def close(self):
+        """Release any resources held by the backend"""
+
+
+class JsonStorage(Storage):
+    """Single JSON file, rewritten in full on every change
+
+    Every write happens under the file lock and starts from the file's
+    current contents, so writers in other processes are merged rather
+    than overwritten.
+    """
+
+    def __init__(self, data_file='expenses.json', pretty=None):
+        self.data_file = data_file
+        self.id_file = data_file + '.ids'
+        self.pretty = pretty
+        self._lock = FileLock(data_file + '.lock')
+        self._expenses = []
+        self.reads = 0
+
+    def lock(self):
+        return self._lock
+
+    def load(self):
+        with self._lock:
+            self.reads += 1
+            self._expenses = self._read()
+            self.synced_version = self.version()
+        return self._expenses
+
+    def _read(self):
+        if not os.path.exists(self.data_file):
+            return []
+        with open(self.data_file, 'rb') as file:
+            return expense_codec.load_expenses(file.read())
+
+    def append(self, expense):
+        self.append_many([expense])
+
+    def append_many(self, expenses):
+        with self._lock:
+            in_sync = self.version() == self.synced_version
+            if not in_sync:
+                self._expenses = self._read()
+            last_id = max(_read_last_id(self.id_file) or 0,
+                          max((expense['id'] for expense in self._expenses), default=0))
+            unassigned = [expense for expense in expenses if expense.get('id') is None]
+            last_id = _assign_ids(expenses, last_id)
+            # The cached list only takes the records once they are on disk,
+            # so a failed write cannot leak them into the next one
+            new = self._expenses + list(expenses)
+            try:
+                _atomic_write_json(self.data_file, new, sync=self.durability == 'fsync', pretty=self.pretty)
+            except BaseException:
+                for expense in unassigned:
+                    expense['id'] = None
+                raise
+            self._expenses = new
+            _write_last_id(self.id_file, last_id)
+            if in_sync:
+                self.synced_version = self.version()
+
+    def save(self, expenses):
+        with self._lock:
+            in_sync = self.version() == self.synced_version
+            expenses = list(expenses)
+            if not in_sync:
+                expenses = _merge(self._read(), expenses)
+            self._expenses = expenses
+            _atomic_write_json(self.data_file, self._expenses, pretty=self.pretty)
+            if in_sync:
+                self.synced_version = self.version()
+
+    def version(self):
+        return _file_stamp(self.data_file)
+
+
+class JournalStorage(Storage):
+    """JSON snapshot plus an append-only JSON-lines journal
+
+    New expenses are appended to the journal as one line each, so adding a
+    record costs O(1) I/O. Once the journal holds `compact_every` entries the
+    owner should call save() to fold it into the snapshot. The snapshot is
+    the plain JSON array the tracker has always written, so an existing
+    expenses.json is picked up unchanged on first load.
+
+    Loads, appends and compactions hold the file lock, so any number of
+    processes can share the files. Ids come from a counter file updated in
+    the same critical section as the append, and a compaction started by a
+    process that missed someone else's appends merges them in.
+
+    Every snapshot is mirrored by a binary copy (expenses.json.snap, see
+    expense_snapshot) that load() maps instead of parsing the JSON, and
+    returns as an ExpenseStore. The copy records the stamp of the JSON file
+    it was made from, so an edited or replaced expenses.json is parsed
+    again and the copy rewritten. Pass binary_snapshot=False to skip it.
+    """
+
+    def __init__(self, data_file='expenses.json', journal_file=None, compact_every=1000, pretty=None,
+                 binary_snapshot=True):
+        self.data_file = data_file
+        self.journal_file = journal_file or data_file + '.journal'
+        self.id_file = data_file + '.ids'
+        self.snapshot_file = self.sidecar_path('.snap') if binary_snapshot else None
+        self.compact_every = compact_every
+        self.pretty = pretty
+        self.journal_entries = 0
+        self._lock = FileLock(data_file + '.lock')
+        self.reads = 0
+
+    def lock(self):
+        return self._lock
+
+    def load(self):
+        with self._lock:
+            self.reads += 1
+            expenses = self._read_all()
+            if _read_last_id(self.id_file) is None:
+                _write_last_id(self.id_file, _max_id(expenses))
+            self.synced_version = self.version()
+        return expenses
+
+    def _read_all(self):
+        """Read the snapshot and replay the journal on top of it"""
+        expenses = self._read_snapshot()
+        journal = list(self._replay_journal())
+        self.journal_entries = len(journal)
+        if journal:
+            # A crash between writing the snapshot and truncating the journal
+            # leaves entries that are already in the snapshot
+            in_snapshot = np.isin([expense['id'] for expense in journal], _id_column(expenses))
+            seen_ids = set()
+            for expense, stored in zip(journal, in_snapshot):
+                if stored or expense['id'] in seen_ids:
+                    continue
+                seen_ids.add(expense['id'])
+                expenses.append(expense)
+        return expenses
+
+    def _read_snapshot(self):
+        """Read the snapshot, mapping its binary copy when that is current"""
+        stamp = _file_stamp(self.data_file)
+        if stamp is None:
+            return []
+        if self.snapshot_file:
+            try:
+                with metrics.timer('storage.open_snapshot'):
+                    store = expense_snapshot.open_snapshot(self.snapshot_file, stamp)
+            except (OSError, ValueError):
+                # Only a copy of the JSON; it is rewritten below
+                store = None
+            if store is not None:
+                return store
+        with open(self.data_file, 'rb') as file:
+            expenses = expense_codec.load_expenses(file.read())
+        if not self.snapshot_file:
+            return expenses
+        store = ExpenseStore(expenses)
+        self._write_snapshot(store, stamp)
+        return store
+
+    def _write_snapshot(self, store, stamp):
+        try:
+            with metrics.timer('storage.write_snapshot'):
+                expense_snapshot.write_snapshot(self.snapshot_file, store, stamp)
+        except OSError:
+            # e.g. Windows refusing to replace a file that is still mapped;
+            # the copy is stale from now on and is rebuilt on a later load
+            pass
+
+    def _replay_journal(self):
+        """Yield journal entries, dropping a torn trailing write"""
+        return _replay_lines(self.journal_file)
+
+    def append(self, expense):
+        self.append_many([expense])
+
+    def append_many(self, expenses):
+        with self._lock:
+            in_sync = self.version() == self.synced_version
+            last_id = _assign_ids(expenses, self._last_id())
+            lines = b''.join(expense_codec.dump_line(expense) for expense in expenses)
+            with open(self.journal_file, 'ab') as file:
+                file.write(lines)
+                file.flush()
+                if self.durability == 'fsync':
+                    os.fsync(file.fileno())
+            _write_last_id(self.id_file, last_id)
+            self.journal_entries += len(expenses)
+            if in_sync:
+                self.synced_version = self.version()
+
+    def _last_id(self):
+        """Highest id ever handed out
+
+        The counter file is not fsynced, so after a crash it can lag the
+        fsynced journal; the journal's last entry covers that case.
+        """
+        last_id = _read_last_id(self.id_file)
+        if last_id is None:
+            return _max_id(self._read_all())
+        journal_last = _last_journal_entry(self.journal_file)
+        if journal_last is not None and journal_last['id'] > last_id:
+            last_id = journal_last['id']
+        return last_id
+
+    def save(self, expenses):
+        with self._lock:
+            in_sync = self.version() == self.synced_version
+            # A caller's ExpenseStore is reused for the binary copy as is
+            store = expenses if in_sync and isinstance(expenses, ExpenseStore) else None
+            expenses = list(expenses)
+            if not in_sync:
+                # Someone else appended or compacted since we loaded
+                expenses = _merge(self._read_all(), expenses)
+            last_id = max(self._last_id(), max((expense['id'] for expense in expenses), default=0))
+            _atomic_write_json(self.data_file, expenses, pretty=self.pretty)
+            if self.snapshot_file:
+                self._write_snapshot(store if store is not None else ExpenseStore(expenses),
+                                     _file_stamp(self.data_file))
+            # The snapshot now holds every journaled record
+            with open(self.journal_file, 'w'):
+                pass
+            _write_last_id(self.id_file, last_id, sync=True)
+            self.journal_entries = 0
+            if in_sync:
+                self.synced_version = self.version()
+
+    def should_compact(self):
+        return self.journal_entries >= self.compact_every
+
+    def version(self):
+        return _file_stamp(self.data_file), _file_stamp(self.journal_file)
+
+
+class SqliteExpenseView:
+    """Read-only sequence view over the expenses table"""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def __len__(self):
+        return self.storage.reader().execute("SELECT COUNT(*) AS n FROM expenses").fetchone()['n']
+
+    def __bool__(self):
+        return self.storage.reader().execute(
+            "SELECT EXISTS (SELECT 1 FROM expenses) AS found"
+        ).fetchone()['found'] == 1
+
+    def __iter__(self):
+        return self.storage.iter_find()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            positions = range(len(self))[index]
+            if not positions:
+                return []
+            if positions.step < 0:
+                return self[positions[-1]:positions[0] + 1][::positions.step]
+            rows = self.storage.reader().execute(
+                "SELECT * FROM expenses ORDER BY id LIMIT ? OFFSET ?",
+                (positions[-1] - positions[0] + 1, positions[0])
+            ).fetchall()
+            return rows[::positions.step]
+        position = range(len(self))[index]
+        return self.storage.reader().execute(
+            "SELECT * FROM expenses ORDER BY id LIMIT 1 OFFSET ?", (position,)
+        ).fetchone()
+
+
+class SqliteStorage(Storage):
+    """SQLite database with indexes on date, category and amount
+
+    Filters and aggregations run as SQL, so the tracker never needs the
+    whole dataset in memory. Pass ':memory:' for a throwaway database.
+
+    With pool_reads=True every thread reads through a connection of its
+    own, opened on first use, and the database is switched to WAL mode,
+    so a pool of worker threads (e.g. expense_server) can run queries
+    side by side while one of them writes.
+    """
+
+    queryable = True
+
+    def __init__(self, db_file='expenses.db', import_file=None, pool_reads=False):
+        self.data_file = db_file
+        self.import_file = import_file
+        self.reads = 0
+        self.pool_reads = pool_reads and db_file != ':memory:'
+        self._local = threading.local()
+        self.conn = self._connect()
+        if self.pool_reads:
+            self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS expenses (
+                id INTEGER PRIMARY KEY,
+                date TEXT NOT NULL,
+                amount REAL NOT NULL,
+                category TEXT NOT NULL,
+                description TEXT NOT NULL DEFAULT ''
+            );
+            CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses (date);
+            CREATE INDEX IF NOT EXISTS idx_expenses_category ON expenses (category, date);
+            CREATE INDEX IF NOT EXISTS idx_expenses_amount ON expenses (amount);
+        """)
+
+    def _connect(self):
+        # Wait for other writers instead of failing with "database is locked"
+        conn = sqlite3.connect(self.data_file, timeout=30, check_same_thread=False)
+        conn.row_factory = _dict_factory
+        return conn
+
+    def reader(self):
+        """Connection for reads on the calling thread"""
+        if not self.pool_reads:
+            return self.conn
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Closed when the thread exits and its local data is dropped
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def load(self):
+        self.reads += 1
+        view = SqliteExpenseView(self)
+        if not view and self.import_file and os.path.exists(self.import_file):
+            with open(self.import_file, 'rb') as file:
+                self.save(expense_codec.load_expenses(file.read()))
+        self.synced_version = self.version()
+        return view
+
+    def set_durability(self, durability):
+        super().set_durability(durability)
+        synchronous = 'FULL' if durability == 'fsync' else 'OFF'
+        self.conn.execute(f"PRAGMA synchronous = {synchronous}")
+
+    def append(self, expense):
+        self.append_many([expense])
+
+    def append_many(self, expenses):
+        with self.conn:
+            # Take the write lock before reading the highest id, so two
+            # connections can never hand out the same one
+            self.conn.execute("BEGIN IMMEDIATE")
+            last_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) AS last FROM expenses").fetchone()['last']
+            _assign_ids(expenses, last_id)
+            self._insert(expenses)
+
+    def save(self, expenses):
+        if isinstance(expenses, SqliteExpenseView):
+            return
+        expenses = list(expenses)
+        with self.conn:
+            self.conn.execute("DELETE FROM expenses")
+            self._insert(expenses)
+
+    def _insert(self, expenses):
+        self.conn.executemany(
+            "INSERT INTO expenses (id, date, amount, category, description) "
+            "VALUES (:id, :date, :amount, :category, :description)",
+            expenses
+        )
+
+    def find(self, **filters):
+        """Return the expenses matching the filters, in id order"""
+        return list(self.iter_find(**filters))
+
+    def iter_find(self, order_by='id', limit=None, offset=0, **filters):
+        """Stream the expenses matching the filters from a cursor
+
+        order_by is 'id', 'date' or 'amount', with a leading '-' for
+        descending order; ties are broken by id.
+        """
+        where, params = sql_where(**filters)
+        sql = "SELECT * FROM expenses" + where + " ORDER BY " + _order_clause(order_by)
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params += [-1 if limit is None else limit, offset]
+        return self.reader().execute(sql, params)
+
+    def find_page(self, after_id=None, limit=20, **filters):
+        """Return up to limit matching expenses with ids above after_id"""
+        where, params = sql_where(**filters)
+        if after_id is not None:
+            where += (" AND " if where else " WHERE ") + "id > ?"
+            params.append(after_id)
+        return self.reader().execute(
+            "SELECT * FROM expenses" + where + " ORDER BY id LIMIT ?", params + [limit]
+        ).fetchall()
+
+    def count(self, **filters):
+        """Count the matching expenses"""
+        where, params = sql_where(**filters)
+        return self.reader().execute("SELECT COUNT(*) AS n FROM expenses" + where, params).fetchone()['n']
+
+    def summarize(self, **filters):
+        """Aggregate the matching expenses inside SQLite"""
+        where, params = sql_where(**filters)
+        totals = self.reader().execute(
+            "SELECT COUNT(*) AS n, COALESCE(SUM(amount), 0) AS total FROM expenses" + where, params
+        ).fetchone()
+        count, total_amount = totals['n'], totals['total']
+        max_expense = self.reader().execute(
+            "SELECT * FROM expenses" + where + " ORDER BY amount DESC, id LIMIT 1", params
+        ).fetchone()
+        category_totals = {}
+        category_counts = {}
+        for row in self.reader().execute(
+            "SELECT category, SUM(amount) AS total, COUNT(*) AS n FROM expenses"
+            + where + " GROUP BY category", params
+        ):
+            category_totals[row['category']] = row['total']
+            category_counts[row['category']] = row['n']
+        daily_totals = {
+            row['date']: row['total'] for row in self.reader().execute(
+                "SELECT date, SUM(amount) AS total FROM expenses" + where + " GROUP BY date", params
+            )
+        }
+        return {
+            'total': total_amount,
+            'count': count,
+            'average': total_amount / count if count else 0,
+            'max_expense': max_expense,
+            'category_totals': category_totals,
+            'category_counts': category_counts,
+            'daily_totals': daily_totals,
+        }
+
+    def group_totals(self, key, **filters):
+        """[count, total] per date, month, year or category, computed inside SQLite"""
+        where, params = sql_where(**filters)
+        rows = self.reader().execute(
+            f"SELECT {GROUP_EXPRESSIONS[key]} AS label, COUNT(*) AS n, SUM(amount) AS total "
+            f"FROM expenses{where} GROUP BY label ORDER BY label", params
+        )
+        return {row['label']: [row['n'], row['total']] for row in rows}
+
+    def get_many(self, expense_ids, chunk_size=500):
+        """Return the expenses with the given ids, in the same order"""
+        expense_ids = list(expense_ids)
+        found = {}
+        for start in range(0, len(expense_ids), chunk_size):
+            chunk = expense_ids[start:start + chunk_size]
+            placeholders = ",".join("?" * len(chunk))
+            for row in self.reader().execute(
+                f"SELECT * FROM expenses WHERE id IN ({placeholders})", chunk
+            ):
+                found[row['id']] = row
+        return [found[expense_id] for expense_id in expense_ids if expense_id in found]
+
+    def version(self):
+        # data_version only moves when another connection commits
+        return self.conn.execute("PRAGMA data_version").fetchone()['data_version']
+
+    def get(self, expense_id):
+        """Return the expense with the given id, or None"""
+        return self.reader().execute("SELECT * FROM expenses WHERE id = ?", (expense_id,)).fetchone()
+
+    def close(self):
+        reader = getattr(self._local, 'conn', None)
+        if reader is not None:
+            reader.close()
+        self.conn.close()
+
+
+class PartitionedExpenseView:
+    """Read-only sequence view over every partition, in id order"""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def __len__(self):
+        return self.storage.count()
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        return self.storage.iter_find()
+
+    def __getitem__(self, index):
+        size = len(self)
+        positions = range(size)[index] if isinstance(index, slice) else [range(size)[index]]
+        if not positions:
+            return []
+        first, last = min(positions[0], positions[-1]), max(positions[0], positions[-1])
+        if size - 1 - last < first:
+            # Closer to the end: walk back from the newest record, which
+            # usually only reads the latest partition
+            rows = list(islice(self.storage.iter_find(order_by='-id'), size - 1 - last, size - first))[::-1]
+        else:
+            rows = list(islice(self.storage.iter_find(), first, last + 1))
+        records = [rows[position - first] for position in positions]
+        return records if isinstance(index, slice) else records[0]
+
+
+class PartitionedStorage(Storage):
+    """One JSON-lines segment per year-month plus a manifest of per-month totals
+
+    Segments live in `<data_file>.parts/` as YYYY-MM.jsonl, and
+    manifest.json records each one's size, record count, total, id and
+    amount range and per-category totals. Whole-month counts come straight
+    from the manifest, and every other query only reads the partitions
+    whose month, category and amount range can hold a match. Partitions
+    are read on first use (through a binary copy, as with JournalStorage)
+    and the most recently used `cache_partitions` are kept in memory.
+
+    An append goes to the segment of each expense's month and then
+    rewrites the manifest, both under the file lock, so the manifest is
+    the commit point. A segment that is longer than the manifest says
+    (a crash in between) is rescanned on the next load. The first load
+    of an existing expenses.json and its journal splits them into
+    partitions and renames the old files to *.migrated.
+    """
+
+    queryable = True
+
+    def __init__(self, data_file='expenses.json', cache_partitions=24, binary_snapshot=True):
+        self.data_file = data_file
+        self.directory = data_file + '.parts'
+        self.manifest_file = os.path.join(self.directory, 'manifest.json')
+        self.cache_partitions = cache_partitions
+        self.binary_snapshot = binary_snapshot
+        self.manifest = _empty_manifest()
+        # month -> ((generation, size), ExpenseStore), least recently used first
+        self._stores = OrderedDict()
+        self._cache_lock = threading.RLock()
+        self._lock = FileLock(data_file + '.lock')
+        self.reads = 0
+        self.partition_reads = 0
+
+    def lock(self):
+        return self._lock
+
+    def segment_path(self, month):
+        return os.path.join(self.directory, month + '.jsonl')
+
+    def months(self):
+        """Months that have expenses, oldest first"""
+        return sorted(self.manifest['partitions'])
+
+    def load(self):
+        with self._lock:
+            self.reads += 1
+            os.makedirs(self.directory, exist_ok=True)
+            manifest = self._read_manifest()
+            if manifest is None:
+                manifest = self._migrate()
+            self.manifest = self._repair(manifest)
+            self.synced_version = self.version()
+        return PartitionedExpenseView(self)
+
+    def _read_manifest(self):
+        """The manifest on disk, an empty one if unreadable, or None if there is none"""
+        try:
+            with open(self.manifest_file, 'rb') as file:
+                manifest = expense_codec.loads(file.read())
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # Rebuilt from the segments by _repair()
+            return _empty_manifest()
+        if manifest.get('format') != MANIFEST_FORMAT:
+            raise ValueError(f"Unsupported manifest format in {self.manifest_file}")
+        return manifest
+
+    def _write_manifest(self, manifest):
+        manifest = {**manifest, 'partitions': dict(sorted(manifest['partitions'].items()))}
+        _atomic_write_json(self.manifest_file, manifest, sync=self.durability == 'fsync', pretty=False)
+
+    def _migrate(self):
+        """Split an existing expenses.json and its journal into partitions"""
+        legacy = JournalStorage(self.data_file, binary_snapshot=False)
+        expenses = legacy._read_all()
+        last_id = max(_read_last_id(legacy.id_file) or 0, _max_id(expenses))
+        manifest = self._write_partitions(expenses, last_id, _empty_manifest())
+        for path in (self.data_file, legacy.journal_file, legacy.id_file):
+            if os.path.exists(path):
+                os.replace(path, path + '.migrated')
+        if os.path.exists(self.data_file + '.snap'):
+            os.remove(self.data_file + '.snap')
+        return manifest
+
+    def _repair(self, manifest):
+        """Rescan segments the manifest does not describe, after a crash or a lost manifest"""
+        partitions = manifest['partitions']
+        on_disk = {name[:-len('.jsonl')] for name in os.listdir(self.directory) if name.endswith('.jsonl')}
+        stale = [month for month in sorted(on_disk | set(partitions))
+                 if partitions.get(month, {}).get('size') != _file_size(self.segment_path(month))]
+        for month in stale:
+            self._rescan_partition(manifest, month)
+        if stale:
+            self._write_manifest(manifest)
+        return manifest
+
+    def _rescan_partition(self, manifest, month):
+        old = manifest['partitions'].pop(month, None)
+        store = ExpenseStore(_replay_lines(self.segment_path(month)))
+        if len(store):
+            generation = old['generation'] + 1 if old else 0
+            manifest['partitions'][month] = _partition_entry(
+                store, _file_size(self.segment_path(month)), generation)
+            manifest['last_id'] = max(manifest['last_id'], _max_id(store))
+        elif os.path.exists(self.segment_path(month)):
+            os.remove(self.segment_path(month))
+
+    def _write_partitions(self, expenses, last_id, old_manifest):
+        """Rewrite every segment from a complete list of expenses; returns the new manifest"""
+        groups = _group_by_month(expenses)
+        manifest = _empty_manifest()
+        manifest['last_id'] = max(last_id, _max_id(expenses))
+        sync = self.durability == 'fsync'
+        for month, group in groups.items():
+            path = self.segment_path(month)
+            old = old_manifest['partitions'].get(month)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as file:
+                file.write(b''.join(expense_codec.dump_line(expense) for expense in group))
+                if sync:
+                    file.flush()
+                    os.fsync(file.fileno())
+            os.replace(tmp_path, path)
+            manifest['partitions'][month] = _partition_entry(
+                ExpenseStore(group), _file_size(path), old['generation'] + 1 if old else 0)
+        self._write_manifest(manifest)
+        for month in set(old_manifest['partitions']) - set(groups):
+            for path in (self.segment_path(month), self.segment_path(month) + '.snap'):
+                if os.path.exists(path):
+                    os.remove(path)
+        return manifest
+
+    def _partition(self, month):
+        """One partition as of the manifest, as an ExpenseStore read on first use"""
+        entry = self.manifest['partitions'][month]
+        stamp = (entry['generation'], entry['size'])
+        with self._cache_lock:
+            cached = self._stores.get(month)
+            if cached is not None and cached[0] == stamp:
+                self._stores.move_to_end(month)
+                return cached[1]
+            store = self._read_partition(month, stamp)
+            self._stores[month] = (stamp, store)
+            self._stores.move_to_end(month)
+            while len(self._stores) > self.cache_partitions:
+                self._stores.popitem(last=False)
+            return store
+
+    def _read_partition(self, month, stamp):
+        path = self.segment_path(month)
+        snapshot_file = path + '.snap' if self.binary_snapshot else None
+        if snapshot_file:
+            try:
+                store = expense_snapshot.open_snapshot(snapshot_file, stamp)
+            except (OSError, ValueError):
+                store = None
+            if store is not None:
+                return store
+        self.partition_reads += 1
+        with metrics.timer('storage.read_partition'):
+            # Only the bytes the manifest covers; later appends belong to a newer manifest
+            with open(path, 'rb') as file:
+                data = file.read(stamp[1])
+            store = ExpenseStore(expense_codec.load_expenses(b'[' + data.rstrip(b'\n').replace(b'\n', b',') + b']'))
+        if snapshot_file:
+            try:
+                expense_snapshot.write_snapshot(snapshot_file, store, stamp)
+            except OSError:
+                pass
+        return store
+
+    def _select(self, date=None, month=None, start_date=None, end_date=None, category=None,
+                min_amount=None, max_amount=None, keyword=None):
+        """Months whose partitions can hold a match, oldest first"""
+        first = [value[:7] for value in (date, month, start_date) if value is not None]
+        last = [value[:7] for value in (date, month, end_date) if value is not None]
+        first, last = max(first, default=None), min(last, default=None)
+        months = []
+        for key, entry in sorted(self.manifest['partitions'].items()):
+            if (first is not None and key < first) or (last is not None and key > last):
+                continue
+            if category is not None and category not in entry['categories']:
+                continue
+            if ((min_amount is not None and entry['max_amount'] < min_amount)
+                    or (max_amount is not None and entry['min_amount'] > max_amount)):
+                continue
+            months.append(key)
+        return months
+
+    def _matches(self, month, filters):
+        store = self._partition(month)
+        return store, store.positions(**filters)
+
+    def append(self, expense):
+        self.append_many([expense])
+
+    def append_many(self, expenses):
+        groups = _group_by_month(expenses)
+        with self._lock:
+            in_sync = self.version() == self.synced_version
+            if in_sync:
+                manifest = self.manifest
+            else:
+                # Someone else appended since we loaded: build on their manifest
+                manifest = self._repair(self._read_manifest() or _empty_manifest())
+            manifest = {**manifest, 'partitions': dict(manifest['partitions'])}
+            manifest['last_id'] = _assign_ids(expenses, manifest['last_id'])
+            for month, group in groups.items():
+                path = self.segment_path(month)
+                old = manifest['partitions'].get(month)
+                if _file_size(path) != (old['size'] if old else None):
+                    # Left behind by a crashed writer
+                    self._rescan_partition(manifest, month)
+                    old = manifest['partitions'].get(month)
+                with open(path, 'ab') as file:
+                    file.write(b''.join(expense_codec.dump_line(expense) for expense in group))
+                    file.flush()
+                    if self.durability == 'fsync':
+                        os.fsync(file.fileno())
+                    size = file.tell()
+                manifest['partitions'][month] = _entry_add(old, group, size)
+                self._extend_cached(month, old, manifest['partitions'][month], group)
+            self._write_manifest(manifest)
+            self.manifest = manifest
+            if in_sync:
+                self.synced_version = self.version()
+
+    def _extend_cached(self, month, old, entry, expenses):
+        """Keep a cached partition current instead of reading it again"""
+        with self._cache_lock:
+            cached = self._stores.get(month)
+            if cached is None or old is None or cached[0] != (old['generation'], old['size']):
+                return
+            cached[1].extend(expenses)
+            self._stores[month] = ((entry['generation'], entry['size']), cached[1])
+
+    def save(self, expenses):
+        if isinstance(expenses, PartitionedExpenseView):
+            return
+        expenses = list(expenses)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            old_manifest = self._read_manifest() or _empty_manifest()
+            self.manifest = self._write_partitions(expenses, old_manifest['last_id'], old_manifest)
+            with self._cache_lock:
+                self._stores.clear()
+            self.synced_version = self.version()
+
+    def find(self, **filters):
+        """Return the expenses matching the filters, in id order"""
+        return list(self.iter_find(**filters))
+
+    def iter_find(self, order_by='id', limit=None, offset=0, **filters):
+        """Stream the expenses matching the filters, reading partitions as they are reached
+
+        order_by is 'id', 'date' or 'amount', with a leading '-' for
+        descending order; ties are broken by id.
+        """
+        column = order_by.lstrip('-')
+        descending = order_by.startswith('-')
+        months = self._select(**filters)
+        if column == 'id':
+            records = self._iter_by_id(months, filters, descending)
+        elif column in ('date', 'amount'):
+            records = self._iter_by_column(months, filters, column, descending)
+        else:
+            raise ValueError(f"Cannot order by {order_by!r}")
+        return islice(records, offset, None if limit is None else offset + limit)
+
+    def _iter_by_id(self, months, filters, descending=False, after_id=None):
+        """Merge the partitions in id order, reading each one only once its id range is reached"""
+        sign = -1 if descending else 1
+        partitions = self.manifest['partitions']
+        bound = 'max_id' if descending else 'min_id'
+        if after_id is not None:
+            months = [month for month in months if partitions[month]['max_id'] > after_id]
+        pending = sorted(months, key=lambda month: sign * partitions[month][bound])
+        heap = []
+        opened = 0
+        while heap or opened < len(pending):
+            # Open every partition that could hold the next record in order
+            while opened < len(pending) and (not heap or sign * partitions[pending[opened]][bound] <= heap[0][0]):
+                store, positions = self._matches(pending[opened], filters)
+                if after_id is not None:
+                    positions = positions[store.ids[positions] > after_id]
+                keys = sign * store.ids[positions]
+                order = np.argsort(keys, kind='stable')
+                if len(order):
+                    heapq.heappush(heap, (int(keys[order[0]]), opened, store, positions[order], keys[order], 0))
+                opened += 1
+            if not heap:
+                # The partitions left had nothing matching the filters
+                break
+            key, tie, store, positions, keys, i = heapq.heappop(heap)
+            yield store.record(positions[i])
+            if i + 1 < len(positions):
+                heapq.heappush(heap, (int(keys[i + 1]), tie, store, positions, keys, i + 1))
+
+    def _iter_by_column(self, months, filters, column, descending):
+        if column == 'date':
+            # A partition holds exactly one month, so partitions are already in date order
+            for month in (reversed(months) if descending else months):
+                store, positions = self._matches(month, filters)
+                yield from store.iter_select(_sorted_positions(store, positions, store.dates, descending))
+            return
+        matches = [self._matches(month, filters) for month in months]
+        amounts = np.concatenate([store.amounts[positions] for store, positions in matches] or [[]])
+        ids = np.concatenate([store.ids[positions] for store, positions in matches] or [[]])
+        owners = np.concatenate([np.full(len(positions), n) for n, (_, positions) in enumerate(matches)] or [[]])
+        offsets = np.concatenate([positions for _, positions in matches] or [[]]).astype(np.int64)
+        order = np.lexsort((-ids, -amounts)) if descending else np.lexsort((ids, amounts))
+        for i in order:
+            yield matches[owners[i]][0].record(offsets[i])
+
+    def find_page(self, after_id=None, limit=20, **filters):
+        """Return up to limit matching expenses with ids above after_id"""
+        return list(islice(self._iter_by_id(self._select(**filters), filters, after_id=after_id), limit))
+
+    def count(self, **filters):
+        """Count the matching expenses; whole months come from the manifest"""
+        months = self._select(**filters)
+        partitions = self.manifest['partitions']
+        if set(filters) <= {'month', 'category'}:
+            category = filters.get('category')
+            if category is None:
+                return sum(partitions[month]['count'] for month in months)
+            return sum(partitions[month]['categories'][category][0] for month in months)
+        return sum(len(self._matches(month, filters)[1]) for month in months)
+
+    def summarize(self, **filters):
+        """Merge the summaries of the partitions the filters select"""
+        summary = {
+            'total': 0,
+            'count': 0,
+            'average': 0,
+            'max_expense': None,
+            'category_totals': {},
+            'category_counts': {},
+            'daily_totals': {},
+        }
+        for month in self._select(**filters):
+            store, positions = self._matches(month, filters)
+            if not len(positions):
+                continue
+            part = store.summarize(positions)
+            summary['total'] += part['total']
+            summary['count'] += part['count']
+            best, candidate = summary['max_expense'], part['max_expense']
+            if best is None or (candidate['amount'], -candidate['id']) > (best['amount'], -best['id']):
+                summary['max_expense'] = candidate
+            for category, amount in part['category_totals'].items():
+                summary['category_totals'][category] = summary['category_totals'].get(category, 0) + amount
+                summary['category_counts'][category] = (summary['category_counts'].get(category, 0)
+                                                        + part['category_counts'][category])
+            summary['daily_totals'].update(part['daily_totals'])
+        if summary['count']:
+            summary['average'] = summary['total'] / summary['count']
+        return summary
+
+    def group_totals(self, key, **filters):
+        """[count, total] per date, month, year or category, merged across partitions"""
+        groups = {}
+        for month in self._select(**filters):
+            store, positions = self._matches(month, filters)
+            for label, (count, total) in store.group_totals(positions, key).items():
+                group = groups.setdefault(label, [0, 0.0])
+                group[0] += count
+                group[1] += total
+        return dict(sorted(groups.items()))
+
+    def get_many(self, expense_ids):
+        """Return the expenses with the given ids, in the same order"""
+        expense_ids = list(expense_ids)
+        wanted = np.asarray(expense_ids, dtype=np.int64)
+        found = {}
+        for month, entry in sorted(self.manifest['partitions'].items()):
+            inside = wanted[(wanted >= entry['min_id']) & (wanted <= entry['max_id'])]
+            if not len(inside):
+                continue
+            store = self._partition(month)
+            for record in store.iter_select(store.id_positions(inside)):
+                found[record['id']] = record
+        return [found[expense_id] for expense_id in expense_ids if expense_id in found]
+
+    def get(self, expense_id):
+        """Return the expense with the given id, or None"""
+        found = self.get_many([expense_id])
+        return found[0] if found else None
+
+    def version(self):
+        # Every commit rewrites the manifest
+        return _file_stamp(self.manifest_file)
+
+    def close(self):
+        with self._cache_lock:
+            self._stores.clear()
+
+
+def _file_stamp(path):
+    """Return (mtime, size) for a file, or None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+DURABILITY_LEVELS = ('fsync', 'os')
+
+
+def _lock_file(path):
+    """Open path and block until holding an exclusive lock on it"""
+    file = open(path, 'a+b')
+    try:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        else:
+            file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after about ten seconds; keep waiting
+                    continue
+    except BaseException:
+        file.close()
+        raise
+    return file
+
+
+def _unlock_file(file):
+    try:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+    finally:
+        file.close()
+
+
+def _assign_ids(expenses, last_id):
+    """Give expenses without an id the ids after last_id; returns the new highest id"""
+    for expense in expenses:
+        if expense.get('id') is None:
+            last_id += 1
+            expense['id'] = last_id
+        elif expense['id'] > last_id:
+            last_id = expense['id']
+    return last_id
+
+
+def _id_column(expenses):
+    if isinstance(expenses, ExpenseStore):
+        return expenses.ids
+    return [expense['id'] for expense in expenses]
+
+
+def _max_id(expenses):
+    ids = _id_column(expenses)
+    return int(np.max(ids)) if len(ids) else 0
+
+
+def _merge(stored, expenses):
+    """Stored expenses followed by the given ones that are not stored yet"""
+    stored = list(stored)
+    stored_ids = {expense['id'] for expense in stored}
+    stored.extend(expense for expense in expenses if expense['id'] not in stored_ids)
+    return stored
+
+
+def _read_last_id(path):
+    try:
+        with open(path, 'r') as file:
+            return int(file.read())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_last_id(path, last_id, sync=False):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        file.write(str(last_id))
+        if sync:
+            file.flush()
+            os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def _replay_lines(path):
+    """Yield the expenses of a JSON-lines file, truncating a torn trailing write"""
+    if not os.path.exists(path):
+        return
+    good_offset = 0
+    with open(path, 'rb') as file:
+        for line in file:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                expense = expense_codec.loads(line)
+            except ValueError:
+                break
+            # A complete line with bad fields is corruption, not a torn
+            # write, so fail loudly instead of truncating
+            expense_codec.validate_expenses((expense,))
+            good_offset += len(line)
+            yield expense
+        torn = file.tell() > good_offset
+    if torn:
+        with open(path, 'r+b') as file:
+            file.truncate(good_offset)
+
+
+def _last_journal_entry(path, block=4096):
+    """Parse the last complete line of a journal, or None"""
+    try:
+        with open(path, 'rb') as file:
+            end = file.seek(0, os.SEEK_END)
+            start = end
+            while start > 0:
+                start = max(0, start - block)
+                file.seek(start)
+                tail = file.read(end - start)
+                lines = tail.split(b'\n')
+                # lines[-1] is an unterminated fragment (usually empty), and
+                # lines[0] may be cut off unless we reached the file start
+                complete = lines[:-1] if start == 0 else lines[1:-1]
+                if complete:
+                    return expense_codec.loads(complete[-1])
+                block *= 2
+    except (FileNotFoundError, ValueError):
+        pass
+    return None
+
+
+MANIFEST_FORMAT = 1
+_DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+def _empty_manifest():
+    return {'format': MANIFEST_FORMAT, 'last_id': 0, 'partitions': {}}
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return None
+
+
+def _group_by_month(expenses):
+    """Expenses grouped by YYYY-MM partition, in their original order"""
+    groups = {}
+    for expense in expenses:
+        date = expense['date']
+        if not isinstance(date, str) or not _DATE_PATTERN.fullmatch(date):
+            raise ValueError(f"Invalid expense date: {date!r}")
+        groups.setdefault(date[:7], []).append(expense)
+    return groups
+
+
+def _partition_entry(store, size, generation=0):
+    """Manifest entry describing one partition's records"""
+    ids, amounts = store.ids, store.amounts
+    return {
+        'count': len(store),
+        'total': float(amounts.sum()),
+        'min_id': int(ids.min()),
+        'max_id': int(ids.max()),
+        'min_amount': float(amounts.min()),
+        'max_amount': float(amounts.max()),
+        'categories': store.group_totals(np.arange(len(store)), 'category'),
+        'size': size,
+        'generation': generation,
+    }
+
+
+def _entry_add(entry, expenses, size):
+    """A new manifest entry with a batch of appended expenses folded in"""
+    added = _partition_entry(ExpenseStore(expenses), size)
+    if entry is None:
+        return added
+    categories = {category: list(bucket) for category, bucket in entry['categories'].items()}
+    for category, (count, total) in added['categories'].items():
+        bucket = categories.setdefault(category, [0, 0.0])
+        bucket[0] += count
+        bucket[1] += total
+    return {
+        'count': entry['count'] + added['count'],
+        'total': entry['total'] + added['total'],
+        'min_id': min(entry['min_id'], added['min_id']),
+        'max_id': max(entry['max_id'], added['max_id']),
+        'min_amount': min(entry['min_amount'], added['min_amount']),
+        'max_amount': max(entry['max_amount'], added['max_amount']),
+        'categories': dict(sorted(categories.items())),
+        'size': size,
+        'generation': entry['generation'],
+    }
+
+
+def _sorted_positions(store, positions, column, descending=False):
+    """Positions ordered by a column, ties by id"""
+    if descending:
+        return positions[np.lexsort((-store.ids[positions], -column[positions]))]
+    return positions[np.lexsort((store.ids[positions], column[positions]))]
+
+
+GROUP_EXPRESSIONS = {
+    'date': "date",
+    'month': "substr(date, 1, 7)",
+    'year': "substr(date, 1, 4)",
+    'category': "category",
+}
+
+
+def _order_clause(order_by):
+    column = order_by.lstrip('-')
+    if column not in ('id', 'date', 'amount'):
+        raise ValueError(f"Cannot order by {order_by!r}")
+    direction = " DESC" if order_by.startswith('-') else ""
+    if column == 'id':
+        return "id" + direction
+    return f"{column}{direction}, id{direction}"
+
+
+def _dict_factory(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+def _atomic_write_json(path, data, sync=True, pretty=None):
+    """Write JSON to a temporary file and rename it over path
+
+    The file is compact unless pretty (default: EXPENSE_JSON_PRETTY).
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(expense_codec.dumps(data, pretty))
+        if sync:
+            file.flush()
+            os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def open_storage(data_file='expenses.json', backend='journal', pool_reads=False):
+    """Create a storage backend by name
+
+    pool_reads gives each reading thread its own SQLite connection; the
+    other backends are safe to read from many threads as they are.
+    """
+    if backend == 'journal':
+        return JournalStorage(data_file)
+    if backend == 'json':
+        return JsonStorage(data_file)
+    if backend == 'partitioned':
+        return PartitionedStorage(data_file)
+    if backend == 'sqlite':
+        # A database next to an existing expenses.json starts as a copy of it
+        import_file = None
+        if data_file != ':memory:':
+            import_file = os.path.join(os.path.dirname(data_file), 'expenses.json')
+        return SqliteStorage(data_file, import_file=import_file, pool_reads=pool_reads)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def storage_config():
+    """Return (data_file, backend) from EXPENSE_DATA_FILE and EXPENSE_STORAGE"""
+    backend = os.environ.get('EXPENSE_STORAGE', 'journal')
+    default_file = 'expenses.db' if backend == 'sqlite' else 'expenses.json'
+    return os.environ.get('EXPENSE_DATA_FILE', default_file), backend
+
+
+def default_storage():
+    """Create the backend selected by EXPENSE_STORAGE and EXPENSE_DATA_FILE"""
+    return open_storage(*storage_config())
@@ -0,0 +1,324 @@
+import sys
+from datetime import date as Date
+
+import numpy as np
+
+from expense_query import DATE_KEY_WIDTHS, month_bounds
+
+
+class ExpenseStore:
+    """Columnar in-memory expense storage
+
+    Records are kept as parallel NumPy columns (amount as float64, date as
+    int32 day ordinals, category as an int8 code into `category_names`) with
+    interned description strings, instead of one dict per expense. The store
+    still behaves like a list of expense dicts, building each dict on access,
+    so existing code that iterates or indexes expenses keeps working.
+    """
+
+    def __init__(self, expenses=(), capacity=1024):
+        self.category_names = []
+        self._category_codes = {}
+        self._ordinal_cache = {}
+        self._size = 0
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._dates = np.empty(capacity, dtype=np.int32)
+        self._amounts = np.empty(capacity, dtype=np.float64)
+        self._categories = np.empty(capacity, dtype=np.int8)
+        self.descriptions = []
+        # Sorted date index covering the first `_indexed` records
+        self._date_order = np.empty(0, dtype=np.int64)
+        self._sorted_dates = np.empty(0, dtype=np.int32)
+        self._indexed = 0
+        self.extend(expenses)
+
+    @classmethod
+    def from_columns(cls, ids, dates, amounts, categories, category_names, descriptions,
+                     date_order=None, sorted_dates=None):
+        """Wrap existing columns without copying them, e.g. views onto a mapped file
+
+        Read-only columns are fine: the first append copies them into
+        fresh arrays with room to grow.
+        """
+        store = cls(capacity=0)
+        store._ids, store._dates, store._amounts, store._categories = ids, dates, amounts, categories
+        store._size = len(ids)
+        store.category_names = list(category_names)
+        store._category_codes = {name: code for code, name in enumerate(store.category_names)}
+        store.descriptions = descriptions
+        if date_order is not None:
+            store._date_order, store._sorted_dates = date_order, sorted_dates
+            store._indexed = len(date_order)
+        return store
+
+    # Columns, trimmed to the number of stored records
+    @property
+    def ids(self):
+        return self._ids[:self._size]
+
+    @property
+    def dates(self):
+        return self._dates[:self._size]
+
+    @property
+    def amounts(self):
+        return self._amounts[:self._size]
+
+    @property
+    def categories(self):
+        return self._categories[:self._size]
+
+    def category_code(self, category):
+        """Return the int8 code for a category, assigning one if new"""
+        code = self._category_codes.get(category)
+        if code is None:
+            code = len(self.category_names)
+            if code > np.iinfo(np.int8).max:
+                raise ValueError(f"Too many categories (limit {code})")
+            self._category_codes[category] = code
+            self.category_names.append(category)
+        return code
+
+    def date_ordinal(self, date_str):
+        """Convert a YYYY-MM-DD string to a day ordinal"""
+        ordinal = self._ordinal_cache.get(date_str)
+        if ordinal is None:
+            ordinal = Date.fromisoformat(date_str).toordinal()
+            self._ordinal_cache[date_str] = ordinal
+        return ordinal
+
+    def _reserve(self, size):
+        if size <= len(self._amounts):
+            return
+        capacity = max(size, 2 * len(self._amounts))
+        for name in ('_ids', '_dates', '_amounts', '_categories'):
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            setattr(self, name, grown)
+
+    def append(self, expense):
+        """Add one expense dict to the store"""
+        self._reserve(self._size + 1)
+        i = self._size
+        self._ids[i] = expense['id']
+        self._dates[i] = self.date_ordinal(expense['date'])
+        self._amounts[i] = expense['amount']
+        self._categories[i] = self.category_code(expense['category'])
+        self.descriptions.append(sys.intern(expense['description']))
+        self._size += 1
+
+    def extend(self, expenses):
+        for expense in expenses:
+            self.append(expense)
+
+    def record(self, i):
+        """Build the expense dict stored at position i"""
+        return {
+            'id': int(self._ids[i]),
+            'date': Date.fromordinal(int(self._dates[i])).isoformat(),
+            'amount': float(self._amounts[i]),
+            'category': self.category_names[self._categories[i]],
+            'description': self.descriptions[i],
+        }
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield self.record(i)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.record(i) for i in range(self._size)[index]]
+        return self.record(range(self._size)[index])
+
+    def find_id(self, expense_id):
+        """Return the expense with the given id, or None"""
+        ids = self.ids
+        # Ids are normally allocated in increasing order
+        position = np.searchsorted(ids, expense_id)
+        if position < self._size and ids[position] == expense_id:
+            return self.record(position)
+        matches = np.flatnonzero(ids == expense_id)
+        return self.record(matches[0]) if len(matches) else None
+
+    def find_ids(self, expense_ids):
+        """Return the expenses with the given ids, in the same order"""
+        found = (self.find_id(expense_id) for expense_id in expense_ids)
+        return [expense for expense in found if expense is not None]
+
+    def _date_index(self):
+        """Return record positions sorted by date, and their sorted dates
+
+        The index is brought up to date lazily: records appended since the
+        last query are sorted among themselves and merged in, which is a
+        plain append when they arrive in date order.
+        """
+        if self._indexed < self._size:
+            new = np.arange(self._indexed, self._size)
+            new = new[np.argsort(self._dates[new], kind='stable')]
+            new_dates = self._dates[new]
+            insert_at = np.searchsorted(self._sorted_dates, new_dates, side='right')
+            self._date_order = np.insert(self._date_order, insert_at, new)
+            self._sorted_dates = np.insert(self._sorted_dates, insert_at, new_dates)
+            self._indexed = self._size
+        return self._date_order, self._sorted_dates
+
+    def date_range(self, first, last):
+        """Positions of records dated between two ordinals (inclusive), in insertion order"""
+        order, sorted_dates = self._date_index()
+        lo = np.searchsorted(sorted_dates, first, side='left')
+        hi = np.searchsorted(sorted_dates, last, side='right')
+        return np.sort(order[lo:hi])
+
+    def _date_window(self, date=None, month=None, start_date=None, end_date=None):
+        """Inclusive (first, last) day ordinals allowed by the date filters, or None"""
+        first, last = [], []
+        if date is not None:
+            first.append(self.date_ordinal(date))
+            last.append(self.date_ordinal(date))
+        if month is not None:
+            month_start = self.date_ordinal(month_bounds(month)[0])
+            first.append(month_start)
+            last.append(Date.fromordinal(month_start + 31).replace(day=1).toordinal() - 1)
+        if start_date is not None:
+            first.append(self.date_ordinal(start_date))
+        if end_date is not None:
+            last.append(self.date_ordinal(end_date))
+        if not (first or last):
+            return None
+        return max(first) if first else 0, min(last) if last else np.iinfo(np.int32).max
+
+    def window_size(self, date=None, month=None, start_date=None, end_date=None, **filters):
+        """Number of records inside the date filters' window, or None without date filters"""
+        window = self._date_window(date, month, start_date, end_date)
+        if window is None:
+            return None
+        sorted_dates = self._date_index()[1]
+        return int(np.searchsorted(sorted_dates, window[1], side='right')
+                   - np.searchsorted(sorted_dates, window[0], side='left'))
+
+    def positions(self, date=None, month=None, start_date=None, end_date=None, **filters):
+        """Return the positions of the records matching the filters, in insertion order
+
+        Date filters are answered from the sorted date index first, so the
+        remaining filters only look at records inside the date window.
+        """
+        window = self._date_window(date, month, start_date, end_date)
+        if window is not None:
+            positions = self.date_range(*window)
+        else:
+            positions = np.arange(self._size)
+        return self.refine(positions, **filters)
+
+    def id_positions(self, expense_ids):
+        """Positions of the records with the given ids, in the same order; unknown ids are dropped"""
+        expense_ids = np.asarray(expense_ids, dtype=np.int64)
+        ids = self.ids
+        positions = np.minimum(np.searchsorted(ids, expense_ids), max(self._size - 1, 0))
+        if not self._size:
+            return positions[:0]
+        found = ids[positions] == expense_ids
+        if not found.all():
+            # Ids out of order (e.g. merged from another process): look those up one by one
+            for i in np.flatnonzero(~found):
+                matches = np.flatnonzero(ids == expense_ids[i])
+                if len(matches):
+                    positions[i] = matches[0]
+                    found[i] = True
+        return positions[found]
+
+    def refine(self, positions, date=None, month=None, start_date=None, end_date=None,
+               category=None, keyword=None, min_amount=None, max_amount=None):
+        """Keep the positions whose records match the filters, in the order given"""
+        window = self._date_window(date, month, start_date, end_date)
+        if window is not None:
+            dates = self._dates[positions]
+            positions = positions[(dates >= window[0]) & (dates <= window[1])]
+        if category is not None:
+            code = self._category_codes.get(category)
+            if code is None:
+                return positions[:0]
+            positions = positions[self._categories[positions] == code]
+        if keyword is not None:
+            keyword = keyword.lower()
+            descriptions = self.descriptions
+            positions = positions[[keyword in descriptions[p].lower() for p in positions]]
+        if min_amount is not None:
+            positions = positions[self._amounts[positions] >= min_amount]
+        if max_amount is not None:
+            positions = positions[self._amounts[positions] <= max_amount]
+        return positions
+
+    def select(self, positions):
+        """Return the expense dicts at the given positions"""
+        return list(self.iter_select(positions))
+
+    def iter_select(self, positions):
+        """Yield the expense dicts at the given positions"""
+        for i in positions:
+            yield self.record(i)
+
+    def summarize(self, positions=None):
+        """Vectorized totals and breakdowns over the records at the given positions"""
+        if positions is None:
+            positions = np.arange(self._size)
+        amounts = self.amounts[positions]
+        count = len(amounts)
+        total_amount = float(amounts.sum())
+        max_expense = self.record(positions[np.argmax(amounts)]) if count else None
+
+        codes = self.categories[positions]
+        n_categories = len(self.category_names)
+        totals = np.bincount(codes, weights=amounts, minlength=n_categories)
+        counts = np.bincount(codes, minlength=n_categories)
+        category_totals = {}
+        category_counts = {}
+        for code in np.flatnonzero(counts):
+            category_totals[self.category_names[code]] = float(totals[code])
+            category_counts[self.category_names[code]] = int(counts[code])
+
+        days, day_index = np.unique(self.dates[positions], return_inverse=True)
+        day_totals = np.bincount(day_index, weights=amounts, minlength=len(days))
+        daily_totals = {
+            Date.fromordinal(int(day)).isoformat(): float(amount)
+            for day, amount in zip(days, day_totals)
+        }
+        return {
+            'total': total_amount,
+            'count': count,
+            'average': total_amount / count if count else 0,
+            'max_expense': max_expense,
+            'category_totals': category_totals,
+            'category_counts': category_counts,
+            'daily_totals': daily_totals,
+        }
+
+
+    def group_totals(self, positions, key):
+        """[count, total] per date, month, year or category over the records at positions"""
+        amounts = self._amounts[positions]
+        groups = {}
+        if key == 'category':
+            codes = self._categories[positions]
+            n_categories = len(self.category_names)
+            totals = np.bincount(codes, weights=amounts, minlength=n_categories)
+            counts = np.bincount(codes, minlength=n_categories)
+            for code in np.flatnonzero(counts):
+                groups[self.category_names[code]] = [int(counts[code]), float(totals[code])]
+            return dict(sorted(groups.items()))
+        width = DATE_KEY_WIDTHS[key]
+        days, day_index = np.unique(self._dates[positions], return_inverse=True)
+        day_totals = np.bincount(day_index, weights=amounts, minlength=len(days))
+        day_counts = np.bincount(day_index, minlength=len(days))
+        for day, total, count in zip(days, day_totals, day_counts):
+            label = Date.fromordinal(int(day)).isoformat()[:width]
+            group = groups.get(label)
+            if group is None:
+                groups[label] = [int(count), float(total)]
+            else:
+                group[0] += int(count)
+                group[1] += float(total)
+        return groups
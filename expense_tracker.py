@@ -1,40 +1,428 @@
-import json
+import heapq
 import os
-from datetime import datetime, timedelta
-import csv
+from datetime import datetime
+import sys
+import threading
+from contextlib import contextmanager, redirect_stdout
+import expense_codec
+from expense_budgets import Budgets, alert_message
+from expense_metrics import metrics, timed
 
 class ExpenseTracker:
-    def __init__(self, data_file='expenses.json'):
+    def __init__(self, data_file='expenses.json', storage=None):
+        # NumPy-backed modules are imported here rather than at the top,
+        # so `expense_tracker.py help` and argument errors return quickly
+        from expense_rollups import Rollups
+        from expense_storage import open_storage
+        from expense_store import ExpenseStore
         self.data_file = data_file
-        self.expenses = []
+        self.storage = storage or open_storage(data_file)
+        self.expenses = ExpenseStore()
+        self.rollups = Rollups(self.storage.sidecar_path('.rollups.json'))
+        self.budgets = Budgets(self.storage.sidecar_path('.budgets.json'))
+        # The search index and sketches are only imported and loaded on first use
+        self._search_index = None
+        self._sketches = None
+        self._search_synced = False
+        self._sketches_synced = False
+        # Bumped on every load or write so callers can cache derived data
+        self.version = 0
+        self._storage_version = None
+        # trends() results for the current version, by arguments
+        self._trends = {}
+        self._trends_version = None
+        self.lock = threading.RLock()
+        # Set while buffered() is active; see expense_buffer.WriteBuffer
+        self.write_buffer = None
         self.categories = [
             'Food', 'Transportation', 'Entertainment', 'Utilities', 
             'Healthcare', 'Shopping', 'Education', 'Other'
         ]
         self.load_data()
     
+    @property
+    def search_index(self):
+        with self.lock:
+            if self._search_index is None:
+                from expense_search import SearchIndex
+                self._search_index = SearchIndex(self.storage.sidecar_path('.search.npz'))
+            return self._search_index
+    
+    @property
+    def sketches(self):
+        with self.lock:
+            if self._sketches is None:
+                from expense_sketches import Sketches
+                self._sketches = Sketches(self.storage.sidecar_path('.sketches.json'))
+            return self._sketches
+    
+    @timed('tracker.load_data')
     def load_data(self):
         """Load expenses from JSON file"""
+        from expense_store import ExpenseStore
         try:
-            if os.path.exists(self.data_file):
-                with open(self.data_file, 'r') as file:
-                    self.expenses = json.load(file)
+            with metrics.timer('storage.load'):
+                self.expenses = self.storage.load()
+            if not self.storage.queryable and not isinstance(self.expenses, ExpenseStore):
+                with metrics.timer('store.build'):
+                    self.expenses = ExpenseStore(self.expenses)
+            with metrics.timer('rollups.sync'):
+                self.rollups.sync(self.expenses)
+            self._search_synced = False
+            self._sketches_synced = False
+            metrics.count('records_loaded', len(self.expenses))
+            self._storage_version = self.storage.synced_version
+            self.version += 1
+            if self.expenses:
                 print(f"Loaded {len(self.expenses)} existing expense records.")
             else:
-                self.expenses = []
                 print("No existing data found. Starting fresh.")
         except Exception as e:
             print(f"Error loading data: {e}")
-            self.expenses = []
+            self.expenses = ExpenseStore()
+            self.rollups.rebuild(())
+            self.search_index.rebuild(())
+            self._search_synced = True
+            self.sketches.rebuild(())
+            self._sketches_synced = True
+            self.version += 1
+    
+    def refresh(self):
+        """Reload if the stored data was changed by someone else; returns True if it was"""
+        with self.lock:
+            self.budgets.sync()
+            if self.storage.version() == self._storage_version:
+                return False
+            self.load_data()
+            return True
     
+    @timed('tracker.save_data')
     def save_data(self):
-        """Save expenses to JSON file"""
+        """Save all expenses as a fresh snapshot"""
         try:
-            with open(self.data_file, 'w') as file:
-                json.dump(self.expenses, file, indent=2)
+            self.flush()
+            with metrics.timer('storage.save'):
+                self.storage.save(self.expenses)
+            with metrics.timer('derived.save'):
+                self.rollups.save()
+                if self._search_synced:
+                    self.search_index.save()
+                if self._sketches_synced:
+                    self.sketches.save()
+            self._storage_version = self.storage.synced_version
         except Exception as e:
             print(f"Error saving data: {e}")
     
+    def close(self):
+        """Persist derived data and release the storage backend"""
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Error saving buffered expenses: {e}")
+        try:
+            self.rollups.save()
+            if self._search_synced:
+                self.search_index.save()
+            if self._sketches_synced:
+                self.sketches.save()
+        except Exception as e:
+            print(f"Error saving derived data: {e}")
+        self.storage.close()
+    
+    def record_expense(self, expense):
+        """Add an expense record and persist it; an id of None is filled in
+        
+        Returns the budget alerts it raised (see record_expenses).
+        """
+        return self.record_expenses([expense])
+    
+    def record_expenses(self, expenses, compact=True):
+        """Add a batch of expense records and persist them in one commit
+        
+        Expenses with an id of None get the next free ids from the storage
+        backend, which allocates them safely across processes. Inside
+        buffered() the batch is queued for a group commit instead.
+        Returns the budget alerts the batch raised (see check_budget);
+        none for a queued batch.
+        """
+        if not expenses:
+            return []
+        write_buffer = self.write_buffer
+        if write_buffer is not None:
+            write_buffer.add(expenses)
+            return []
+        return self._commit_expenses(expenses, compact)
+    
+    @timed('tracker.record')
+    def _commit_expenses(self, expenses, compact=True):
+        with self.lock:
+            # Write first: ids are assigned here, and a failed write leaves
+            # the in-memory state untouched
+            with metrics.timer('storage.append'):
+                self.storage.append_many(expenses)
+            if not self.storage.queryable:
+                self.expenses.extend(expenses)
+            alerts = []
+            for expense in expenses:
+                # Checked against the month-to-date total before the rollups take it in
+                alert = self.check_budget(expense)
+                if alert is not None:
+                    alert['expense_id'] = expense['id']
+                    alerts.append(alert)
+                self.rollups.add(expense)
+                if self._search_synced:
+                    # Otherwise the first search's sync() picks it up
+                    self.search_index.add(expense)
+                if self._sketches_synced:
+                    self.sketches.add(expense)
+            self.version += 1
+            metrics.count('records_added', len(expenses))
+            if alerts:
+                metrics.count('budget.alerts', len(alerts))
+            # Stays behind the files if another process wrote meanwhile,
+            # so the next refresh() picks up its records
+            self._storage_version = self.storage.synced_version
+            if compact and self.storage.should_compact():
+                self.save_data()
+        return alerts
+    
+    def flush(self):
+        """Commit any buffered expenses now; returns how many were written"""
+        write_buffer = self.write_buffer
+        return write_buffer.flush() if write_buffer is not None else 0
+    
+    @contextmanager
+    def buffered(self, max_records=100, max_delay_ms=50, durability=None):
+        """Group the expenses added inside the block into fewer, larger commits
+        
+        A commit happens once max_records expenses are pending or the oldest
+        has waited max_delay_ms, on flush(), and when the block exits.
+        durability ('fsync' or 'os', see Storage.set_durability) applies
+        to the commits made inside the block.
+        """
+        previous_durability = self.storage.durability
+        if durability is not None:
+            self.storage.set_durability(durability)
+        outer = self.write_buffer
+        if outer is not None:
+            # Keep commits in the order the expenses were added
+            outer.flush()
+        from expense_buffer import WriteBuffer
+        self.write_buffer = WriteBuffer(self._commit_expenses, max_records, max_delay_ms)
+        try:
+            yield self.write_buffer
+        finally:
+            try:
+                self.write_buffer.close()
+            finally:
+                self.write_buffer = outer
+                self.storage.set_durability(previous_durability)
+    
+    @timed('tracker.import')
+    def import_file(self, path, format=None, batch_size=10000):
+        """Bulk-import expenses from a CSV or JSON-lines file"""
+        import expense_import
+        return expense_import.import_file(self, path, format=format, batch_size=batch_size)
+    
+    def query(self):
+        """Start a lazily evaluated query over every expense (see expense_query.Query)"""
+        from expense_query import Query
+        return Query(self)
+    
+    @timed('tracker.find')
+    def find_expenses(self, **filters):
+        """Return expenses matching the filters (see expense_query.expense_matches)"""
+        return list(self.iter_expenses(**filters))
+    
+    def iter_expenses(self, **filters):
+        """Stream expenses matching the filters without building a list"""
+        if self.storage.queryable:
+            return self.storage.iter_find(**filters)
+        return self.expenses.iter_select(self.expenses.positions(**filters))
+    
+    @timed('tracker.reports')
+    def generate_reports(self, months=None, year=None, output_dir='.', workers=None, executor='process',
+                         export=True):
+        """Build monthly reports (and their CSV files) for many months in parallel
+        
+        Defaults to every month with expenses, or every month of `year`.
+        Returns the reports in month order; see expense_reports.generate_reports.
+        """
+        import expense_reports
+        if months is None:
+            months = expense_reports.report_months(self, year)
+        return expense_reports.generate_reports(self, months, output_dir=output_dir, workers=workers,
+                                                executor=executor, export=export)
+    
+    @timed('tracker.export')
+    def export_expenses(self, path, format=None, chunk_size=10000, **filters):
+        """Stream the matching expenses to a CSV, JSON-lines or Parquet file"""
+        import expense_export
+        format = format or expense_export.detect_format(path)
+        return expense_export.write_records(self.iter_expenses(**filters), path, format, chunk_size)
+    
+    def search(self, query, limit=None, mode='substring'):
+        """Full-text search over descriptions; all terms must match, best matches first"""
+        return self.get_expenses(self.search_ids(query, limit=limit, mode=mode))
+    
+    @timed('tracker.search')
+    def search_ids(self, query, limit=None, mode='substring'):
+        """Ids of the expenses matching a full-text search, best matches first"""
+        with self.lock:
+            return self._synced_search_index().search(query, limit=limit, mode=mode)
+    
+    def search_estimate(self, query, mode='substring'):
+        """Cheap upper bound on the number of expenses a search can match"""
+        with self.lock:
+            return self._synced_search_index().estimate(query, mode)
+    
+    def _synced_search_index(self):
+        """The search index, loaded and brought up to date on first use"""
+        if not self._search_synced:
+            with metrics.timer('search_index.sync'):
+                self.search_index.sync(self.expenses)
+            self._search_synced = True
+        return self.search_index
+    
+    @timed('tracker.search_page')
+    def search_page(self, query, cursor=None, page_size=20, mode='substring'):
+        """Return one page of search results and the cursor for the next page
+        
+        The cursor is the number of results already shown (None to start).
+        """
+        offset = cursor or 0
+        expense_ids = self.search_ids(query, limit=offset + page_size + 1, mode=mode)
+        next_cursor = offset + page_size if len(expense_ids) > offset + page_size else None
+        return self.get_expenses(expense_ids[offset:offset + page_size]), next_cursor
+    
+    @timed('tracker.statistics')
+    def statistics(self, top=5):
+        """Percentiles, most frequent descriptions, distinct counts and top days, with error bounds
+        
+        Comes from the streaming sketches (see expense_sketches.Sketches)
+        and the daily rollups, so it costs the same at any data size.
+        """
+        with self.lock:
+            if not self._sketches_synced:
+                with metrics.timer('sketches.sync'):
+                    self.sketches.sync(self.expenses)
+                self._sketches_synced = True
+            stats = self.sketches.statistics(top)
+            stats['top_days'] = top_days(((day, bucket[1]) for day, bucket in self.rollups.daily.items()), top)
+        return stats
+    
+    @timed('tracker.trends')
+    def trends(self, months=12, category=None, end=None, days=365):
+        """Rolling 7/30/90-day sums, month-over-month and year-over-year deltas and weekday seasonality
+        
+        Computed from the daily and monthly rollups (see expense_analytics.trends)
+        and cached until the data changes. end (YYYY-MM-DD) defaults to the
+        last day with expenses; days is how much of the rolling series to return.
+        """
+        import expense_analytics
+        with self.lock:
+            if self._trends_version != self.version:
+                self._trends = {}
+                self._trends_version = self.version
+            key = (months, category, end, days)
+            result = self._trends.get(key)
+            if result is None:
+                if category is None:
+                    day_totals = {day: bucket[1] for day, bucket in self.rollups.daily.items()}
+                else:
+                    day_totals = self.query().category(category).group_by('date').sum()
+                month_categories = {month: {name: bucket[1] for name, bucket in totals.items()}
+                                    for month, totals in self.rollups.categories.items()}
+                result = self._trends[key] = expense_analytics.trends(day_totals, month_categories, months,
+                                                                      end, days, category)
+                metrics.count('trends.computed')
+        return result
+    
+    def month_spent(self, month, category):
+        """Month-to-date total of a category, from the rollups"""
+        bucket = self.rollups.categories.get(month, {}).get(category)
+        return bucket[1] if bucket is not None else 0.0
+    
+    def check_budget(self, expense):
+        """The budget alert adding this expense would raise, or None
+        
+        Compares the category's month-to-date total before and after the
+        expense with its limit, so it costs the same at any data size.
+        Expenses not committed yet (e.g. still queued by a background
+        writer) are not counted.
+        """
+        month = expense['date'][:7]
+        category = expense['category']
+        if self.budgets.limit(month, category) is None:
+            return None
+        with self.lock:
+            spent = self.month_spent(month, category)
+        return self.budgets.check(month, category, spent, spent + expense['amount'])
+    
+    def set_budget(self, category, amount, month=None):
+        """Set a category's monthly limit (for every month, or only YYYY-MM); None removes it"""
+        with self.lock:
+            self.budgets.sync()
+            self.budgets.set_limit(category, amount, month)
+            self.budgets.save()
+    
+    def budget_status(self, month=None):
+        """Spending against every limit in YYYY-MM (default: this month), fullest first"""
+        month = month or datetime.now().strftime("%Y-%m")
+        with self.lock:
+            statuses = [self.budgets.status(month, category, self.month_spent(month, category))
+                        for category in self.budgets.month_limits(month)]
+        return sorted(statuses, key=lambda status: -status['ratio'])
+    
+    @timed('tracker.page')
+    def iter_page(self, filters=None, cursor=None, page_size=20):
+        """Return one page of matching expenses in id order and the cursor for the next page
+        
+        The cursor is the id of the last expense on the previous page (None
+        to start), so pages stay stable while new expenses are added.
+        """
+        filters = filters or {}
+        if self.storage.queryable:
+            expenses = self.storage.find_page(cursor, page_size + 1, **filters)
+        else:
+            positions = self.expenses.positions(**filters)
+            if cursor is not None:
+                positions = positions[self.expenses.ids[positions] > cursor]
+            expenses = self.expenses.select(positions[:page_size + 1])
+        next_cursor = expenses[page_size - 1]['id'] if len(expenses) > page_size else None
+        return expenses[:page_size], next_cursor
+    
+    @timed('tracker.count')
+    def count_expenses(self, **filters):
+        """Count the expenses matching the filters"""
+        if set(filters) <= {'month'}:
+            return self.rollups.summary(filters.get('month'))['count']
+        if self.storage.queryable:
+            return self.storage.count(**filters)
+        return len(self.expenses.positions(**filters))
+    
+    def get_expenses(self, expense_ids):
+        """Return the expenses with the given ids, in the same order"""
+        if self.storage.queryable:
+            return self.storage.get_many(expense_ids)
+        return self.expenses.find_ids(expense_ids)
+    
+    def get_expense(self, expense_id):
+        """Return the expense with the given id, or None"""
+        if self.storage.queryable:
+            return self.storage.get(expense_id)
+        return self.expenses.find_id(expense_id)
+    
+    @timed('tracker.summarize')
+    def summarize(self, **filters):
+        """Return totals and breakdowns for the expenses matching the filters"""
+        if set(filters) <= {'month'}:
+            # Whole months and the full history come straight from the rollups
+            return self.rollups.summary(filters.get('month'), self.get_expense)
+        if self.storage.queryable:
+            return self.storage.summarize(**filters)
+        return self.expenses.summarize(self.expenses.positions(**filters))
+    
     def add_expense(self):
         """Add a new expense entry"""
         print("\n--- Add New Expense ---")
@@ -72,22 +460,27 @@ class ExpenseTracker:
             
             # Create expense record
             expense = {
-                'id': len(self.expenses) + 1,
+                'id': None,
                 'date': date,
                 'amount': amount,
                 'category': category,
                 'description': description
             }
             
-            self.expenses.append(expense)
-            self.save_data()
+            alerts = self.record_expense(expense)
             print("✓ Expense added successfully!")
+            for alert in alerts:
+                print(f"⚠️  {alert_message(alert)}")
             
         except ValueError as e:
             print(f"Error: Invalid input - {e}")
         except Exception as e:
             print(f"Error adding expense: {e}")
     
+    def expense_years(self):
+        """Return the years that have expenses, newest first"""
+        return sorted({month[:4] for month in self.rollups.monthly}, reverse=True)
+    
     def view_all_expenses(self):
         """Display all expenses"""
         print("\n--- All Expenses ---")
@@ -95,7 +488,7 @@ class ExpenseTracker:
             print("No expenses recorded yet.")
             return
         
-        self.display_expenses(self.expenses)
+        self.browse_expenses(self.query())
     
     def view_expenses_by_date(self):
         """View expenses for a specific date"""
@@ -104,11 +497,11 @@ class ExpenseTracker:
         
         try:
             datetime.strptime(date, "%Y-%m-%d")
-            filtered = [exp for exp in self.expenses if exp['date'] == date]
+            query = self.query().on(date)
             
-            if filtered:
+            if query.count():
                 print(f"\nExpenses for {date}:")
-                self.display_expenses(filtered)
+                self.browse_expenses(query)
             else:
                 print(f"No expenses found for {date}")
                 
@@ -126,11 +519,11 @@ class ExpenseTracker:
             cat_choice = int(input("Select category (number): "))
             if 1 <= cat_choice <= len(self.categories):
                 category = self.categories[cat_choice - 1]
-                filtered = [exp for exp in self.expenses if exp['category'] == category]
+                query = self.query().category(category)
                 
-                if filtered:
+                if query.count():
                     print(f"\nExpenses for {category}:")
-                    self.display_expenses(filtered)
+                    self.browse_expenses(query)
                 else:
                     print(f"No expenses found for {category}")
             else:
@@ -139,20 +532,22 @@ class ExpenseTracker:
             print("Please enter a valid number.")
     
     def search_expenses(self):
-        """Search expenses by description or amount range"""
+        """Search expenses by description, amount range or any combination of filters"""
         print("\n--- Search Expenses ---")
         print("1. Search by description")
         print("2. Search by amount range")
+        print("3. Combine filters")
         
-        choice = input("Enter your choice (1-2): ").strip()
+        choice = input("Enter your choice (1-3): ").strip()
         
         if choice == '1':
             keyword = input("Enter search keyword: ").lower()
-            filtered = [exp for exp in self.expenses if keyword in exp['description'].lower()]
+            query = self.query().text(keyword)
+            found = query.count()
             
-            if filtered:
-                print(f"\nFound {len(filtered)} expenses matching '{keyword}':")
-                self.display_expenses(filtered)
+            if found:
+                print(f"\nFound {found} expenses matching '{keyword}':")
+                self.browse_expenses(query, total_count=found)
             else:
                 print(f"No expenses found matching '{keyword}'")
                 
@@ -161,116 +556,144 @@ class ExpenseTracker:
                 min_amount = float(input("Enter minimum amount: "))
                 max_amount = float(input("Enter maximum amount: "))
                 
-                filtered = [exp for exp in self.expenses if min_amount <= exp['amount'] <= max_amount]
+                query = self.query().amount(min=min_amount, max=max_amount)
+                found = query.count()
                 
-                if filtered:
-                    print(f"\nFound {len(filtered)} expenses between {min_amount} and {max_amount}:")
-                    self.display_expenses(filtered)
+                if found:
+                    print(f"\nFound {found} expenses between {min_amount} and {max_amount}:")
+                    self.browse_expenses(query, total_count=found)
                 else:
                     print(f"No expenses found in the specified range.")
                     
             except ValueError:
                 print("Invalid amount. Please enter numbers only.")
+        elif choice == '3':
+            try:
+                query = self.prompt_query()
+            except ValueError as e:
+                print(f"Error: Invalid input - {e}")
+                return
+            found = query.count()
+            if found:
+                print(f"\nFound {found} matching expenses, total ${query.sum():.2f}:")
+                self.browse_expenses(query, total_count=found)
+            else:
+                print("No expenses match all of those filters.")
         else:
             print("Invalid choice.")
     
+    def prompt_query(self):
+        """Ask for each filter in turn (Enter skips it) and build the query"""
+        query = self.query()
+        text = input("Description contains (Enter for any): ").strip()
+        if text:
+            query = query.text(text)
+        category = input(f"Category ({', '.join(self.categories)}; Enter for any): ").strip()
+        if category:
+            matches = [name for name in self.categories if name.lower() == category.lower()]
+            query = query.category(matches[0] if matches else category)
+        start = input("From date (YYYY-MM-DD, Enter for any): ").strip() or None
+        end = input("To date (YYYY-MM-DD, Enter for any): ").strip() or None
+        for day in (start, end):
+            if day is not None:
+                datetime.strptime(day, "%Y-%m-%d")
+        query = query.between(start, end)
+        min_amount = input("Minimum amount (Enter for any): ").strip()
+        max_amount = input("Maximum amount (Enter for any): ").strip()
+        return query.amount(min=float(min_amount) if min_amount else None,
+                            max=float(max_amount) if max_amount else None)
+    
     def generate_monthly_report(self):
         """Generate monthly expense report"""
         print("\n--- Monthly Report ---")
         
         try:
             year_month = input("Enter year and month (YYYY-MM): ").strip()
-            year, month = map(int, year_month.split('-'))
+            year_month = datetime.strptime(year_month, "%Y-%m").strftime("%Y-%m")
             
-            # Filter expenses for the specified month
-            monthly_expenses = []
-            for exp in self.expenses:
-                exp_date = datetime.strptime(exp['date'], "%Y-%m-%d")
-                if exp_date.year == year and exp_date.month == month:
-                    monthly_expenses.append(exp)
-            
-            if not monthly_expenses:
+            report = self.monthly_report(year_month)
+            if not report['count']:
                 print(f"No expenses found for {year_month}")
                 return
-            
-            # Calculate totals
-            total_amount = sum(exp['amount'] for exp in monthly_expenses)
-            
-            # Category breakdown
-            category_totals = {}
-            for exp in monthly_expenses:
-                category = exp['category']
-                category_totals[category] = category_totals.get(category, 0) + exp['amount']
-            
-            # Display report
-            print(f"\n=== Monthly Report for {year_month} ===")
-            print(f"Total Expenses: ${total_amount:.2f}")
-            print(f"Number of Transactions: {len(monthly_expenses)}")
-            
-            print("\nCategory Breakdown:")
-            for category, amount in sorted(category_totals.items(), key=lambda x: x[1], reverse=True):
-                percentage = (amount / total_amount) * 100
-                print(f"  {category}: ${amount:.2f} ({percentage:.1f}%)")
-            
-            # Daily trend
-            daily_totals = {}
-            for exp in monthly_expenses:
-                day = exp['date']
-                daily_totals[day] = daily_totals.get(day, 0) + exp['amount']
-            
-            print(f"\nTop 5 Highest Spending Days:")
-            for day, amount in sorted(daily_totals.items(), key=lambda x: x[1], reverse=True)[:5]:
-                print(f"  {day}: ${amount:.2f}")
+            self.display_report(report)
                 
             # Ask if user wants to export
             export = input("\nExport this report to file? (y/n): ").lower()
             if export == 'y':
-                self.export_report(monthly_expenses, year_month, total_amount, category_totals)
+                monthly_expenses = self.query().month(year_month)
+                self.export_report(monthly_expenses, year_month, report['total'], report['category_totals'],
+                                   report['count'])
                 
         except ValueError:
             print("Invalid date format. Please use YYYY-MM.")
         except Exception as e:
             print(f"Error generating report: {e}")
     
-    def export_report(self, expenses, year_month, total_amount, category_totals):
-        """Export report to CSV file"""
+    def monthly_report(self, year_month, top=5):
+        """Totals, category breakdown and top spending days of one YYYY-MM month, as plain data"""
+        summary = self.summarize(month=year_month)
+        report = {'month': year_month, **summary_record(summary)}
+        report['top_days'] = [[day, amount] for day, amount in top_days(summary['daily_totals'].items(), top)]
+        return report
+    
+    def display_report(self, report):
+        """Print a monthly_report()"""
+        total_amount = report['total']
+        print(f"\n=== Monthly Report for {report['month']} ===")
+        print(f"Total Expenses: ${total_amount:.2f}")
+        print(f"Number of Transactions: {report['count']}")
+        
+        print("\nCategory Breakdown:")
+        for category, amount in report['category_totals'].items():
+            percentage = (amount / total_amount) * 100
+            print(f"  {category}: ${amount:.2f} ({percentage:.1f}%)")
+        
+        print(f"\nTop {len(report['top_days'])} Highest Spending Days:")
+        for day, amount in report['top_days']:
+            print(f"  {day}: ${amount:.2f}")
+    
+    @timed('tracker.export_report')
+    def export_report(self, expenses, year_month, total_amount, category_totals, transaction_count,
+                      chunk_size=10000):
+        """Export report to CSV file, streaming the detailed expenses in chunks"""
+        import expense_reports
         try:
-            filename = f"expense_report_{year_month}.csv"
-            
-            with open(filename, 'w', newline='') as file:
-                writer = csv.writer(file)
-                
-                # Write header
-                writer.writerow(['Monthly Expense Report', year_month])
-                writer.writerow(['Total Amount', f"${total_amount:.2f}"])
-                writer.writerow(['Number of Transactions', len(expenses)])
-                writer.writerow([])
-                
-                # Write category breakdown
-                writer.writerow(['Category Breakdown'])
-                writer.writerow(['Category', 'Amount', 'Percentage'])
-                for category, amount in category_totals.items():
-                    percentage = (amount / total_amount) * 100
-                    writer.writerow([category, f"${amount:.2f}", f"{percentage:.1f}%"])
-                
-                writer.writerow([])
-                
-                # Write detailed expenses
-                writer.writerow(['Detailed Expenses'])
-                writer.writerow(['Date', 'Amount', 'Category', 'Description'])
-                for exp in expenses:
-                    writer.writerow([
-                        exp['date'],
-                        f"${exp['amount']:.2f}",
-                        exp['category'],
-                        exp['description']
-                    ])
+            filename = expense_reports.report_filename(year_month)
+            expense_reports.write_report_csv(filename, year_month, total_amount, category_totals,
+                                             transaction_count, expenses, chunk_size)
             
             print(f"✓ Report exported to {filename}")
             
         except Exception as e:
             print(f"Error exporting report: {e}")
     
+    def browse_expenses(self, query, total_count=None, page_size=20):
+        """Display a query's expenses one page at a time with next/previous navigation"""
+        if total_count is None:
+            total_count = query.count()
+        pages = max(1, -(-total_count // page_size))
+        cursors = [None]
+        while True:
+            expenses, next_cursor = query.page(cursors[-1], page_size)
+            self.display_expenses(expenses)
+            if pages == 1:
+                return
+            print(f"Page {len(cursors)} of {pages} ({total_count} expenses)")
+            
+            options = []
+            if next_cursor is not None:
+                options.append("[n]ext")
+            if len(cursors) > 1:
+                options.append("[p]revious")
+            options.append("[q]uit")
+            choice = input(", ".join(options) + ": ").strip().lower()
+            if choice == 'n' and next_cursor is not None:
+                cursors.append(next_cursor)
+            elif choice == 'p' and len(cursors) > 1:
+                cursors.pop()
+            elif choice == 'q':
+                return
+    
     def display_expenses(self, expenses_list):
         """Display a list of expenses in formatted table"""
         if not expenses_list:
@@ -296,30 +719,564 @@ class ExpenseTracker:
             print("No expenses recorded yet.")
             return
         
-        total_amount = sum(exp['amount'] for exp in self.expenses)
-        avg_amount = total_amount / len(self.expenses)
-        
-        # Most expensive expense
-        most_expensive = max(self.expenses, key=lambda x: x['amount'])
-        
-        # Category statistics
-        category_counts = {}
-        for exp in self.expenses:
-            category_counts[exp['category']] = category_counts.get(exp['category'], 0) + 1
+        summary = self.summarize()
+        stats = self.statistics()
+        most_expensive = summary['max_expense']
         
         print("\n--- Statistics ---")
-        print(f"Total Expenses: ${total_amount:.2f}")
-        print(f"Average per Expense: ${avg_amount:.2f}")
+        print(f"Total Expenses: ${summary['total']:.2f}")
+        print(f"Average per Expense: ${summary['average']:.2f}")
         print(f"Most Expensive: ${most_expensive['amount']:.2f} ({most_expensive['category']} - {most_expensive['description']})")
-        print(f"Total Records: {len(self.expenses)}")
+        print(f"Total Records: {summary['count']}")
         
         print("\nCategories by count:")
-        for category, count in sorted(category_counts.items(), key=lambda x: x[1], reverse=True):
+        for category, count in sorted(summary['category_counts'].items(), key=lambda x: x[1], reverse=True):
             print(f"  {category}: {count} expenses")
+        
+        print(f"\nAmount percentiles (rank within ±{stats['rank_error'] * 100:.1f}%):")
+        for q, amount in stats['percentiles'].items():
+            print(f"  p{q * 100:g}: ${amount:.2f}")
+        
+        print(f"\nMost frequent descriptions (counts at most {stats['description_count_error']:.0f} too high):")
+        for row in stats['top_descriptions']:
+            print(f"  {row['description']}: {row['count']}")
+        
+        print(f"\nDistinct descriptions per category (±{stats['distinct_error'] * 100:.1f}%):")
+        for category, distinct in stats['distinct_descriptions'].items():
+            print(f"  {category}: ~{distinct} (median ${stats['category_medians'][category]:.2f})")
+        
+        print("\nTop spending days:")
+        for day, amount in stats['top_days']:
+            print(f"  {day}: ${amount:.2f}")
+
+def top_days(day_totals, n=5):
+    """The n highest of some (day, total) pairs, without sorting every day"""
+    return heapq.nlargest(n, day_totals, key=lambda item: item[1])
+
+def summary_record(summary):
+    """The JSON-ready parts of a summarize() result, categories by total"""
+    return {
+        'count': summary['count'],
+        'total': summary['total'],
+        'average': summary['average'],
+        'largest': summary['max_expense'],
+        'category_totals': dict(sorted(summary['category_totals'].items(), key=lambda item: -item[1])),
+        'category_counts': summary['category_counts'],
+    }
+
+def statistics_record(stats):
+    """A statistics() result with string keys and lists, ready for JSON"""
+    record = dict(stats)
+    record['percentiles'] = {f"p{q * 100:g}": amount for q, amount in stats['percentiles'].items()}
+    record['top_days'] = [[day, amount] for day, amount in stats['top_days']]
+    return record
+
+USAGE = """usage: expense_tracker.py [COMMAND] [options]
+
+Without a command, the interactive menu starts. Commands:
+  add          add one expense, or many read from stdin
+  list         list the expenses matching some filters
+  search       full-text search over descriptions
+  report       one month's totals, categories and top days
+  stats        totals, percentiles and frequent descriptions
+  trends       rolling sums, month-over-month and year-over-year changes
+  budgets      spending against monthly budgets; set or remove them
+  export       stream expenses to a file or stdout (CSV, JSON lines, Parquet)
+  import       bulk-import expenses from a file or stdin (CSV, JSON lines)
+  reports      write many monthly reports in parallel
+  serve        serve the expenses over a local HTTP/JSON API
+  interactive  the menu-driven mode
+
+Results go to stdout as JSON, JSON lines or CSV; progress and errors go to
+stderr. Run `expense_tracker.py COMMAND --help` for a command's options.
+EXPENSE_STORAGE and EXPENSE_DATA_FILE choose the data, as for the app."""
+
+OUTPUT_FORMATS = ['jsonl', 'json', 'csv', 'table']
+
+@contextmanager
+def scripted_output():
+    """Send the tracker's messages to stderr; yields the real stdout for results"""
+    out = sys.stdout
+    with redirect_stdout(sys.stderr):
+        yield out
+
+class RecordOutput:
+    """Writes expenses to a text stream as JSON lines, a JSON list, CSV or a table"""
+    
+    def __init__(self, out, format='jsonl', display=None):
+        self.out = out
+        self.format = format
+        self.display = display
+        self.count = 0
+        self._table = []
+    
+    def write(self, expenses):
+        import expense_export
+        for chunk in expense_export.iter_chunks(expenses):
+            if self.format == 'jsonl':
+                self.out.write(b''.join(expense_codec.dump_line(expense) for expense in chunk).decode('utf-8'))
+            elif self.format == 'json':
+                for index, expense in enumerate(chunk, self.count):
+                    self.out.write(",\n" if index else "[\n")
+                    self.out.write(expense_codec.dumps(expense, pretty=False).decode('utf-8'))
+            elif self.format == 'csv':
+                for text in expense_export.csv_chunks(chunk, header=not self.count):
+                    self.out.write(text)
+            else:
+                self._table.extend(chunk)
+            self.count += len(chunk)
+    
+    def close(self):
+        if self.format == 'json':
+            self.out.write("\n]\n" if self.count else "[]\n")
+        elif self.format == 'table':
+            with redirect_stdout(self.out):
+                self.display(self._table)
+        self.out.flush()
+
+def write_json(out, data):
+    out.write(expense_codec.dumps(data, pretty=True).decode('utf-8') + "\n")
+    out.flush()
+
+def _add_filter_arguments(parser):
+    parser.add_argument('--date', help="only expenses on YYYY-MM-DD")
+    parser.add_argument('--month', help="only expenses in YYYY-MM")
+    parser.add_argument('--start-date', help="only expenses on or after YYYY-MM-DD")
+    parser.add_argument('--end-date', help="only expenses on or before YYYY-MM-DD")
+    parser.add_argument('--category', help="only expenses in this category")
+    parser.add_argument('--min-amount', type=float, help="only expenses of at least this amount")
+    parser.add_argument('--max-amount', type=float, help="only expenses of at most this amount")
+    parser.add_argument('--keyword', help="only expenses whose description contains this")
+
+def _filters(options):
+    from expense_query import FILTER_NAMES
+    return {name: value for name, value in vars(options).items()
+            if name in FILTER_NAMES and value is not None}
+
+def _open_tracker():
+    from expense_storage import default_storage
+    return ExpenseTracker(storage=default_storage())
+
+def run_add(args):
+    """Handle `expense_tracker.py add`"""
+    import argparse
+    import expense_import
+    parser = argparse.ArgumentParser(prog="expense_tracker.py add",
+                                     description="Add one expense, or many read from stdin; prints them with their ids")
+    parser.add_argument('--amount', help="amount of the expense")
+    parser.add_argument('--category', default='Other', help="category (unknown ones become Other)")
+    parser.add_argument('--description', default='', help="description")
+    parser.add_argument('--date', help="YYYY-MM-DD (default: today)")
+    parser.add_argument('--stdin', action='store_true', help="read expenses from stdin instead")
+    parser.add_argument('--input-format', choices=['jsonl', 'csv'], default='jsonl', help="format of stdin")
+    parser.add_argument('--batch-size', type=int, default=10000, help="rows per commit when reading stdin")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='jsonl', help="output format")
+    options = parser.parse_args(args)
+    if options.stdin == (options.amount is not None):
+        parser.error("give either --amount or --stdin")
+    
+    with scripted_output() as out:
+        tracker = _open_tracker()
+        output = RecordOutput(out, options.format, tracker.display_expenses)
+        try:
+            if options.stdin:
+                result = expense_import.import_stream(tracker, sys.stdin, options.input_format,
+                                                      options.batch_size, on_batch=output.write)
+            else:
+                row = {'date': options.date or datetime.now().strftime("%Y-%m-%d"), 'amount': options.amount,
+                       'category': options.category, 'description': options.description}
+                result = expense_import.ImportResult()
+                expenses = expense_import.validate_batch([(1, row)], tracker.categories, result)
+                for alert in tracker.record_expenses(expenses):
+                    print(alert_message(alert), file=sys.stderr)
+                output.write(expenses)
+        finally:
+            tracker.close()
+        output.close()
+    for error in result.errors:
+        print(f"rejected {error}", file=sys.stderr)
+    return 1 if result.rejected else 0
+
+def run_list(args):
+    """Handle `expense_tracker.py list`"""
+    import argparse
+    from expense_query import ORDER_KEYS
+    parser = argparse.ArgumentParser(prog="expense_tracker.py list",
+                                     description="List the expenses matching some filters")
+    _add_filter_arguments(parser)
+    parser.add_argument('--order', choices=ORDER_KEYS[1:], help="sort by id, date or amount (default: id)")
+    parser.add_argument('--desc', action='store_true', help="sort in descending order")
+    parser.add_argument('--limit', type=int, help="at most this many expenses")
+    parser.add_argument('--count', action='store_true', help="print only how many expenses match")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='jsonl', help="output format")
+    options = parser.parse_args(args)
+    
+    with scripted_output() as out:
+        tracker = _open_tracker()
+        try:
+            query = tracker.query().where(**_filters(options))
+            if options.order or options.desc:
+                query = query.order_by(('-' if options.desc else '') + (options.order or 'id'))
+            if options.limit is not None:
+                query = query.limit(options.limit)
+            if options.count:
+                out.write(f"{query.count()}\n")
+                return 0
+            output = RecordOutput(out, options.format, tracker.display_expenses)
+            output.write(query)
+            output.close()
+        finally:
+            tracker.close()
+    return 0
+
+def run_search(args):
+    """Handle `expense_tracker.py search QUERY`"""
+    import argparse
+    parser = argparse.ArgumentParser(prog="expense_tracker.py search",
+                                     description="Full-text search over descriptions, best matches first")
+    parser.add_argument('query', help="words that must all appear in the description")
+    parser.add_argument('--mode', choices=['substring', 'prefix'], default='substring',
+                        help="match words anywhere, or only at the start of words")
+    _add_filter_arguments(parser)
+    parser.add_argument('--limit', type=int, help="at most this many expenses")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='jsonl', help="output format")
+    options = parser.parse_args(args)
+    
+    with scripted_output() as out:
+        tracker = _open_tracker()
+        try:
+            query = tracker.query().where(**_filters(options)).text(options.query, options.mode)
+            if options.limit is not None:
+                query = query.limit(options.limit)
+            output = RecordOutput(out, options.format, tracker.display_expenses)
+            output.write(query)
+            output.close()
+        finally:
+            tracker.close()
+    return 0
+
+def run_report(args):
+    """Handle `expense_tracker.py report YYYY-MM`"""
+    import argparse
+    parser = argparse.ArgumentParser(prog="expense_tracker.py report",
+                                     description="One month's totals, category breakdown and top spending days")
+    parser.add_argument('month', help="YYYY-MM")
+    parser.add_argument('--top', type=int, default=5, help="how many top spending days")
+    parser.add_argument('--csv', action='store_true', help="also write the expense_report_YYYY-MM.csv file")
+    parser.add_argument('--format', choices=['json', 'text'], default='json', help="output format")
+    options = parser.parse_args(args)
+    try:
+        month = datetime.strptime(options.month, "%Y-%m").strftime("%Y-%m")
+    except ValueError:
+        parser.error("the month must be YYYY-MM")
+    
+    with scripted_output() as out:
+        tracker = _open_tracker()
+        try:
+            report = tracker.monthly_report(month, options.top)
+            if options.csv and report['count']:
+                tracker.export_report(tracker.query().month(month), month, report['total'],
+                                      report['category_totals'], report['count'])
+        finally:
+            tracker.close()
+        if options.format == 'json':
+            write_json(out, report)
+        elif report['count']:
+            with redirect_stdout(out):
+                tracker.display_report(report)
+        else:
+            out.write(f"No expenses found for {month}\n")
+    return 0
+
+def run_stats(args):
+    """Handle `expense_tracker.py stats`"""
+    import argparse
+    parser = argparse.ArgumentParser(prog="expense_tracker.py stats",
+                                     description="Totals, amount percentiles, frequent descriptions and top days")
+    parser.add_argument('--top', type=int, default=5, help="how many frequent descriptions and top days")
+    parser.add_argument('--format', choices=['json', 'text'], default='json', help="output format")
+    options = parser.parse_args(args)
+    
+    with scripted_output() as out:
+        tracker = _open_tracker()
+        try:
+            if options.format == 'text':
+                with redirect_stdout(out):
+                    tracker.show_statistics()
+                return 0
+            record = summary_record(tracker.summarize())
+            record.update(statistics_record(tracker.statistics(options.top)))
+        finally:
+            tracker.close()
+        write_json(out, record)
+    return 0
+
+def _percent(ratio):
+    return f"{ratio * 100:+.1f}%" if ratio is not None else "-"
+
+def print_trends(trends):
+    """Print a trends() result"""
+    scope = f" ({trends['category']})" if trends['category'] else ""
+    print(f"\n=== Trends to {trends['end']}{scope} ===")
+    latest = trends['latest']
+    print(f"Last 7 days: ${latest['sum_7d']:.2f}   Last 30 days: ${latest['sum_30d']:.2f}   "
+          f"Last 90 days: ${latest['sum_90d']:.2f}")
+    
+    months = trends['months']
+    print(f"\n{'Month':<9} {'Total':>12} {'vs prev month':>14} {'vs prev year':>13}")
+    for month, total, mom, yoy in zip(months['month'], months['total'], months['mom_pct'], months['yoy_pct']):
+        print(f"{month:<9} {total:>12.2f} {_percent(mom):>14} {_percent(yoy):>13}")
+    
+    last_month = months['month'][-1]
+    print(f"\nCategories in {last_month}:")
+    for category, values in sorted(trends['categories'].items(), key=lambda item: -item[1]['total'][-1]):
+        print(f"  {category:<15} ${values['total'][-1]:>10.2f}  {_percent(values['mom_pct'][-1]):>8} vs prev month"
+              f"  {_percent(values['yoy_pct'][-1]):>8} vs prev year")
+    
+    weekdays = trends['weekdays']
+    print("\nSpending by weekday (1.00 = an average day):")
+    for weekday, average, index in zip(weekdays['weekday'], weekdays['average'], weekdays['index']):
+        print(f"  {weekday:<10} ${average:>9.2f}/day  {index:.2f}")
+
+def run_trends(args):
+    """Handle `expense_tracker.py trends`"""
+    import argparse
+    parser = argparse.ArgumentParser(prog="expense_tracker.py trends",
+                                     description="Rolling sums, month-over-month and year-over-year changes "
+                                                 "and weekday seasonality")
+    parser.add_argument('--months', type=int, default=12, help="how many months to compare")
+    parser.add_argument('--category', help="only expenses in this category")
+    parser.add_argument('--end', help="last day, YYYY-MM-DD (default: the last day with expenses)")
+    parser.add_argument('--days', type=int, default=365, help="days of rolling sums in the JSON output")
+    parser.add_argument('--format', choices=['json', 'text'], default='json', help="output format")
+    options = parser.parse_args(args)
+    if options.end is not None:
+        try:
+            options.end = datetime.strptime(options.end, "%Y-%m-%d").strftime("%Y-%m-%d")
+        except ValueError:
+            parser.error("--end must be YYYY-MM-DD")
+    if options.months < 1:
+        parser.error("--months must be at least 1")
+    
+    with scripted_output() as out:
+        tracker = _open_tracker()
+        try:
+            trends = tracker.trends(options.months, options.category, options.end, options.days)
+        finally:
+            tracker.close()
+        if options.format == 'json':
+            write_json(out, trends)
+        else:
+            with redirect_stdout(out):
+                print_trends(trends)
+    return 0
+
+def print_budgets(statuses, month):
+    """Print budget_status() as a table"""
+    print(f"\n=== Budgets for {month} ===")
+    if not statuses:
+        print("No budgets set. Add one with: expense_tracker.py budgets set CATEGORY AMOUNT")
+        return
+    print(f"{'Category':<15} {'Spent':>12} {'Limit':>12} {'Left':>12} {'Used':>6}")
+    for status in statuses:
+        flag = {'warning': "  ⚠️", 'exceeded': "  ❌"}.get(status['level'], "")
+        print(f"{status['category']:<15} {status['spent']:>12.2f} {status['limit']:>12.2f} "
+              f"{status['remaining']:>12.2f} {status['ratio'] * 100:>5.0f}%{flag}")
+
+def run_budgets(args):
+    """Handle `expense_tracker.py budgets [set|remove]`"""
+    import argparse
+    parser = argparse.ArgumentParser(prog="expense_tracker.py budgets",
+                                     description="Show spending against the monthly budgets, or set and remove them")
+    parser.add_argument('action', nargs='?', choices=['show', 'set', 'remove'], default='show')
+    parser.add_argument('category', nargs='?', help="category to set or remove")
+    parser.add_argument('amount', nargs='?', type=float, help="monthly limit to set")
+    parser.add_argument('--month', help="YYYY-MM: only this month (default: show this month, set every month)")
+    parser.add_argument('--format', choices=['json', 'text'], default='json', help="output format of show")
+    options = parser.parse_args(args)
+    if options.month is not None:
+        try:
+            datetime.strptime(options.month, "%Y-%m")
+        except ValueError:
+            parser.error("--month must be YYYY-MM")
+    if options.action != 'show' and options.category is None:
+        parser.error(f"{options.action} needs a category")
+    if options.action == 'set' and (options.amount is None or options.amount <= 0):
+        parser.error("set needs a positive amount")
+    
+    with scripted_output() as out:
+        tracker = _open_tracker()
+        try:
+            if options.action == 'show':
+                month = options.month or datetime.now().strftime("%Y-%m")
+                statuses = tracker.budget_status(month)
+            else:
+                if options.category not in tracker.categories:
+                    print(f"Unknown category: {options.category} (one of {', '.join(tracker.categories)})")
+                    return 2
+                tracker.set_budget(options.category, options.amount if options.action == 'set' else None,
+                                   options.month)
+                scope = f"in {options.month}" if options.month else "every month"
+                if options.action == 'set':
+                    print(f"✓ {options.category} budget set to {options.amount:.2f} {scope}")
+                else:
+                    print(f"✓ {options.category} budget removed {scope}")
+                return 0
+        finally:
+            tracker.close()
+        if options.format == 'json':
+            write_json(out, statuses)
+        else:
+            with redirect_stdout(out):
+                print_budgets(statuses, month)
+    return 0
 
-def main():
-    """Main function to run the expense tracker"""
-    tracker = ExpenseTracker()
+def run_import(args):
+    """Handle `expense_tracker.py import FILE`"""
+    import argparse
+    import expense_import
+    parser = argparse.ArgumentParser(prog="expense_tracker.py import",
+                                     description="Bulk-import expenses from CSV or JSON lines")
+    parser.add_argument('file', help="CSV (date,amount,category,description) or JSON-lines file; - for stdin")
+    parser.add_argument('--format', choices=['csv', 'jsonl'],
+                        help="override format detection (stdin defaults to jsonl)")
+    parser.add_argument('--batch-size', type=int, default=10000, help="rows per commit")
+    parser.add_argument('--json', action='store_true', help="print the result as JSON")
+    options = parser.parse_args(args)
+    
+    with scripted_output() as out:
+        tracker = _open_tracker()
+        try:
+            if options.file == '-':
+                result = expense_import.import_stream(tracker, sys.stdin, options.format or 'jsonl',
+                                                      options.batch_size)
+            else:
+                result = tracker.import_file(options.file, format=options.format, batch_size=options.batch_size)
+        finally:
+            tracker.close()
+        if options.json:
+            write_json(out, {'imported': result.imported, 'rejected': result.rejected,
+                             'errors': result.errors, 'seconds': result.seconds})
+        else:
+            out.write(f"{result}\n")
+            for error in result.errors:
+                out.write(f"  rejected {error}\n")
+    return 1 if result.rejected else 0
+
+def run_export(args):
+    """Handle `expense_tracker.py export FILE`"""
+    import argparse
+    import expense_export
+    parser = argparse.ArgumentParser(prog="expense_tracker.py export",
+                                     description="Stream expenses to CSV, JSON lines or Parquet")
+    parser.add_argument('file', help="output file (.csv, .jsonl or .parquet); - for stdout")
+    parser.add_argument('--format', choices=['csv', 'jsonl', 'parquet'],
+                        help="override format detection (stdout defaults to csv)")
+    parser.add_argument('--chunk-size', type=int, default=10000, help="records written per chunk")
+    _add_filter_arguments(parser)
+    options = parser.parse_args(args)
+    format = options.format or ('csv' if options.file == '-' else None)
+    if options.file == '-' and format == 'parquet':
+        parser.error("Parquet cannot be written to stdout; give a file name")
+    
+    filters = _filters(options)
+    with scripted_output() as out:
+        tracker = _open_tracker()
+        try:
+            if options.file == '-':
+                records = tracker.iter_expenses(**filters)
+                if format == 'csv':
+                    chunks = expense_export.csv_chunks(records, options.chunk_size)
+                else:
+                    chunks = expense_export.jsonl_chunks(records, options.chunk_size)
+                for text in chunks:
+                    out.write(text)
+                out.flush()
+            else:
+                count = tracker.export_expenses(options.file, format=format,
+                                                chunk_size=options.chunk_size, **filters)
+                print(f"✓ Exported {count} expenses to {options.file}")
+        finally:
+            tracker.close()
+    return 0
+
+def run_reports(args):
+    """Handle `expense_tracker.py reports`"""
+    import argparse
+    import expense_reports
+    parser = argparse.ArgumentParser(prog="expense_tracker.py reports",
+                                     description="Write the monthly reports of many months in parallel")
+    parser.add_argument('--year', help="every month of this year (default: every month with expenses)")
+    parser.add_argument('--months', help="comma-separated YYYY-MM months instead")
+    parser.add_argument('--output-dir', default='.', help="where the CSV reports are written")
+    parser.add_argument('--workers', type=int, help="parallel workers (default: one per core)")
+    parser.add_argument('--executor', choices=list(expense_reports.EXECUTORS), default='process',
+                        help="run months in processes, threads, or one after another")
+    parser.add_argument('--no-export', action='store_true', help="print the summaries only")
+    parser.add_argument('--format', choices=['table', 'json', 'csv'], default='table',
+                        help="output format of the summaries")
+    options = parser.parse_args(args)
+    
+    months = None
+    if options.months:
+        try:
+            months = [datetime.strptime(month.strip(), "%Y-%m").strftime("%Y-%m")
+                      for month in options.months.split(',')]
+        except ValueError:
+            parser.error("--months must be comma-separated YYYY-MM months")
+    
+    with scripted_output() as out:
+        tracker = _open_tracker()
+        try:
+            reports = tracker.generate_reports(months, options.year, options.output_dir, options.workers,
+                                               options.executor, export=not options.no_export)
+        finally:
+            tracker.close()
+        if options.format == 'json':
+            write_json(out, reports)
+        elif options.format == 'csv':
+            import csv
+            writer = csv.writer(out, lineterminator="\n")
+            writer.writerow(['month', 'count', 'total', 'average', 'top_category', 'top_day', 'file'])
+            for report in reports:
+                writer.writerow([report['month'], report['count'], report['total'], report['average'],
+                                 next(iter(report['category_totals']), ''),
+                                 report['top_days'][0][0] if report['top_days'] else '', report['file'] or ''])
+            out.flush()
+        else:
+            with redirect_stdout(out):
+                print(f"{'Month':<9} {'Count':>7} {'Total':>14}  {'Top category':<16} {'Top day':<12} File")
+                for report in reports:
+                    top_category = next(iter(report['category_totals']), '-')
+                    top_day = report['top_days'][0][0] if report['top_days'] else '-'
+                    print(f"{report['month']:<9} {report['count']:>7} {report['total']:>14.2f}  "
+                          f"{top_category:<16} {top_day:<12} {report['file'] or '-'}")
+    print(f"✓ {len(reports)} monthly reports", file=sys.stderr)
+    return 0
+
+def run_serve(args):
+    """Handle `expense_tracker.py serve`"""
+    import argparse
+    from expense_storage import open_storage, storage_config
+    import expense_server
+    parser = argparse.ArgumentParser(prog="expense_tracker.py serve",
+                                     description="Serve the expenses over a local HTTP/JSON API")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on")
+    parser.add_argument('--port', type=int, default=8080, help="port to listen on")
+    parser.add_argument('--workers', type=int, default=8, help="threads running tracker calls")
+    options = parser.parse_args(args)
+    
+    # One tracker for every request; SQLite gets a read connection per worker
+    tracker = ExpenseTracker(storage=open_storage(*storage_config(), pool_reads=True))
+    try:
+        expense_server.serve(tracker, options.host, options.port, options.workers)
+    finally:
+        tracker.close()
+
+
+def run_interactive(args=None):
+    """The menu-driven mode"""
+    tracker = _open_tracker()
     
     while True:
         print("\n" + "="*50)
@@ -354,6 +1311,7 @@ def main():
                 tracker.show_statistics()
             elif choice == '8':
                 print("Thank you for using Expense Tracker! Goodbye!")
+                tracker.close()
                 break
             else:
                 print("Invalid choice. Please enter a number between 1-8.")
@@ -363,5 +1321,39 @@ def main():
         
         input("\nPress Enter to continue...")
 
+COMMANDS = {
+    'add': run_add,
+    'list': run_list,
+    'search': run_search,
+    'report': run_report,
+    'stats': run_stats,
+    'trends': run_trends,
+    'budgets': run_budgets,
+    'export': run_export,
+    'import': run_import,
+    'reports': run_reports,
+    'serve': run_serve,
+    'interactive': run_interactive,
+}
+
+def main(args=None):
+    """Run a command, or the interactive menu when there is none"""
+    args = sys.argv[1:] if args is None else args
+    if not args:
+        return run_interactive()
+    try:
+        if args[0] in ('-h', '--help', 'help'):
+            print(USAGE)
+            return 0
+        command = COMMANDS.get(args[0])
+        if command is None:
+            print(f"Unknown command: {args[0]}\n\n{USAGE}", file=sys.stderr)
+            return 2
+        return command(args[1:])
+    except BrokenPipeError:
+        # The reader went away (e.g. `list | head`); stop quietly
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,136 @@
+import itertools
+import queue
+import threading
+
+from expense_metrics import metrics
+
+# Failures (and notices) kept per ticket before the oldest are forgotten
+MAX_FAILURES = 1000
+
+
+class WriterBusy(RuntimeError):
+    """The write queue stayed full for longer than the submit timeout"""
+
+
+class BackgroundWriter:
+    """Persist expenses on a background thread so callers never wait for the disk
+
+    submit() queues an expense and returns a ticket at once. A single
+    writer thread drains the queue and commits whatever has piled up as
+    one batch through commit(expenses). status(ticket) is 'pending' until
+    then, and 'saved' or the exception raised by the commit afterwards.
+    The queue holds at most `max_pending` expenses, so a stalled disk
+    pushes back on submit() instead of growing memory without bound.
+    close() writes everything still queued before the thread exits.
+    commit() may return notices (e.g. budget alerts), dicts naming the
+    'expense_id' they are about; notices(ticket) hands back those of a
+    saved ticket.
+    """
+
+    def __init__(self, commit, max_pending=1000, max_batch=100):
+        self.commit = commit
+        self.max_batch = max_batch
+        self.pending = 0
+        self.failures = {}
+        self._notices = {}
+        self.batches = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._tickets = itertools.count(1)
+        # Tickets are committed in order, so every ticket up to this one is done
+        self._done = 0
+        self._closed = False
+        self._state = threading.Condition()
+        self._submit_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='expense-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, expense, timeout=5):
+        """Queue one expense for saving; returns its ticket"""
+        # Tickets enter the queue in the order they are handed out
+        with self._submit_lock:
+            with self._state:
+                if self._closed:
+                    raise RuntimeError("The background writer is closed")
+                ticket = next(self._tickets)
+                self.pending += 1
+            try:
+                self._queue.put((ticket, expense), timeout=timeout)
+            except queue.Full:
+                with self._state:
+                    self.pending -= 1
+                raise WriterBusy(f"{self._queue.maxsize} saves are already waiting for the disk") from None
+        metrics.count('writer.submitted')
+        return ticket
+
+    def status(self, ticket):
+        """'pending', 'saved', or the exception that made the save fail"""
+        with self._state:
+            if ticket > self._done:
+                return 'pending'
+            return self.failures.get(ticket, 'saved')
+
+    def notices(self, ticket):
+        """The notices commit() returned for a saved ticket's expense; each is handed out once"""
+        with self._state:
+            return self._notices.pop(ticket, [])
+
+    def flush(self, timeout=None):
+        """Wait until every queued expense is written; returns False on timeout"""
+        with self._state:
+            return self._state.wait_for(lambda: self.pending == 0, timeout)
+
+    def close(self, timeout=None):
+        """Write everything still queued, then stop the thread"""
+        with self._state:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch and batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+            if batch:
+                self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch):
+        tickets = [ticket for ticket, _ in batch]
+        error = None
+        notices = {}
+        try:
+            with metrics.timer('writer.commit'):
+                result = self.commit([expense for _, expense in batch])
+            for notice in result or ():
+                notices.setdefault(notice.get('expense_id'), []).append(notice)
+        except Exception as e:
+            if len(batch) > 1:
+                # One by one, so a single bad expense does not fail the others
+                for item in batch:
+                    self._write([item])
+                return
+            error = e
+            metrics.count('writer.failed')
+        with self._state:
+            if error is not None:
+                self.failures.update((ticket, error) for ticket in tickets)
+                while len(self.failures) > MAX_FAILURES:
+                    del self.failures[next(iter(self.failures))]
+            self._notices.update((ticket, notices[expense.get('id')]) for ticket, expense in batch
+                                 if expense.get('id') in notices)
+            while len(self._notices) > MAX_FAILURES:
+                del self._notices[next(iter(self._notices))]
+            self._done = tickets[-1]
+            self.pending -= len(batch)
+            self.batches += 1
+            self._state.notify_all()
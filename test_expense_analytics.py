@@ -0,0 +1,23 @@
+import numpy as np
+
+from expense_analytics import trends
+from expense_bench import synthetic_expenses
+from expense_rollups import Rollups
+from expense_store import ExpenseStore
+
+
+def test_trends_from_rollups_match_the_records():
+    store = ExpenseStore(synthetic_expenses(20000))
+    rollups = Rollups()
+    rollups.rebuild(store)
+    day_totals = {day: bucket[1] for day, bucket in rollups.daily.items()}
+    month_categories = {month: {category: bucket[1] for category, bucket in totals.items()}
+                        for month, totals in rollups.categories.items()}
+    result = trends(day_totals, month_categories, months=24)
+
+    scanned = [store.summarize(store.positions(month=month))['total'] for month in result['months']['month']]
+    assert np.allclose(scanned, result['months']['total'])
+
+    end = store.date_ordinal(result['end'])
+    recent = (store.dates > end - 30) & (store.dates <= end)
+    assert np.isclose(result['latest']['sum_30d'], store.amounts[recent].sum())
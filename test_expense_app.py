@@ -0,0 +1,65 @@
+import builtins
+import os
+import shutil
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from expense_storage import open_storage
+from expense_tracker import ExpenseTracker
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'expense_app.py')
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'expenses.json')
+
+
+@pytest.fixture
+def data_opens(tmp_path, monkeypatch):
+    """Run in a copy of the sample data; returns the list of data files opened for reading so far"""
+    shutil.copy(DATA, tmp_path / 'expenses.json')
+    monkeypatch.chdir(tmp_path)
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    opened = []
+    real_open = builtins.open
+
+    def counting_open(file, mode='r', *args, **kwargs):
+        if 'r' in mode and os.path.basename(str(file)).startswith('expenses.json'):
+            opened.append(file)
+        return real_open(file, mode, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, 'open', counting_open)
+    yield opened
+    st.cache_resource.clear()
+    st.cache_data.clear()
+
+
+@pytest.mark.parametrize('backend', ['journal', 'json'])
+def test_reruns_on_unchanged_data_read_no_files(data_opens, monkeypatch, backend):
+    monkeypatch.setenv('EXPENSE_STORAGE', backend)
+    app = AppTest.from_file(APP, default_timeout=30).run()
+    assert not app.exception
+    assert data_opens, "the first run should load the data"
+
+    before = len(data_opens)
+    for page in app.sidebar.selectbox[0].options:
+        app.sidebar.selectbox[0].select(page).run()
+        assert not app.exception, (page, app.exception)
+    app.run()
+    assert data_opens[before:] == []
+
+
+def test_rerun_reloads_after_another_writer(data_opens, monkeypatch):
+    monkeypatch.setenv('EXPENSE_STORAGE', 'journal')
+    app = AppTest.from_file(APP, default_timeout=30).run()
+    assert app.metric[1].value == '3'
+
+    other = ExpenseTracker(storage=open_storage('expenses.json', 'journal'))
+    other.record_expense({'id': None, 'date': '2025-11-26', 'amount': 10.0,
+                          'category': 'Food', 'description': 'Tea'})
+    other.close()
+
+    before = len(data_opens)
+    app.run()
+    assert data_opens[before:], "a rerun after an outside write should reload"
+    assert app.metric[1].value == '4'
@@ -0,0 +1,28 @@
+from collections import Counter
+
+import numpy as np
+
+from expense_bench import synthetic_expenses
+from expense_sketches import Sketches
+from expense_store import ExpenseStore
+
+
+def test_sketch_statistics_stay_within_their_error_bounds():
+    store = ExpenseStore(synthetic_expenses(50000))
+    sketches = Sketches()
+    sketches.rebuild(store)
+    stats = sketches.statistics()
+
+    amounts = np.sort(store.amounts)
+    for q, value in stats['percentiles'].items():
+        rank = np.searchsorted(amounts, value) / len(amounts)
+        assert abs(rank - q) <= stats['rank_error'], q
+
+    exact = Counter(store.descriptions)
+    for row in stats['top_descriptions']:
+        assert row['at_least'] <= exact[row['description']] <= row['count']
+        assert row['count'] - exact[row['description']] <= stats['description_count_error']
+
+    for code, category in enumerate(store.category_names):
+        distinct = len({store.descriptions[p] for p in np.flatnonzero(store.categories == code)})
+        assert abs(stats['distinct_descriptions'][category] - distinct) <= 3 * stats['distinct_error'] * distinct
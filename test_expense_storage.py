@@ -0,0 +1,112 @@
+import multiprocessing
+
+import pytest
+
+from expense_storage import JournalStorage, PartitionedStorage, open_storage
+from expense_tracker import ExpenseTracker
+
+WRITERS = 4
+WRITES = 25
+
+
+def _partitioned_tracker(tmp_path):
+    tracker = ExpenseTracker(storage=PartitionedStorage(str(tmp_path / 'expenses.json')))
+    tracker.record_expenses([
+        {'id': None, 'date': '2024-01-05', 'amount': 4.5, 'category': 'Food', 'description': 'coffee'},
+        {'id': None, 'date': '2024-01-20', 'amount': 30.0, 'category': 'Shopping', 'description': 'shoes'},
+        {'id': None, 'date': '2024-02-03', 'amount': 12.0, 'category': 'Food', 'description': 'lunch'},
+        {'id': None, 'date': '2024-03-09', 'amount': 60.0, 'category': 'Utilities', 'description': 'power'},
+    ])
+    return tracker
+
+
+def test_partitioned_find_skips_trailing_partitions_without_matches(tmp_path):
+    tracker = _partitioned_tracker(tmp_path)
+    try:
+        storage = tracker.storage
+        assert [e['description'] for e in storage.iter_find(keyword='coffee')] == ['coffee']
+        assert [e['description'] for e in storage.iter_find(order_by='-id', min_amount=25)] == ['power', 'shoes']
+        assert list(storage.iter_find(keyword='nothing')) == []
+        assert [e['id'] for e in storage.find_page(after_id=3, limit=20)] == [4]
+        assert storage.find_page(after_id=4, limit=20) == []
+        page, cursor = tracker.iter_page({'start_date': '2024-01-01', 'end_date': '2024-02-01'})
+        assert [e['description'] for e in page] == ['coffee', 'shoes'] and cursor is None
+    finally:
+        tracker.close()
+
+
+def test_json_append_failing_once_leaves_no_trace(tmp_path, monkeypatch):
+    import expense_storage
+    path = str(tmp_path / 'expenses.json')
+    tracker = ExpenseTracker(storage=expense_storage.open_storage(path, 'json'))
+    tracker.record_expenses([
+        {'id': None, 'date': '2024-01-05', 'amount': 4.5, 'category': 'Food', 'description': 'coffee'},
+        {'id': None, 'date': '2024-01-06', 'amount': 9.0, 'category': 'Food', 'description': 'lunch'},
+    ])
+    real_write = expense_storage._atomic_write_json
+
+    def full_disk(*args, **kwargs):
+        monkeypatch.setattr(expense_storage, '_atomic_write_json', real_write)
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(expense_storage, '_atomic_write_json', full_disk)
+    tea = {'id': None, 'date': '2024-01-07', 'amount': 2.0, 'category': 'Food', 'description': 'tea'}
+    with pytest.raises(OSError):
+        tracker.record_expense(tea)
+    assert tea['id'] is None
+    tracker.record_expense({'id': None, 'date': '2024-01-08', 'amount': 3.0, 'category': 'Food',
+                            'description': 'cake'})
+    tracker.close()
+
+    on_disk = expense_storage.open_storage(path, 'json').load()
+    assert [(e['id'], e['description']) for e in on_disk] == [(1, 'coffee'), (2, 'lunch'), (3, 'cake')]
+    assert list(tracker.expenses.ids) == [1, 2, 3]
+
+
+def test_in_memory_sqlite_ignores_expenses_json_in_the_working_directory(tmp_path, monkeypatch):
+    (tmp_path / 'expenses.json').write_text(
+        '[{"id": 1, "date": "2024-01-05", "amount": 4.5, "category": "Food", "description": "coffee"}]')
+    monkeypatch.chdir(tmp_path)
+    storage = open_storage(':memory:', 'sqlite')
+    try:
+        assert len(storage.load()) == 0
+    finally:
+        storage.close()
+
+
+def _writer(data_file, backend, writer, barrier):
+    """Add WRITES expenses from one process, refreshing now and then like the app"""
+    if backend == 'journal':
+        # Compact often, so snapshots are rewritten while others append
+        storage = JournalStorage(data_file, compact_every=10)
+    else:
+        storage = open_storage(data_file, backend)
+    tracker = ExpenseTracker(storage=storage)
+    barrier.wait()
+    for i in range(WRITES):
+        tracker.record_expense({'id': None, 'date': '2024-06-15', 'amount': 1.0 + writer,
+                                'category': 'Food', 'description': f"writer {writer} expense {i}"})
+        if i % 5 == 0:
+            tracker.refresh()
+    tracker.close()
+
+
+@pytest.mark.parametrize('backend', ['journal', 'json', 'partitioned', 'sqlite'])
+def test_concurrent_writer_processes_lose_nothing(tmp_path, backend):
+    data_file = str(tmp_path / ('expenses.db' if backend == 'sqlite' else 'expenses.json'))
+    context = multiprocessing.get_context()
+    barrier = context.Barrier(WRITERS)
+    processes = [context.Process(target=_writer, args=(data_file, backend, writer, barrier))
+                 for writer in range(WRITERS)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+    assert [process.exitcode for process in processes] == [0] * WRITERS
+
+    tracker = ExpenseTracker(storage=open_storage(data_file, backend))
+    stored = list(tracker.iter_expenses())
+    tracker.close()
+    assert sorted(expense['id'] for expense in stored) == list(range(1, WRITERS * WRITES + 1))
+    assert {expense['description'] for expense in stored} == {
+        f"writer {writer} expense {i}" for writer in range(WRITERS) for i in range(WRITES)}
@@ -0,0 +1,27 @@
+import json
+
+import pytest
+
+from expense_tracker import main
+
+
+@pytest.fixture
+def data_file(tmp_path, monkeypatch):
+    path = tmp_path / 'expenses.json'
+    monkeypatch.setenv('EXPENSE_STORAGE', 'journal')
+    monkeypatch.setenv('EXPENSE_DATA_FILE', str(path))
+    return path
+
+
+def test_import_exit_status_reports_rejected_rows(data_file, tmp_path, capsys):
+    good = tmp_path / 'good.csv'
+    good.write_text("date,amount,category,description\n2024-01-05,4.50,Food,coffee\n")
+    assert main(['import', str(good), '--json']) == 0
+    assert json.loads(capsys.readouterr().out)['imported'] == 1
+
+    mixed = tmp_path / 'mixed.csv'
+    mixed.write_text("date,amount,category,description\n2024-01-06,9.00,Food,lunch\n"
+                     "2024-13-40,2.00,Food,tea\n2024-01-07,not a number,Food,cake\n")
+    assert main(['import', str(mixed), '--json']) == 1
+    result = json.loads(capsys.readouterr().out)
+    assert (result['imported'], result['rejected']) == (1, 2)